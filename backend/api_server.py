@@ -8,11 +8,15 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from flask import Flask, jsonify, request, Response
 from flask_cors import CORS
 from dotenv import load_dotenv, set_key, dotenv_values
-import subprocess
 import time
 import threading
-from backend.email_server.email_fetcher import EmailFetcher
+import hashlib
+from collections import OrderedDict
+from backend.email_server.imap_pool import IMAPConnectionPool
 from backend.email_searcher import EmailSearcher
+from backend.sync_jobs import SyncJobManager, EventBroker
+from backend.email_server.mailbox_watcher import MailboxWatcher
+from backend.update_emails import update_emails_from_server
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -43,48 +47,175 @@ def serve(path):
 
 
 from backend.data_storage.email_data_manager import EmailDataManager
+from backend.data_storage.connection_manager import ConnectionManager
+from backend.data_storage.json_splice import dumps_row, dumps_rows
+
+# 注意：本模块在导入时只创建不涉及 I/O 的对象。同步时解析子进程以 spawn 方式启动，
+# 会把入口脚本重新导入为 __mp_main__，数据库初始化、后台监听等启动工作统一放在 create_app() 中
+
+@app.teardown_request
+def release_db_connection(exc):
+    """请求结束后将当前线程的数据库连接归还给连接管理器。"""
+    ConnectionManager.get().release()
+
+# 列表接口序列化结果的内存缓存，键为 (接口, 邮箱, 变更版本号, 查询参数)
+LIST_PAYLOAD_CACHE_SIZE = int(os.getenv("LIST_PAYLOAD_CACHE_SIZE", 64))
+_list_payload_cache = OrderedDict()
+_list_payload_cache_lock = threading.Lock()
+
+def make_list_etag(version, mailbox_filter):
+    """
+    根据数据变更版本号和当前邮箱生成ETag。
+    同一URL的内容只取决于这两者（及URL本身的查询参数）。
+    """
+    mailbox_hash = hashlib.sha1((mailbox_filter or '').encode('utf-8')).hexdigest()[:8]
+    return f"v{version}-{mailbox_hash}"
+
+def get_cached_payload(key, build_payload):
+    """
+    返回缓存的序列化结果，未命中时调用 build_payload 生成并缓存。
+    版本号变化后旧条目不会再被命中，按最近最少使用淘汰。
+    """
+    with _list_payload_cache_lock:
+        body = _list_payload_cache.get(key)
+        if body is not None:
+            _list_payload_cache.move_to_end(key)
+            return body
+
+    body = build_payload().encode('utf-8')
+    with _list_payload_cache_lock:
+        _list_payload_cache[key] = body
+        while len(_list_payload_cache) > LIST_PAYLOAD_CACHE_SIZE:
+            _list_payload_cache.popitem(last=False)
+    return body
+
+def conditional_list_response(endpoint, mailbox_filter, params, version, build_payload):
+    """
+    带ETag的列表响应：客户端的 If-None-Match 与当前版本一致时直接返回304，
+    不查询 emails 表；否则返回（可能来自内存缓存的）JSON。
+
+    Args:
+        endpoint (str): 接口名称，用于区分缓存。
+        mailbox_filter (str): 当前邮箱。
+        params (tuple): 影响结果的查询参数。
+        version (int | None): 数据变更版本号，None 表示读取失败，此时不使用缓存。
+        build_payload (callable): 生成响应JSON文本的无参函数。
+    """
+    if version is None:
+        return Response(build_payload(), mimetype='application/json')
+
+    etag = make_list_etag(version, mailbox_filter)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        body = get_cached_payload((endpoint, mailbox_filter, version) + tuple(params), build_payload)
+        response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    # 允许浏览器缓存，但每次使用前都必须用ETag重新验证
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/api/emails', methods=['GET'])
 def get_emails():
-    """获取所有邮件数据的API端点。"""
+    """
+    分页获取邮件列表的API端点。
+
+    只返回列表所需的轻量字段（id、主题、发件人、日期、状态、紧急程度等），
+    正文和分析结果请通过 /api/emails/<id> 获取。
+    响应带有基于数据变更版本号的ETag，支持 If-None-Match 条件请求。
+
+    查询参数:
+        limit: 每页数量，默认50，最大500。
+        cursor: 上一页返回的 next_cursor。
+        include_analysis: 为 true 时附带每封邮件的 analysis_json（直接拼接存储的JSON文本）。
+    """
     try:
-        load_dotenv(override=True)
         mailbox_filter = os.getenv("MAILBOX")
-        
+        limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+        cursor = request.args.get('cursor') or None
+        include_analysis = request.args.get('include_analysis', '').lower() in ('1', 'true', 'yes')
+        if cursor:
+            EmailDataManager.parse_cursor(cursor)
+    except ValueError:
+        return jsonify({"error": "无效的分页参数"}), 400
+
+    try:
         manager = EmailDataManager()
-        emails_list = manager.get_all_emails(mailbox_filter=mailbox_filter)
-        manager.close()
 
-        # JSON 解析应在 DataManager 内部处理，但为保持兼容性，暂时保留
-        for email in emails_list:
-            if isinstance(email.get('analysis_json'), str):
-                try:
-                    email['analysis_json'] = json.loads(email['analysis_json'])
-                except (json.JSONDecodeError, TypeError):
-                    email['analysis_json'] = {}
-        
-        return jsonify(emails_list)
+        version = manager.get_change_version()
+
+        def build_payload():
+            emails_list, next_cursor = manager.list_emails(
+                mailbox_filter=mailbox_filter, limit=limit, cursor=cursor, include_analysis=include_analysis
+            )
+            return ('{"emails":' + dumps_rows(emails_list) + ',"next_cursor":' + json.dumps(next_cursor)
+                    + ',"version":' + json.dumps(version) + '}')
+
+        response = conditional_list_response(
+            'emails', mailbox_filter, (limit, cursor, include_analysis), version, build_payload
+        )
+        manager.close()
+        return response
     except Exception as e:
         logging.error(f"获取邮件时发生错误: {e}", exc_info=True)
         return jsonify({"error": "服务器内部错误", "message": str(e)}), 500
 
+@app.route('/api/emails/changes', methods=['GET'])
+def get_email_changes():
+    """
+    增量获取邮件列表的变更。
+
+    查询参数:
+        since: 客户端已知的版本号（来自 /api/emails 或上一次调用返回的 version）。
+
+    返回 version（当前版本号）、changes（since 之后变更过的邮件，列表投影）和 reset。
+    reset 为 true 表示 since 早于已压缩的变更日志，客户端需要重新加载完整列表。
+    """
+    try:
+        since = int(request.args.get('since', ''))
+    except ValueError:
+        return jsonify({"error": "无效的 since 参数"}), 400
+
+    try:
+        manager = EmailDataManager()
+        result = manager.get_changes(since, mailbox_filter=os.getenv("MAILBOX"))
+        manager.close()
+        return jsonify(result), 200
+    except Exception as e:
+        logging.error(f"获取邮件变更时发生错误: {e}", exc_info=True)
+        return jsonify({"error": "服务器内部错误", "message": str(e)}), 500
+
+@app.route('/api/emails/<int:email_id>', methods=['GET'])
+def get_email_detail(email_id):
+    """获取单封邮件的完整数据（包含正文和分析结果）。"""
+    try:
+        manager = EmailDataManager()
+        email = manager.get_email_by_id(email_id)
+        manager.close()
+
+        if not email:
+            return jsonify({"error": f"未找到邮件 ID {email_id}"}), 404
+        # analysis_json 已在数据库中校验，直接拼接进响应
+        return Response(dumps_row(email), mimetype='application/json'), 200
+    except Exception as e:
+        logging.error(f"获取邮件 ID {email_id} 时发生错误: {e}", exc_info=True)
+        return jsonify({"error": "服务器内部错误", "message": str(e)}), 500
+
 @app.route('/api/search', methods=['GET'])
 def search_emails():
-    """根据查询参数搜索邮件。"""
+    """根据查询参数搜索邮件，返回与 /api/emails 相同的列表投影，同样支持ETag。"""
     query = request.args.get('query', '')
     try:
+        mailbox_filter = os.getenv("MAILBOX")
+
         searcher = EmailSearcher()
-        results = searcher.search(query)
-        
-        # 同样，确保 analysis_json 是字典
-        for email in results:
-            if isinstance(email.get('analysis_json'), str):
-                try:
-                    email['analysis_json'] = json.loads(email['analysis_json'])
-                except (json.JSONDecodeError, TypeError):
-                    email['analysis_json'] = {}
-        
-        return jsonify(results)
+        response = conditional_list_response(
+            'search', mailbox_filter, (query,), searcher.data_manager.get_change_version(),
+            lambda: dumps_rows(searcher.search(query, mailbox=mailbox_filter))
+        )
+        searcher.close()
+
+        return response
     except Exception as e:
         logging.error(f"搜索邮件时发生错误: {e}", exc_info=True)
         return jsonify({"error": "服务器内部错误", "message": str(e)}), 500
@@ -113,13 +244,7 @@ def update_email_status(email_id):
         manager.close()
         
         if updated_email:
-            # 确保 analysis_json 是一个字典
-            if isinstance(updated_email.get('analysis_json'), str):
-                try:
-                    updated_email['analysis_json'] = json.loads(updated_email['analysis_json'])
-                except json.JSONDecodeError:
-                    updated_email['analysis_json'] = {}
-            return jsonify(updated_email), 200
+            return Response(dumps_row(updated_email), mimetype='application/json'), 200
         else:
             return jsonify({"error": f"未找到邮件 ID {email_id}"}), 404
             
@@ -127,6 +252,49 @@ def update_email_status(email_id):
         logging.error(f"更新邮件 ID {email_id} 状态时发生错误: {e}", exc_info=True)
         return jsonify({"error": "服务器内部错误", "message": str(e)}), 500
 
+@app.route('/api/emails/status', methods=['PATCH'])
+def bulk_update_email_status():
+    """
+    批量更新邮件的星标或已读状态。
+
+    请求体:
+        ids: 邮件ID列表（可选）。
+        filter: 筛选条件（可选），支持 mailbox、from_ts、to_ts、urgency。
+        is_starred / is_read: 要设置的状态，至少提供一个。
+
+    ids 和 filter 至少提供一个。返回实际发生变化的邮件ID和新的数据变更版本号。
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"error": "请求体为空或不是有效的JSON"}), 400
+
+    email_ids = data.get('ids')
+    filters = data.get('filter')
+    is_starred = data.get('is_starred')
+    is_read = data.get('is_read')
+
+    if is_starred is None and is_read is None:
+        return jsonify({"error": "未提供有效的更新字段 (is_starred, is_read)"}), 400
+    if any(value is not None and not isinstance(value, bool) for value in (is_starred, is_read)):
+        return jsonify({"error": "is_starred 和 is_read 必须是布尔值"}), 400
+    if email_ids is None and not filters:
+        return jsonify({"error": "必须提供 ids 或 filter"}), 400
+    if email_ids is not None and (not isinstance(email_ids, list) or not all(isinstance(i, int) for i in email_ids)):
+        return jsonify({"error": "ids 必须是整数列表"}), 400
+    if filters is not None and not isinstance(filters, dict):
+        return jsonify({"error": "filter 必须是对象"}), 400
+
+    try:
+        manager = EmailDataManager()
+        result = manager.bulk_update_status(email_ids=email_ids, filters=filters, is_starred=is_starred, is_read=is_read)
+        manager.close()
+        return jsonify(result), 200
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"无效的筛选条件: {e}"}), 400
+    except Exception as e:
+        logging.error(f"批量更新邮件状态时发生错误: {e}", exc_info=True)
+        return jsonify({"error": "服务器内部错误", "message": str(e)}), 500
+
 @app.route('/api/emails/<int:email_id>/urgency', methods=['PUT'])
 def update_email_urgency(email_id):
     """
@@ -145,13 +313,7 @@ def update_email_urgency(email_id):
         manager.close()
         
         if updated_email:
-            # 确保 analysis_json 是一个字典
-            if isinstance(updated_email.get('analysis_json'), str):
-                try:
-                    updated_email['analysis_json'] = json.loads(updated_email['analysis_json'])
-                except json.JSONDecodeError:
-                    updated_email['analysis_json'] = {}
-            return jsonify(updated_email), 200
+            return Response(dumps_row(updated_email), mimetype='application/json'), 200
         else:
             return jsonify({"error": f"更新邮件 ID {email_id} 紧急程度时失败"}), 404
             
@@ -159,67 +321,71 @@ def update_email_urgency(email_id):
         logging.error(f"更新邮件 ID {email_id} 紧急程度时发生错误: {e}", exc_info=True)
         return jsonify({"error": "服务器内部错误", "message": str(e)}), 500
 
+# 推送给前端的全局事件流（新邮件入库、同步结束）
+event_broker = EventBroker()
+
+def forward_sync_event(event):
+    """将同步任务中的新邮件和结束事件转发到全局事件流。"""
+    if event['type'] == 'email_stored' and event.get('email'):
+        event_broker.publish({"type": "email_stored", "email": event['email']})
+    elif event['type'] == 'finished':
+        event_broker.publish({"type": "sync_finished", "status": event['status'], "result": event['result']})
+
+# 进程内的后台同步任务管理器，替代原先为每次同步启动子进程的方式
+sync_manager = SyncJobManager(update_emails_from_server, on_event=forward_sync_event)
+
+def format_sse(event):
+    """将事件格式化为 SSE 消息；None 表示心跳注释。"""
+    if event is None:
+        return ": keep-alive\n\n"
+    return f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+
 @app.route('/api/sync-emails', methods=['POST', 'GET'])
 def sync_emails():
-    """触发邮件同步和数据库整理，并以流式响应返回实时日志。"""
-    logging.info("收到同步邮件请求，开始流式传输日志。")
+    """
+    触发邮件同步，并以SSE流式返回结构化的进度事件。
+
+    已有同步任务在运行时不会重复启动，而是订阅该任务的进度。
+    每条事件为JSON对象，包含 type 字段（started、log、found、email_stored、
+    email_skipped、email_failed、cancel_requested、finished）。
+    """
+    job, created = sync_manager.start()
+    logging.info(f"收到同步邮件请求，{'启动' if created else '加入'}同步任务 {job.id}。")
 
     def generate_output():
-        """生成器函数，用于执行脚本并逐行产生输出。"""
-        try:
-            python_executable = os.path.join(os.getcwd(), '.venv', 'Scripts', 'python.exe')
-            if not os.path.exists(python_executable):
-                raise FileNotFoundError("Python 解释器未在 .venv/Scripts/python.exe 中找到。")
-
-            scripts = [
-                ("邮件更新", os.path.join(os.getcwd(), 'backend', 'update_emails.py')),
-                # ("数据库整理", os.path.join(os.getcwd(), 'backend', 'organize_database.py'))
-            ]
-
-            for name, script_path in scripts:
-                yield f"data: --- 开始执行: {name} ---\n\n"
-                logging.info(f"执行命令: {python_executable} {script_path}")
-
-                process = subprocess.Popen(
-                    [python_executable, script_path],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,  # 将 stderr 重定向到 stdout
-                    text=True,
-                    cwd=os.getcwd(),
-                    bufsize=1,
-                    universal_newlines=True
-                )
-
-                # 逐行读取输出
-                for line in process.stdout:
-                    # SSE 格式要求以 'data: ' 开头，以 '\n\n' 结尾
-                    yield f"data: {line.strip()}\n\n"
-                
-                process.wait()  # 等待子进程结束
-
-                if process.returncode != 0:
-                    error_message = f"脚本 '{name}' 执行失败，返回码: {process.returncode}。"
-                    logging.error(error_message)
-                    yield f"data: ERROR: {error_message}\n\n"
-                    # 如果一个脚本失败，则终止整个流程
-                    return
-                
-                yield f"data: --- 完成: {name} ---\n\n"
-
-            yield "data: SYNC_COMPLETE\n\n"  # 发送一个特殊信号表示全部完成
-
-        except FileNotFoundError as e:
-            error_msg = f"执行环境错误: {e}"
-            logging.error(error_msg)
-            yield f"data: ERROR: {error_msg}\n\n"
-        except Exception as e:
-            error_msg = f"同步过程中发生未知错误: {e}"
-            logging.error(error_msg, exc_info=True)
-            yield f"data: ERROR: {error_msg}\n\n"
-
-    # 返回一个流式响应
+        for event in sync_manager.subscribe(job):
+            yield format_sse(event)
+
     return Response(generate_output(), mimetype='text/event-stream')
 
+@app.route('/api/events', methods=['GET'])
+def stream_events():
+    """
+    持久的SSE事件流：每封新入库的邮件以 email_stored 事件推送（附带列表投影），
+    同步结束时推送 sync_finished 事件。
+    """
+    def generate_events():
+        for event in event_broker.subscribe():
+            yield format_sse(event)
+
+    return Response(generate_events(), mimetype='text/event-stream')
+
+@app.route('/api/sync/status', methods=['GET'])
+def get_sync_status():
+    """获取当前（或最近一次）同步任务的状态。"""
+    status = sync_manager.status()
+    if status is None:
+        return jsonify({"status": "idle"}), 200
+    return jsonify(status), 200
+
+@app.route('/api/sync/cancel', methods=['POST'])
+def cancel_sync():
+    """请求取消正在运行的同步任务。"""
+    job = sync_manager.cancel()
+    if job is None:
+        return jsonify({"error": "当前没有正在运行的同步任务"}), 409
+    return jsonify({"message": "已请求取消同步任务", "job_id": job.id}), 202
+
 @app.route('/api/settings', methods=['GET'])
 def get_settings():
     """获取 .env 文件中的设置。"""
@@ -238,19 +404,53 @@ def get_settings():
         logging.error(f"获取设置时发生错误: {e}", exc_info=True)
         return jsonify({"error": "服务器内部错误", "message": str(e)}), 500
 
+# 长期复用的IMAP连接池，供邮箱列表和其他按需获取邮件的接口共享
+imap_pool = IMAPConnectionPool(max_size=int(os.getenv("IMAP_POOL_SIZE", 2)))
+
+# 解码后的邮箱列表缓存
+MAILBOX_CACHE_TTL = int(os.getenv("MAILBOX_CACHE_TTL", 600))
+_mailbox_cache = {"value": None, "expires_at": 0.0}
+_mailbox_cache_lock = threading.Lock()
+
+def invalidate_mailbox_cache():
+    """使邮箱列表缓存失效。"""
+    with _mailbox_cache_lock:
+        _mailbox_cache["value"] = None
+        _mailbox_cache["expires_at"] = 0.0
+
+def get_cached_mailboxes(refresh=False):
+    """返回邮箱列表，缓存未过期时不访问IMAP服务器。"""
+    with _mailbox_cache_lock:
+        if not refresh and _mailbox_cache["value"] is not None and time.monotonic() < _mailbox_cache["expires_at"]:
+            return _mailbox_cache["value"]
+
+    with imap_pool.connection() as fetcher:
+        mailboxes = fetcher.list_mailboxes()
+
+    # 出错时异常向上抛出，连接池丢弃该连接，也不会写入缓存；空结果同样不缓存
+    if mailboxes:
+        with _mailbox_cache_lock:
+            _mailbox_cache["value"] = mailboxes
+            _mailbox_cache["expires_at"] = time.monotonic() + MAILBOX_CACHE_TTL
+    return mailboxes
+
 @app.route('/api/mailboxes', methods=['GET'])
 def get_mailboxes():
-    """获取邮箱列表的API端点。"""
-    fetcher = EmailFetcher()
+    """获取邮箱列表的API端点。传入 ?refresh=true 可跳过缓存。"""
+    refresh = request.args.get('refresh', '').lower() in ('1', 'true', 'yes')
     try:
-        fetcher.connect()
-        mailboxes = fetcher.list_mailboxes()
-        fetcher.logout()
+        mailboxes = get_cached_mailboxes(refresh=refresh)
         return jsonify(mailboxes), 200
     except Exception as e:
         logging.error(f"获取邮箱列表时发生错误: {e}", exc_info=True)
         return jsonify({"error": "服务器内部错误", "message": str(e)}), 500
 
+@app.route('/api/mailboxes/cache', methods=['DELETE'])
+def clear_mailbox_cache():
+    """显式清除邮箱列表缓存。"""
+    invalidate_mailbox_cache()
+    return jsonify({"message": "邮箱列表缓存已清除"}), 200
+
 @app.route('/api/settings', methods=['POST'])
 def update_settings():
     """更新 .env 文件中的设置并尝试重启后端服务。"""
@@ -274,6 +474,9 @@ def update_settings():
         
         # 强制重新加载环境变量，确保当前进程也使用最新配置
         load_dotenv(override=True)
+        # IMAP配置可能已变化，丢弃缓存的邮箱列表和空闲连接
+        invalidate_mailbox_cache()
+        imap_pool.close_all()
 
         # 尝试重启应用
         # 这种方法会替换当前进程，可能导致请求中断
@@ -295,7 +498,39 @@ def update_settings():
         logging.error(f"更新设置或重启服务器时发生错误: {e}", exc_info=True)
         return jsonify({"error": "服务器内部错误", "message": str(e)}), 500
 
+_mailbox_watcher = None
+_mailbox_watcher_lock = threading.Lock()
+
+def start_mailbox_watcher():
+    """
+    IMAP_IDLE_ENABLED=true 时启动后台邮箱监听，新邮件到达后自动执行增量同步。重复调用不会启动多个监听。
+    """
+    global _mailbox_watcher
+    if os.getenv("IMAP_IDLE_ENABLED", "false").lower() != "true":
+        logging.info("IMAP_IDLE_ENABLED 未开启，不启动邮箱监听。")
+        return None
+    with _mailbox_watcher_lock:
+        if _mailbox_watcher is None:
+            _mailbox_watcher = MailboxWatcher(on_new_mail=lambda: sync_manager.start(follow_up=True))
+            _mailbox_watcher.start()
+            logging.info("邮箱监听已启动。")
+    return _mailbox_watcher
+
+def create_app():
+    """
+    完成启动工作并返回 Flask 应用：初始化一次表结构（请求处理时不再重复建表和迁移），并启动后台邮箱监听。
+    使用 WSGI 服务器部署时以 "backend.api_server:create_app()" 作为入口，直接运行本脚本时由实际提供服务的进程调用。
+    """
+    EmailDataManager.initialize_database()
+    start_mailbox_watcher()
+    return app
+
 if __name__ == '__main__':
+    debug = True
+    # 使用重载器时父进程只负责监控文件变化，由提供服务的子进程（WERKZEUG_RUN_MAIN=true）启动后台服务；
+    # 不使用重载器时当前进程即提供服务
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        create_app()
     # 在 0.0.0.0 上运行，使其可以从本地网络访问
     # React 开发服务器通常在 3000 端口，所以我们用 5001 避免冲突
-    app.run(host='0.0.0.0', port=5001, debug=True)
+    app.run(host='0.0.0.0', port=5001, debug=debug)
@@ -0,0 +1,172 @@
+"""
+HTML 正文提取的基准测试。
+
+用一组固定的HTML样例（纯段落、无段落的表格布局、嵌套段落、带样式和脚本的营销邮件、
+隐藏的预览文本和追踪表格等）对比原先基于 BeautifulSoup 的实现与 HTMLTextExtractor：
+- 等价性：忽略空白差异，并去掉样例中标注的噪声行后，两者的文本和图片链接应一致；
+- 性能：对大型营销邮件重复提取，输出每秒处理的邮件数。
+
+用法:
+    python backend/benchmarks/bench_html_extraction.py --repeat 20
+"""
+import argparse
+import os
+import sys
+import time
+import urllib.parse
+
+from bs4 import BeautifulSoup
+
+# 将项目根目录添加到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from backend.email_server.html_text_extractor import HTMLTextExtractor, lxml_etree
+
+PARAGRAPH = "各位同學：本學期的學術講座將於下週三下午在圖書館舉行，歡迎報名參加。"
+
+
+def newsletter_html(paragraphs, with_noise=True):
+    """
+    生成大型营销邮件：表格布局、大段内联样式、预览文本、追踪像素和追踪表格。
+    """
+    style = "<style>" + "".join(f".c{i}{{color:#{i:06x};margin:{i % 7}px}}" for i in range(400)) + "</style>"
+    noise = ""
+    if with_noise:
+        noise = (
+            "<div style='display:none;max-height:0;overflow:hidden'>本周精选预览文本</div>"
+            "<table width='1' height='1'><tr><td>tracking</td></tr></table>"
+            "<script>window.dataLayer = [];</script>"
+        )
+    rows = "".join(
+        f"<tr><td class='c{i % 400}'><p>{PARAGRAPH} <b>#{i}</b>\n    </p>"
+        f"<img src='https://example.com/i{i}.png' width='600'></td></tr>"
+        for i in range(paragraphs)
+    )
+    pixel = "<img src='https://t.example.com/open.gif?u=1' width='1' height='1'>"
+    return (
+        f"<html><head><title>Weekly</title>{style}</head><body>{noise}"
+        f"<table width='600'>{rows}</table>{pixel}</body></html>"
+    )
+
+
+def build_fixtures():
+    """
+    返回 [(名称, HTML, 噪声行), ...]。噪声行是旧实现会输出、新实现按设计跳过的文本。
+    """
+    return [
+        ("纯段落", "<html><body><p>图片测试</p><img src='https://example.com/a.jpeg'></body></html>", ()),
+        ("多段落和图片",
+         "<p>双图测试</p><img src='http://example.com/image1.jpg'>"
+         "<p>Another   paragraph\n with  spaces.</p><img src='https://example.com/image2.png'>", ()),
+        ("段落内的行内元素", "<p>Hello <b>world</b>, <a href='#'>link</a> &amp; more&nbsp;text</p>", ()),
+        ("空段落", "<p>第一段</p><p>&nbsp;</p><p></p><p>第二段</p>", ()),
+        ("嵌套段落", "<div><p>outer <p>inner</p> tail</p></div>", ()),
+        ("无段落的表格布局",
+         "<table><tr><td>姓名</td><td>张三</td></tr><tr><td>课程</td><td>COMP3230</td></tr></table>", ()),
+        ("无段落的纯文本", "第一行\n\n   第二行   \n<br>第三行", ()),
+        ("带样式和脚本",
+         "<html><head><style>p{color:red}</style><script>var a = '<p>x</p>';</script></head>"
+         "<body><div>正文内容</div><noscript>请启用JavaScript</noscript></body></html>",
+         ("请启用JavaScript",)),
+        ("标题和隐藏预览文本",
+         "<html><head><title>邮件标题</title></head><body>"
+         "<div style='display: none'>预览文本</div><span hidden>隐藏</span><div>正文</div></body></html>",
+         ("邮件标题", "预览文本", "隐藏")),
+        ("追踪表格",
+         "<p>活动通知</p><table width='1' height='1'><tr><td><p>track</p></td></tr></table><p>详情见附件</p>",
+         ("track",)),
+        ("GIF图片过滤",
+         "<p>图片</p><img src='https://example.com/a.GIF?x=1'><img src='https://example.com/b.png?f=.gif'>"
+         "<img alt='no src'>", ()),
+        ("大型营销邮件（无噪声）", newsletter_html(50, with_noise=False), ("Weekly",)),
+        ("大型营销邮件", newsletter_html(50), ("Weekly", "本周精选预览文本", "tracking")),
+    ]
+
+
+def legacy_extract(html_content):
+    """
+    原先的实现：用 html.parser 构建 BeautifulSoup 文档树后提取。
+    """
+    soup = BeautifulSoup(html_content, 'html.parser')
+    image_urls = []
+    for img in soup.find_all('img'):
+        if 'src' in img.attrs:
+            img_url = img['src']
+            if not urllib.parse.urlparse(img_url).path.lower().endswith('.gif'):
+                image_urls.append(img_url)
+    paragraphs = soup.find_all('p')
+    if paragraphs:
+        text_content = "\n".join([p.get_text(strip=True) for p in paragraphs])
+    else:
+        text_content = soup.get_text(separator='\n', strip=True)
+    return text_content, image_urls
+
+
+def normalize(text, noise=()):
+    """
+    去掉噪声行并忽略空白差异，返回用于比较的文本。
+    """
+    lines = [' '.join(line.split()) for line in text.split('\n')]
+    return ' '.join(line for line in lines if line and line not in noise)
+
+
+def check_equivalence(extractor, fixtures):
+    """
+    逐个样例比较新旧实现，返回不一致的样例名称列表。
+    """
+    mismatches = []
+    for name, html, noise in fixtures:
+        legacy_text, legacy_images = legacy_extract(html)
+        text, images = extractor.extract(html)
+        text_ok = normalize(text) == normalize(legacy_text, noise)
+        images_ok = [image['src'] for image in images] == legacy_images
+        print(f"  {name:<20}文本{'一致' if text_ok else '不一致'}  图片{'一致' if images_ok else '不一致'}")
+        if not (text_ok and images_ok):
+            mismatches.append(name)
+    return mismatches
+
+
+def run(extract, html, repeat):
+    """
+    用 extract 处理 html repeat 次，返回每秒处理的邮件数。
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        extract(html)
+    return repeat / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTML 正文提取基准测试")
+    parser.add_argument('--repeat', type=int, default=20, help="大型邮件重复提取的次数")
+    parser.add_argument('--paragraphs', type=int, default=1500, help="大型邮件的段落数")
+    args = parser.parse_args()
+
+    backends = ['stdlib'] + (['lxml'] if lxml_etree is not None else [])
+    fixtures = build_fixtures()
+    html = newsletter_html(args.paragraphs)
+    print(f"大型邮件: {len(html) / 1024:.0f} KB，{args.paragraphs} 个段落")
+
+    failed = False
+    # 等价性检查不截断正文
+    for backend in backends:
+        print(f"等价性检查（{backend}）:")
+        mismatches = check_equivalence(HTMLTextExtractor(max_chars=0, backend=backend), fixtures)
+        print(f"  一致 {len(fixtures) - len(mismatches)}/{len(fixtures)}")
+        failed = failed or bool(mismatches)
+
+    legacy_rate = run(legacy_extract, html, args.repeat)
+    print(f"旧实现（BeautifulSoup + html.parser）: {legacy_rate:.1f} 封/秒")
+    for backend in backends:
+        extractor = HTMLTextExtractor(max_chars=0, backend=backend)
+        rate = run(extractor.extract, html, args.repeat)
+        print(f"新实现（{backend}，不截断）: {rate:.1f} 封/秒，加速比 {rate / legacy_rate:.1f}x")
+        extractor = HTMLTextExtractor(backend=backend)
+        rate = run(extractor.extract, html, args.repeat)
+        print(f"新实现（{backend}，截断为 {extractor.max_chars} 字符）: {rate:.1f} 封/秒，加速比 {rate / legacy_rate:.1f}x")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+邮件列表响应组装的基准测试。
+
+对比两种方式生成包含 analysis_json 的邮件列表响应：
+    旧方式: analysis_json 以 indent=4 存储，逐行 json.loads 后整体 json.dumps；
+    新方式: analysis_json 紧凑存储并由SQLite校验，存储的文本直接拼接进响应。
+
+用法:
+    python backend/benchmarks/bench_list_response.py --count 10000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+# 将项目根目录添加到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from backend.data_storage.email_data_manager import EmailDataManager, LIST_COLUMNS, ANALYSIS_JSON_COLUMN
+from backend.data_storage.json_splice import dumps_rows
+
+SAMPLE_MARKDOWN = """
+### 邮件摘要
+
+- **主题**: HKU Daily Notices ({index})
+- **发件人**: eNotices System <enotices.daily.digest@hku.hk>
+- **日期**: Fri, 25 Jul 2025 00:11:51 +0800
+- **邮件分类**: 学术相关
+- **摘要**: 此邮件为香港大学的每日通知摘要，包含讲座、招聘和校园活动等多项信息。
+
+### 工作安排
+
+- **事项**: 提交项目报告
+  - **截止日期**: 2025-08-01
+  - **地点**: 线上
+
+### 邮件紧急程度评估
+
+- **邮件主题**: HKU Daily Notices
+  - **紧急程度**: {urgency}
+  - **理由**: 包含有截止日期的事项
+"""
+
+
+def build_database(db_path, count):
+    """
+    生成包含 count 封邮件的测试数据库，返回 (旧格式JSON列表, 数据管理器)。
+    """
+    manager = EmailDataManager(db_path=db_path)
+    rows, legacy_json = [], []
+    for i in range(count):
+        markdown = SAMPLE_MARKDOWN.format(index=i, urgency='高中低'[i % 3])
+        compact = manager.parse_markdown_to_json(markdown)
+        legacy_json.append(json.dumps(json.loads(compact), ensure_ascii=False, indent=4))
+        rows.append((
+            f"Subject {i}", f"Sender {i}", f"sender{i}@example.com", "Fri, 25 Jul 2025 00:11:51 +0800",
+            1753373511 - i, f"<bench-{i}@example.com>", "<p>body</p>", markdown, compact, "INBOX"
+        ))
+    manager.conn.executemany("""
+        INSERT INTO emails (subject, from_name, from_email, received_date, received_ts, message_id,
+                            raw_email_body, analysis_markdown, analysis_json, mailbox)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    manager.conn.commit()
+    return legacy_json, manager
+
+
+def timed(func, repeat):
+    """
+    执行 func repeat 次，返回 (最短耗时秒数, 最后一次的结果)。
+    """
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="邮件列表响应组装基准测试")
+    parser.add_argument('--count', type=int, default=10000, help="邮件数量")
+    parser.add_argument('--repeat', type=int, default=5, help="每种方式的重复次数（取最短耗时）")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        legacy_json, manager = build_database(os.path.join(tmp_dir, 'bench.db'), args.count)
+        cursor = manager.conn.cursor()
+        compact_bytes = cursor.execute("SELECT SUM(length(CAST(analysis_json AS BLOB))) FROM emails").fetchone()[0]
+        legacy_bytes = sum(len(text.encode('utf-8')) for text in legacy_json)
+
+        query = f"SELECT {LIST_COLUMNS}, {{analysis}} as analysis_json FROM emails ORDER BY received_ts DESC, id DESC"
+
+        # 旧方式：读出后替换为 indent=4 文本以模拟旧存储格式，再逐行解析并整体序列化
+        def legacy_response():
+            rows = manager.execute_query(query.format(analysis='analysis_json'))
+            for row, text in zip(rows, legacy_json):
+                row['analysis_json'] = json.loads(text)
+            return json.dumps({"emails": rows, "next_cursor": None})
+
+        def spliced_response():
+            rows = manager.execute_query(query.format(analysis=ANALYSIS_JSON_COLUMN))
+            return '{"emails":' + dumps_rows(rows) + ',"next_cursor":null}'
+
+        legacy_time, legacy_body = timed(legacy_response, args.repeat)
+        spliced_time, spliced_body = timed(spliced_response, args.repeat)
+        assert json.loads(legacy_body) == json.loads(spliced_body), "两种方式的响应内容不一致"
+
+        print(f"邮件数量: {args.count}")
+        print(f"analysis_json 存储: indent=4 {legacy_bytes / 1024:.0f} KB -> 紧凑 {compact_bytes / 1024:.0f} KB")
+        print(f"旧方式（逐行解析+重新序列化）: {legacy_time * 1000:.1f} ms, 响应 {len(legacy_body.encode('utf-8')) / 1024:.0f} KB")
+        print(f"新方式（直接拼接存储文本）:   {spliced_time * 1000:.1f} ms, 响应 {len(spliced_body.encode('utf-8')) / 1024:.0f} KB")
+        print(f"加速比: {legacy_time / spliced_time:.2f}x")
+        manager.close()
+        manager.connection_manager.close_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""
+MIME 正文解码的基准测试。
+
+生成一组接近真实邮件形态的语料（大型HTML通讯、中日韩编码、quoted-printable、
+base64、未声明编码、编码声明错误等），对比旧的整体 chardet 解码方式与
+EmailFetcher._get_email_body 的解码流水线，输出每秒处理的邮件数和解码正确率。
+
+用法:
+    python backend/benchmarks/bench_mime_decoding.py --repeat 3
+"""
+import argparse
+import base64
+import email
+import os
+import quopri
+import sys
+import time
+from email.message import Message
+from email.mime.multipart import MIMEMultipart
+
+import chardet
+
+# 将项目根目录添加到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+os.environ.setdefault("IMAP_PORT", "993")
+from backend.email_server.email_fetcher import EmailFetcher
+
+PARAGRAPHS = {
+    'zh': "各位同學：本學期的學術講座將於下週三下午在圖書館舉行，歡迎報名參加。",
+    'zh_hans': "各位同学：本学期的学术讲座将于下周三下午在图书馆举行，欢迎报名参加。",
+    'ja': "お客様各位：システムメンテナンスのため、サービスを一時停止いたします。",
+    'ko': "고객님께: 시스템 점검으로 인해 서비스가 일시 중단됩니다.",
+    'en': "Dear subscriber, here is your weekly digest of campus news and events.",
+}
+
+
+def newsletter_html(text, paragraphs):
+    """
+    生成带有大段内联样式和重复段落的HTML，模拟营销/通知类邮件。
+    """
+    style = "<style>" + "".join(f".c{i}{{color:#{i:06x};margin:{i % 7}px}}" for i in range(400)) + "</style>"
+    body = "".join(f"<p class='c{i % 400}'>{text} #{i}</p><img src='https://example.com/i{i}.png'>" for i in range(paragraphs))
+    return f"<html><head>{style}</head><body>{body}</body></html>"
+
+
+def make_part(text, charset, transfer_encoding, subtype='html', label=None, declare=True):
+    """
+    构造指定编码和传输编码的MIME文本部分。
+
+    Args:
+        label (str): 写入 Content-Type 的 charset，默认与实际编码相同，用于模拟声明错误。
+        declare (bool): 为 False 时不声明 charset。
+    """
+    data = text.encode(charset)
+    part = Message()
+    content_type = f"text/{subtype}"
+    part['Content-Type'] = f'{content_type}; charset="{label or charset}"' if declare else content_type
+    if transfer_encoding == 'base64':
+        part['Content-Transfer-Encoding'] = 'base64'
+        part.set_payload(base64.encodebytes(data).decode('ascii'))
+    else:
+        part['Content-Transfer-Encoding'] = 'quoted-printable'
+        part.set_payload(quopri.encodestring(data).decode('ascii'))
+    return part
+
+
+def build_corpus():
+    """
+    返回 [(名称, 原始字节, 期望正文), ...]。
+    """
+    cases = []
+
+    def add(name, text, charset, transfer_encoding, paragraphs=200, declare=True, multipart=True, label=None):
+        html = newsletter_html(text, paragraphs)
+        part = make_part(html, charset, transfer_encoding, label=label, declare=declare)
+        if multipart:
+            msg = MIMEMultipart('alternative')
+            msg.attach(make_part(text, 'utf-8', 'qp', subtype='plain'))
+            msg.attach(part)
+        else:
+            msg = part
+        msg['Subject'] = name
+        cases.append((name, msg.as_bytes(), html))
+
+    add("UTF-8 大型通讯 (base64)", PARAGRAPHS['zh'], 'utf-8', 'base64', paragraphs=1500)
+    add("UTF-8 通讯 (quoted-printable)", PARAGRAPHS['en'], 'utf-8', 'qp', paragraphs=800)
+    add("GB2312 通知 (base64)", PARAGRAPHS['zh_hans'], 'gb2312', 'base64')
+    add("GBK 内容标注为 GB2312", PARAGRAPHS['zh_hans'] + "镕", 'gbk', 'base64', label='gb2312')
+    add("Big5 通知 (quoted-printable)", PARAGRAPHS['zh'], 'big5', 'qp')
+    add("Shift_JIS 通知 (base64)", PARAGRAPHS['ja'], 'shift_jis', 'base64')
+    add("ISO-2022-JP 通知 (base64)", PARAGRAPHS['ja'], 'iso-2022-jp', 'base64')
+    add("EUC-KR 通知 (base64)", PARAGRAPHS['ko'], 'euc-kr', 'base64')
+    add("UTF-8 未声明编码", PARAGRAPHS['zh'], 'utf-8', 'base64', declare=False)
+    add("UTF-8 内容标注为 ISO-8859-1", PARAGRAPHS['zh'], 'utf-8', 'base64', label='iso-8859-1')
+    add("GB2312 未声明编码（单一部分）", PARAGRAPHS['zh_hans'], 'gb2312', 'base64', declare=False, multipart=False)
+    add("Big5 未声明编码", PARAGRAPHS['zh'], 'big5', 'qp', declare=False)
+    return cases
+
+
+def legacy_get_email_body(msg):
+    """
+    旧的实现：对每个文本部分的完整内容运行 chardet 后再解码。
+    """
+    body = ""
+    if msg.is_multipart():
+        for part in msg.walk():
+            ctype = part.get_content_type()
+            cdispo = str(part.get('Content-Disposition'))
+            if ctype == 'text/html' and 'attachment' not in cdispo:
+                payload = part.get_payload(decode=True)
+                detected_charset = chardet.detect(payload)['encoding']
+                try:
+                    body = payload.decode(detected_charset or part.get_content_charset() or 'utf-8', errors='replace')
+                    break
+                except Exception:
+                    pass
+            elif ctype == 'text/plain' and 'attachment' not in cdispo:
+                if not body:
+                    payload = part.get_payload(decode=True)
+                    detected_charset = chardet.detect(payload)['encoding']
+                    try:
+                        body = payload.decode(detected_charset or part.get_content_charset() or 'utf-8', errors='replace')
+                    except Exception:
+                        pass
+    else:
+        payload = msg.get_payload(decode=True)
+        detected_charset = chardet.detect(payload)['encoding']
+        try:
+            body = payload.decode(detected_charset or msg.get_content_charset() or 'utf-8', errors='replace')
+        except Exception:
+            pass
+    return body
+
+
+def run(decode, corpus, repeat):
+    """
+    用 decode 解析整个语料 repeat 次，返回 (每秒邮件数, 每封邮件是否解码正确)。
+    """
+    correct = {}
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for name, raw, expected in corpus:
+            body = decode(email.message_from_bytes(raw))
+            correct[name] = body.strip() == expected.strip()
+    elapsed = time.perf_counter() - start
+    return len(corpus) * repeat / elapsed, correct
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MIME 正文解码基准测试")
+    parser.add_argument('--repeat', type=int, default=3, help="语料重复处理的次数")
+    args = parser.parse_args()
+
+    corpus = build_corpus()
+    fetcher = EmailFetcher()
+    total_kb = sum(len(raw) for _, raw, _ in corpus) / 1024
+    print(f"语料: {len(corpus)} 封邮件，共 {total_kb:.0f} KB")
+
+    legacy_rate, legacy_correct = run(legacy_get_email_body, corpus, args.repeat)
+    new_rate, new_correct = run(fetcher._get_email_body, corpus, args.repeat)
+
+    print(f"{'邮件':<28}{'旧实现':>8}{'新实现':>8}")
+    for name, _, _ in corpus:
+        mark = lambda ok: '正确' if ok else '错误'
+        print(f"{name:<28}{mark(legacy_correct[name]):>8}{mark(new_correct[name]):>8}")
+    print(f"旧实现（整体 chardet）: {legacy_rate:.1f} 封/秒，正确 {sum(legacy_correct.values())}/{len(corpus)}")
+    print(f"新实现（解码流水线）:   {new_rate:.1f} 封/秒，正确 {sum(new_correct.values())}/{len(corpus)}")
+    print(f"加速比: {new_rate / legacy_rate:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
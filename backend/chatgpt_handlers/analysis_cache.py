@@ -0,0 +1,162 @@
+import sqlite3
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from dotenv import load_dotenv
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# EmailAnalyzer 每次请求附加的当天日期系统消息（"今天是YYYY年MM月DD日…"），不参与缓存键的计算
+DATE_MESSAGE_PATTERN = re.compile(r'^今天是\d{4}年\d{1,2}月\d{1,2}日')
+
+
+class AnalysisCache:
+    """
+    基于内容寻址的LLM分析结果缓存，存储在独立的SQLite文件中。
+
+    缓存键是最终发送给模型的消息（不含当天日期的系统消息）、模型名称和prompt文件内容的SHA-256哈希，
+    因此只要请求完全相同（跨邮箱的同一封简报、清空数据库后重新同步、崩溃后重试），
+    就可以直接复用之前的结果。条目按最大数量和最长保存天数淘汰。
+    """
+    def __init__(self, cache_path=None, max_entries=None, max_age_days=None):
+        """
+        初始化缓存，打开（或创建）缓存数据库并执行一次淘汰。
+        """
+        load_dotenv()
+        self.cache_path = cache_path or os.getenv("ANALYSIS_CACHE_PATH", "analysis_cache.db")
+        self.max_entries = int(max_entries if max_entries is not None else os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", 5000))
+        self.max_age_days = float(max_age_days if max_age_days is not None else os.getenv("ANALYSIS_CACHE_MAX_AGE_DAYS", 30))
+        self.hits = 0
+        self.misses = 0
+        self._puts_since_evict = 0
+        # 分析线程会并发访问缓存，使用同一个连接并用锁串行化
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.cache_path, check_same_thread=False)
+        self._create_table()
+        self.evict()
+        logging.info(f"分析缓存已加载: {self.cache_path}")
+
+    def _create_table(self):
+        """
+        创建缓存表。
+        """
+        with self._lock:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS analysis_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    model TEXT,
+                    result TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_analysis_cache_last_used ON analysis_cache (last_used_at)")
+            self.conn.commit()
+
+    @staticmethod
+    def make_key(messages, model, prompt_text):
+        """
+        根据最终消息列表、模型名称和prompt内容计算缓存键。
+
+        当天日期的系统消息不参与计算，否则日期一变所有条目都会失效。
+        因此命中时复用的是之前某天给出的分析（紧急程度按当时的日期判断），与已入库的分析一致。
+        """
+        messages = [
+            message for message in messages
+            if not (message.get('role') == 'system' and isinstance(message.get('content'), str)
+                    and DATE_MESSAGE_PATTERN.match(message['content']))
+        ]
+        payload = json.dumps(
+            {"model": model, "prompt": prompt_text, "messages": messages},
+            ensure_ascii=False, sort_keys=True, separators=(',', ':')
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        查询缓存，命中时返回分析结果并刷新最近使用时间，否则返回 None。
+        """
+        try:
+            with self._lock:
+                row = self.conn.execute(
+                    "SELECT result, created_at FROM analysis_cache WHERE cache_key = ?", (key,)
+                ).fetchone()
+                if row and (not self.max_age_days or time.time() - row[1] <= self.max_age_days * 86400):
+                    self.conn.execute(
+                        "UPDATE analysis_cache SET last_used_at = ? WHERE cache_key = ?", (time.time(), key)
+                    )
+                    self.conn.commit()
+                    self.hits += 1
+                    return row[0]
+                self.misses += 1
+                return None
+        except sqlite3.Error as e:
+            logging.error(f"读取分析缓存失败: {e}")
+            return None
+
+    def put(self, key, model, result):
+        """
+        写入一条分析结果，每写入一定数量后执行一次淘汰。
+        """
+        now = time.time()
+        try:
+            with self._lock:
+                self.conn.execute("""
+                    INSERT OR REPLACE INTO analysis_cache (cache_key, model, result, created_at, last_used_at)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (key, model, result, now, now))
+                self.conn.commit()
+                self._puts_since_evict += 1
+            if self._puts_since_evict >= 100:
+                self.evict()
+        except sqlite3.Error as e:
+            logging.error(f"写入分析缓存失败: {e}")
+
+    def evict(self):
+        """
+        删除过期条目，并在条目数超过上限时删除最久未使用的条目。
+        """
+        try:
+            with self._lock:
+                self._puts_since_evict = 0
+                cursor = self.conn.cursor()
+                if self.max_age_days:
+                    cursor.execute(
+                        "DELETE FROM analysis_cache WHERE created_at < ?",
+                        (time.time() - self.max_age_days * 86400,)
+                    )
+                expired = cursor.rowcount
+                if self.max_entries:
+                    cursor.execute("""
+                        DELETE FROM analysis_cache WHERE cache_key IN (
+                            SELECT cache_key FROM analysis_cache
+                            ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                        )
+                    """, (self.max_entries,))
+                overflow = cursor.rowcount
+                self.conn.commit()
+            if expired > 0 or overflow > 0:
+                logging.info(f"分析缓存淘汰: 过期 {max(expired, 0)} 条, 超出上限 {max(overflow, 0)} 条。")
+        except sqlite3.Error as e:
+            logging.error(f"淘汰分析缓存失败: {e}")
+
+    def log_stats(self):
+        """
+        在日志中输出本次运行的命中/未命中统计。
+        """
+        total = self.hits + self.misses
+        hit_rate = (self.hits / total * 100) if total else 0.0
+        logging.info(f"分析缓存统计: 命中 {self.hits} 次, 未命中 {self.misses} 次, 命中率 {hit_rate:.1f}%。")
+
+    def close(self):
+        """
+        关闭缓存数据库连接。
+        """
+        with self._lock:
+            if self.conn:
+                self.conn.close()
+                self.conn = None
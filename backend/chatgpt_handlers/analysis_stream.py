@@ -0,0 +1,122 @@
+import json
+import logging
+import re
+import time
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 分析结果中的章节标题行（"### 邮件摘要"，兼容模型偶尔输出的 "## 邮件摘要"）
+SECTION_HEADING_PATTERN = re.compile(r'^#{2,3}\s*\S')
+# 两次进度事件之间的最短间隔（秒）；第一段内容总是立即发出
+PROGRESS_EVENT_INTERVAL = 0.5
+
+
+class IncrementalSectionParser:
+    """
+    增量解析流式返回的分析Markdown：下一个章节标题出现时，上一个章节即已完整，
+    立即用 parse_markdown 解析该章节，无需等待整个回复结束。
+    """
+    def __init__(self, parse_markdown):
+        """
+        Args:
+            parse_markdown (callable): 将Markdown解析为JSON文本的函数，
+                通常为 EmailDataManager.parse_markdown_to_json。
+        """
+        self.parse_markdown = parse_markdown
+        self._pending = ''
+        self._section_lines = []
+
+    def feed(self, text):
+        """
+        追加一段新内容。
+
+        Returns:
+            list: 本次已完整的章节，每项为 (章节名, 章节数据)。
+        """
+        self._pending += text
+        *lines, self._pending = self._pending.split('\n')
+        completed = []
+        for line in lines:
+            if SECTION_HEADING_PATTERN.match(line) and self._section_lines:
+                completed.extend(self._flush())
+            self._section_lines.append(line)
+        return completed
+
+    def finish(self):
+        """
+        回复结束时解析最后一个章节。
+        """
+        if self._pending:
+            self._section_lines.append(self._pending)
+            self._pending = ''
+        return self._flush()
+
+    def _flush(self):
+        section_text = '\n'.join(self._section_lines) + '\n'
+        self._section_lines = []
+        if not SECTION_HEADING_PATTERN.match(section_text):
+            return []
+        try:
+            data = json.loads(self.parse_markdown(section_text))
+        except Exception as e:
+            logging.warning(f"增量解析分析章节失败: {e}")
+            return []
+        return list(data.items())
+
+
+class AnalysisProgressReporter:
+    """
+    将单封邮件的流式分析进度转换为同步任务事件：
+    - 'analysis_progress'：新生成的Markdown片段（按 PROGRESS_EVENT_INTERVAL 合并，避免每个 token 一条事件）；
+    - 'analysis_section'：某个章节生成完毕并解析后的数据。
+
+    重试时调用 restart()，之后的事件带有新的 attempt 编号，订阅者据此丢弃上一次的部分内容。
+    """
+    def __init__(self, report, uid, subject, parse_markdown):
+        self.report = report
+        self.uid = uid
+        self.subject = subject
+        self.parse_markdown = parse_markdown
+        self.attempt = 0
+        self.restart()
+
+    def restart(self):
+        """
+        开始新的一次分析尝试。
+        """
+        self.attempt += 1
+        self.parser = IncrementalSectionParser(self.parse_markdown)
+        self._buffer = ''
+        self._last_emit = None
+
+    def on_delta(self, text):
+        """
+        接收模型新生成的一段文本。
+        """
+        self._buffer += text
+        now = time.monotonic()
+        if self._last_emit is None or now - self._last_emit >= PROGRESS_EVENT_INTERVAL:
+            self._emit_progress(now)
+        for section, data in self.parser.feed(text):
+            self._emit_section(section, data)
+
+    def finish(self):
+        """
+        回复结束：发出剩余的片段和最后一个章节。
+        """
+        if self._buffer:
+            self._emit_progress(time.monotonic())
+        for section, data in self.parser.finish():
+            self._emit_section(section, data)
+
+    def _emit_progress(self, now):
+        self.report('analysis_progress', uid=self.uid, subject=self.subject, attempt=self.attempt, text=self._buffer)
+        self._buffer = ''
+        self._last_emit = now
+
+    def _emit_section(self, section, data):
+        # 章节事件之前先把已生成的片段发出，保证订阅者看到的顺序一致
+        if self._buffer:
+            self._emit_progress(time.monotonic())
+        self.report('analysis_section', uid=self.uid, subject=self.subject, attempt=self.attempt,
+                    section=section, data=data)
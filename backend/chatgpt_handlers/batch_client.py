@@ -0,0 +1,298 @@
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from datetime import datetime
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 批处理的终止状态；expired / cancelled 的批次仍可能有部分结果
+TERMINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+
+class OpenAIBatchBackend:
+    """
+    通过 OpenAI Batch API 提交 JSONL 请求文件并取回结果。
+    """
+    def __init__(self, client, completion_window='24h'):
+        """
+        Args:
+            client (openai.OpenAI): OpenAI 客户端，通常为 EmailAnalyzer.client。
+        """
+        self.client = client
+        self.completion_window = completion_window
+
+    def submit(self, input_path):
+        """
+        上传输入文件并创建批处理，返回批处理ID。
+        """
+        with open(input_path, 'rb') as f:
+            uploaded = self.client.files.create(file=f, purpose='batch')
+        batch = self.client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint='/v1/chat/completions',
+            completion_window=self.completion_window,
+        )
+        return batch.id
+
+    def retrieve(self, batch_id):
+        """
+        查询批处理状态，返回 {'status', 'completed', 'failed', 'total'}。
+        """
+        batch = self.client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        return {
+            "status": batch.status,
+            "completed": getattr(counts, 'completed', None),
+            "failed": getattr(counts, 'failed', None),
+            "total": getattr(counts, 'total', None),
+        }
+
+    def download(self, batch_id, output_path):
+        """
+        将批处理的结果文件和错误文件合并写入 output_path。
+        """
+        batch = self.client.batches.retrieve(batch_id)
+        with open(output_path, 'w', encoding='utf-8') as out:
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if file_id:
+                    text = self.client.files.content(file_id).text
+                    out.write(text if text.endswith('\n') or not text else text + '\n')
+
+
+class LocalBatchBackend:
+    """
+    本地的批处理替身：提交时立即用 responder 为每条请求生成回复，不访问网络。
+    用于测试批处理流程，也可在没有批处理接口的兼容服务上演练。
+    """
+    def __init__(self, work_dir, responder=None):
+        """
+        Args:
+            work_dir (str): 存放替身结果文件的目录。
+            responder (callable): 可选，签名为 responder(request_body) -> str，返回模型回复文本。
+                默认生成只含主题的最简分析结果。
+        """
+        self.work_dir = work_dir
+        self.responder = responder or self._default_responder
+        os.makedirs(work_dir, exist_ok=True)
+
+    @staticmethod
+    def _default_responder(body):
+        text = ''
+        for message in body.get('messages', []):
+            if message.get('role') == 'user' and isinstance(message.get('content'), list):
+                text = ' '.join(item.get('text', '') for item in message['content'] if item.get('type') == 'text')
+        match = re.search(r'主题: (.*)', text)
+        subject = match.group(1).strip() if match else ''
+        return f"### 邮件摘要\n- **邮件分类**: 其他\n- **主题**: {subject}\n"
+
+    def _output_path(self, batch_id):
+        return os.path.join(self.work_dir, f"{batch_id}.local-output.jsonl")
+
+    def submit(self, input_path):
+        batch_id = f"local_batch_{uuid.uuid4().hex[:12]}"
+        with open(input_path, 'r', encoding='utf-8') as src, \
+                open(self._output_path(batch_id), 'w', encoding='utf-8') as out:
+            for line in src:
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                try:
+                    content = self.responder(request['body'])
+                    result = {
+                        "id": f"batch_req_{uuid.uuid4().hex[:12]}",
+                        "custom_id": request['custom_id'],
+                        "response": {
+                            "status_code": 200,
+                            "body": {"choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]},
+                        },
+                        "error": None,
+                    }
+                except Exception as e:
+                    result = {"custom_id": request['custom_id'], "response": None,
+                              "error": {"message": str(e)}}
+                out.write(json.dumps(result, ensure_ascii=False) + '\n')
+        return batch_id
+
+    def retrieve(self, batch_id):
+        status = 'completed' if os.path.exists(self._output_path(batch_id)) else 'failed'
+        return {"status": status, "completed": None, "failed": None, "total": None}
+
+    def download(self, batch_id, output_path):
+        with open(self._output_path(batch_id), 'r', encoding='utf-8') as src, \
+                open(output_path, 'w', encoding='utf-8') as out:
+            out.write(src.read())
+
+
+class BatchRunner:
+    """
+    管理批处理分析的本地文件：输入文件（JSONL 请求）、清单（custom_id 对应的邮件数据）、
+    结果文件和状态文件都保存在 batch_dir 中，因此批处理可以跨进程、跨多次运行继续。
+
+    状态文件的 status 依次为 submitted -> 批处理的终止状态 -> ingested。
+    """
+    def __init__(self, backend, batch_dir=None, poll_interval=None):
+        """
+        Args:
+            backend: OpenAIBatchBackend 或 LocalBatchBackend。
+            batch_dir (str): 批处理文件目录，默认读取 BATCH_DIR。
+            poll_interval (int): 查询批处理状态的间隔（秒），默认读取 BATCH_POLL_INTERVAL。
+        """
+        self.backend = backend
+        self.batch_dir = batch_dir or os.getenv("BATCH_DIR", "batches")
+        self.poll_interval = poll_interval or int(os.getenv("BATCH_POLL_INTERVAL", 60))
+        os.makedirs(self.batch_dir, exist_ok=True)
+
+    def _path(self, name, suffix):
+        return os.path.join(self.batch_dir, f"{name}.{suffix}")
+
+    def _save_state(self, state):
+        path = self._path(state['name'], 'state.json')
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, path)
+
+    def create(self, requests, manifest_entries):
+        """
+        写入输入文件和清单并提交批处理。
+
+        Args:
+            requests (list): EmailAnalyzer.build_batch_request 生成的请求。
+            manifest_entries (list): 与请求一一对应、包含 'custom_id' 的字典，入库时使用。
+
+        Returns:
+            dict: 批处理状态。
+        """
+        name = f"batch-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        input_path = self._path(name, 'input.jsonl')
+        manifest_path = self._path(name, 'manifest.jsonl')
+        with open(input_path, 'w', encoding='utf-8') as f:
+            for request in requests:
+                f.write(json.dumps(request, ensure_ascii=False) + '\n')
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            for entry in manifest_entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+        batch_id = self.backend.submit(input_path)
+        state = {
+            "name": name,
+            "batch_id": batch_id,
+            "status": "submitted",
+            "request_count": len(requests),
+            "created_at": time.time(),
+            "input": input_path,
+            "manifest": manifest_path,
+            "output": self._path(name, 'output.jsonl'),
+        }
+        self._save_state(state)
+        logging.info(f"已提交批处理 {batch_id}，共 {len(requests)} 条请求，输入文件: {input_path}")
+        return state
+
+    def pending(self):
+        """
+        返回尚未入库的批处理状态，按创建时间排序。
+        """
+        states = []
+        for filename in os.listdir(self.batch_dir):
+            if not filename.endswith('.state.json'):
+                continue
+            try:
+                with open(os.path.join(self.batch_dir, filename), 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning(f"读取批处理状态文件 '{filename}' 失败: {e}")
+                continue
+            if state.get('status') != 'ingested':
+                states.append(state)
+        return sorted(states, key=lambda state: state['created_at'])
+
+    def pending_custom_ids(self):
+        """
+        返回尚未入库的批处理中已提交的全部 custom_id，避免重复提交。
+        """
+        custom_ids = set()
+        for state in self.pending():
+            custom_ids.update(self.load_manifest(state))
+        return custom_ids
+
+    def wait(self, state, timeout=None, cancel_event=None):
+        """
+        轮询批处理直到终止状态并下载结果。
+
+        Args:
+            timeout (float): 最长等待秒数，None 表示一直等待。
+            cancel_event (threading.Event): 被设置后停止等待。
+
+        Returns:
+            bool: 批处理是否已结束且结果已下载。
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            info = self.backend.retrieve(state['batch_id'])
+            if info['status'] in TERMINAL_STATUSES:
+                break
+            progress = f"（{info['completed']}/{info['total']}）" if info['total'] is not None else ''
+            logging.info(f"批处理 {state['batch_id']} 状态: {info['status']}{progress}")
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            wait_seconds = self.poll_interval
+            if deadline is not None:
+                wait_seconds = max(0, min(wait_seconds, deadline - time.monotonic()))
+            if cancel_event is not None:
+                if cancel_event.wait(wait_seconds):
+                    return False
+            else:
+                time.sleep(wait_seconds)
+
+        if info['status'] != 'completed':
+            logging.warning(f"批处理 {state['batch_id']} 结束状态为 {info['status']}，只入库已有的结果。")
+        self.backend.download(state['batch_id'], state['output'])
+        state['status'] = info['status']
+        self._save_state(state)
+        return True
+
+    def load_manifest(self, state):
+        """
+        读取清单，返回 custom_id 到清单条目的字典。
+        """
+        entries = {}
+        with open(state['manifest'], 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    entries[entry['custom_id']] = entry
+        return entries
+
+    def iter_results(self, state):
+        """
+        逐条产出批处理结果。
+
+        Yields:
+            tuple: (custom_id, 回复文本, 错误信息)；成功时错误信息为 None，失败时回复文本为 None。
+        """
+        with open(state['output'], 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                result = json.loads(line)
+                response = result.get('response') or {}
+                error = result.get('error')
+                if not error and response.get('status_code') == 200:
+                    try:
+                        content = response['body']['choices'][0]['message']['content']
+                        yield result['custom_id'], content, None
+                        continue
+                    except (KeyError, IndexError, TypeError):
+                        error = {"message": "结果格式无法识别"}
+                yield result['custom_id'], None, (error or {}).get('message') or f"HTTP {response.get('status_code')}"
+
+    def mark_ingested(self, state):
+        """
+        标记批处理结果已全部入库。
+        """
+        state['status'] = 'ingested'
+        state['ingested_at'] = time.time()
+        self._save_state(state)
@@ -1,33 +1,74 @@
 import os
+import time
 import openai
 from datetime import datetime
 from dotenv import load_dotenv
 import logging
+from backend.chatgpt_handlers.token_estimator import estimate_message_tokens
+from backend.chatgpt_handlers.analysis_cache import AnalysisCache
+from backend.chatgpt_handlers.retry_policy import CircuitBreaker, RetryPolicy
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# 实时调用和批处理请求共用的生成参数
+COMPLETION_PARAMS = {
+    "temperature": 1.0,
+    "top_p": 1.0,
+    "presence_penalty": 0.0,
+    "frequency_penalty": 0.0,
+}
+
+# 可用的降级步骤：步骤名 -> (是否包含图片, 是否使用 OPENAI_FALLBACK_MODEL)
+DEGRADE_STEPS = {
+    "full": (True, False),
+    "text_only": (False, False),
+    "fallback_model": (False, True),
+}
+
 class EmailAnalyzer:
     """
     用于与OpenAI API交互，处理邮件内容并生成分析结果的类。
     """
-    def __init__(self):
+    def __init__(self, rate_limiter=None, cache=None, retry_policy=None, circuit_breaker=None):
         """
         初始化EmailAnalyzer，从环境变量加载OpenAI配置。
+
+        Args:
+            rate_limiter (TokenBucketRateLimiter): 可选的限流器，每次调用API前都会先获取配额。
+                                                    多个分析线程应共享同一个实例。
+            cache (AnalysisCache): 可选的分析结果缓存。未提供且 ANALYSIS_CACHE_ENABLED 不为 false 时自动创建。
+            retry_policy (RetryPolicy): analyze_with_fallback 使用的重试策略，默认按环境变量创建。
+            circuit_breaker (CircuitBreaker): analyze_with_fallback 使用的熔断器，默认按环境变量创建。
+                                              多个分析线程共享同一个 EmailAnalyzer 即共享同一个熔断器。
         """
         # 从项目根目录加载 .env 文件
         load_dotenv()
         self.api_key = os.getenv("OPENAI_API_KEY")
         self.model = os.getenv("OPENAI_MODEL")
         self.base_url = os.getenv("OPENAI_BASE_URL")
+        # 是否以流式方式接收分析结果（需要调用方提供 on_delta 回调）
+        self.stream = os.getenv("OPENAI_STREAM", "true").lower() != "false"
+        # 降级时使用的备用模型（通常是更小、更便宜的纯文本模型）
+        self.fallback_model = os.getenv("OPENAI_FALLBACK_MODEL")
 
         if not self.api_key or not self.model or not self.base_url:
             logging.error("OpenAI API配置缺失。请检查.env文件中的OPENAI_API_KEY, OPENAI_MODEL, OPENAI_BASE_URL。")
             raise ValueError("OpenAI API配置缺失。")
 
+        # 重试由 RetryPolicy 统一负责，关闭客户端自带的重试，避免两层重试叠加
         self.client = openai.OpenAI(
             api_key=self.api_key,
-            base_url=self.base_url
+            base_url=self.base_url,
+            timeout=float(os.getenv("OPENAI_TIMEOUT", 120)),
+            max_retries=0
         )
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.degrade_chain = self._load_degrade_chain()
+        if cache is None and os.getenv("ANALYSIS_CACHE_ENABLED", "true").lower() != "false":
+            cache = AnalysisCache()
+        self.cache = cache
         self.prompts = self._load_prompts()
         logging.info("EmailAnalyzer 初始化完成，OpenAI配置已加载。")
 
@@ -55,6 +96,28 @@ class EmailAnalyzer:
                     logging.error(f"加载prompt文件 '{filepath}' 失败: {e}")
         return loaded_prompts
 
+    def _load_degrade_chain(self):
+        """
+        读取 OPENAI_DEGRADE_CHAIN（逗号分隔的 DEGRADE_STEPS 步骤名，按顺序尝试），
+        返回 [(步骤名, 是否包含图片, 模型), ...]。
+        """
+        chain = []
+        for name in os.getenv("OPENAI_DEGRADE_CHAIN", "full,text_only").split(','):
+            name = name.strip()
+            if not name:
+                continue
+            if name not in DEGRADE_STEPS:
+                logging.warning(f"未知的降级步骤 '{name}'，已忽略。可用步骤: {', '.join(DEGRADE_STEPS)}")
+                continue
+            include_images, use_fallback_model = DEGRADE_STEPS[name]
+            if use_fallback_model and not self.fallback_model:
+                logging.warning(f"未配置 OPENAI_FALLBACK_MODEL，已忽略降级步骤 '{name}'。")
+                continue
+            chain.append((name, include_images, self.fallback_model if use_fallback_model else self.model))
+        if not chain:
+            chain.append(("full", True, self.model))
+        return chain
+
     def get_prompt(self, prompt_name):
         """
         获取指定名称的prompt内容。
@@ -64,17 +127,12 @@ class EmailAnalyzer:
             logging.warning(f"未找到名为 '{prompt_name}' 的prompt。")
         return prompt
 
-    def analyze_email(self, chatgpt_messages, prompt_name, include_images=True):
+    def build_request_messages(self, chatgpt_messages, prompt_name, include_images=True):
         """
-        使用OpenAI API分析邮件内容。
-
-        Args:
-            chatgpt_messages (list): 邮件内容，已转换为ChatGPT messages格式。
-            prompt_name (str): 要使用的prompt名称。
-            include_images (bool): 是否在请求中包含图片。
+        在邮件内容前加上系统prompt和日期信息，组成发送给模型的完整消息列表。
 
         Returns:
-            str: OpenAI API返回的分析结果文本。
+            tuple: (消息列表, 系统prompt内容)。
         """
         system_prompt = self.get_prompt(prompt_name)
         if not system_prompt:
@@ -104,25 +162,101 @@ class EmailAnalyzer:
         messages_with_system_prompt = [{"role": "system", "content": "使用中文回复，请注意语言。"},
                                        {"role": "system", "content": date_message},
                                        {"role": "system", "content": system_prompt}] + messages_to_send
+        return messages_with_system_prompt, system_prompt
+
+    def build_batch_request(self, custom_id, chatgpt_messages, prompt_name, include_images=True):
+        """
+        生成批处理输入文件（JSONL）中的一行请求，参数与实时调用相同。
+        """
+        messages, _ = self.build_request_messages(chatgpt_messages, prompt_name, include_images)
+        return {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": dict(COMPLETION_PARAMS, model=self.model, messages=messages),
+        }
+
+    @staticmethod
+    def clean_result(analysis_result):
+        """
+        去掉模型有时包裹在结果外面的 ```markdown 代码块标记。
+        """
+        if analysis_result.startswith("```markdown\n"):
+            analysis_result = analysis_result[13:-3]
+        return analysis_result
+
+    def get_cached_analysis(self, chatgpt_messages, prompt_name, include_images=True, model=None):
+        """
+        查询分析缓存，不调用API。未启用缓存或未命中时返回 None。
+        """
+        if not self.cache:
+            return None
+        messages_with_system_prompt, system_prompt = self.build_request_messages(
+            chatgpt_messages, prompt_name, include_images
+        )
+        cached_result = self.cache.get(
+            AnalysisCache.make_key(messages_with_system_prompt, model or self.model, system_prompt)
+        )
+        if cached_result is not None:
+            logging.info(f"分析缓存命中，跳过OpenAI API调用 (prompt: {prompt_name})。")
+        return cached_result
+
+    def analyze_email(self, chatgpt_messages, prompt_name, include_images=True, on_delta=None, model=None,
+                      check_cache=True):
+        """
+        使用OpenAI API分析邮件内容（单次调用，不重试）。
+
+        Args:
+            chatgpt_messages (list): 邮件内容，已转换为ChatGPT messages格式。
+            prompt_name (str): 要使用的prompt名称。
+            include_images (bool): 是否在请求中包含图片。
+            on_delta (callable): 可选，流式模式（OPENAI_STREAM 未设为 false）下每收到一段新生成的文本
+                即以该文本调用一次；缓存命中时以完整结果调用一次。
+            model (str): 可选，覆盖 OPENAI_MODEL 使用的模型。
+            check_cache (bool): 为 False 时不再查询缓存（调用方已查询过），结果仍会写入缓存。
+
+        Returns:
+            str: OpenAI API返回的分析结果文本。
+        """
+        model = model or self.model
+        messages_with_system_prompt, system_prompt = self.build_request_messages(
+            chatgpt_messages, prompt_name, include_images
+        )
+
+        cache_key = None
+        if self.cache:
+            cache_key = AnalysisCache.make_key(messages_with_system_prompt, model, system_prompt)
+            cached_result = self.cache.get(cache_key) if check_cache else None
+            if cached_result is not None:
+                logging.info(f"分析缓存命中，跳过OpenAI API调用 (prompt: {prompt_name})。")
+                if on_delta:
+                    on_delta(cached_result)
+                return cached_result
 
         try:
             image_status = "包含图片" if include_images else "不含图片"
-            logging.info(f"调用OpenAI API ({image_status})，使用模型: {self.model}，prompt: {prompt_name}")
-            
+            if self.rate_limiter:
+                self.rate_limiter.acquire(estimate_message_tokens(messages_with_system_prompt))
+            stream = self.stream and on_delta is not None
+            started_at = datetime.now()
+            logging.info(f"调用OpenAI API ({image_status}{'，流式' if stream else ''})，使用模型: {model}，prompt: {prompt_name}")
+
             response = self.client.chat.completions.create(
-                model=self.model,
+                model=model,
                 messages=messages_with_system_prompt,
-                temperature=1.0,
-                top_p=1.0,
-                presence_penalty=0.0,
-                frequency_penalty=0.0,
+                stream=stream,
+                **COMPLETION_PARAMS,
             )
 
-            analysis_result = response.choices[0].message.content
+            if stream:
+                analysis_result = self._collect_stream(response, on_delta, started_at)
+            else:
+                analysis_result = response.choices[0].message.content
             logging.info("OpenAI API调用成功。")
-            if analysis_result.startswith("```markdown\n"):
-                analysis_result = analysis_result[13:-3]
+            analysis_result = self.clean_result(analysis_result)
 
+            if cache_key:
+                self.cache.put(cache_key, model, analysis_result)
             return analysis_result
         except openai.APIError as e:
             logging.error(f"OpenAI API错误: {e}")
@@ -133,6 +267,99 @@ class EmailAnalyzer:
             # 将其他异常也重新抛出
             raise
 
+    def analyze_with_fallback(self, chatgpt_messages, prompt_name, on_delta=None, on_retry=None, degrade_chain=None):
+        """
+        按降级链（OPENAI_DEGRADE_CHAIN）分析邮件：每个步骤按 RetryPolicy 重试暂时性错误，
+        重试用尽或遇到不可重试的错误（如图片无法访问导致的 400）时进入下一个步骤。
+        所有API调用都经过熔断器，熔断期间直接失败而不再等待；每个步骤先查询缓存，命中时不经过熔断器。
+
+        Args:
+            on_delta (callable): 同 analyze_email。
+            on_retry (callable): 可选，每次重新尝试（包括进入下一个降级步骤）之前调用，
+                调用方可借此丢弃上一次尝试的流式内容。
+            degrade_chain (list): 可选，覆盖 OPENAI_DEGRADE_CHAIN，格式同 self.degrade_chain：
+                [(步骤名, 是否包含图片, 模型), ...]。
+
+        Returns:
+            str: 分析结果文本。
+
+        Raises:
+            CircuitOpenError: 熔断器处于打开状态。
+            Exception: 降级链全部失败时，抛出最后一次的错误。
+        """
+        degrade_chain = degrade_chain or self.degrade_chain
+        last_error = None
+        first_attempt = True
+        for step, include_images, model in degrade_chain:
+            # 缓存命中不需要调用API，熔断期间已有的分析结果仍可直接使用
+            cached_result = self.get_cached_analysis(chatgpt_messages, prompt_name, include_images, model)
+            if cached_result is not None:
+                if not first_attempt and on_retry:
+                    on_retry()
+                if on_delta:
+                    on_delta(cached_result)
+                return cached_result
+            for attempt in range(self.retry_policy.max_attempts):
+                # 先通知调用方再占用熔断器：on_retry 抛出异常时不会遗留未释放的试探名额
+                if not first_attempt and on_retry:
+                    on_retry()
+                first_attempt = False
+                self.circuit_breaker.before_call()
+                try:
+                    result = self.analyze_email(chatgpt_messages, prompt_name, include_images=include_images,
+                                                on_delta=on_delta, model=model, check_cache=False)
+                except Exception as e:
+                    last_error = e
+                    if not self.retry_policy.is_retryable(e):
+                        if isinstance(e, openai.APIStatusError):
+                            self.circuit_breaker.record_success()
+                        else:
+                            self.circuit_breaker.release()
+                        logging.warning(f"降级步骤 '{step}' 遇到不可重试的错误: {e}")
+                        break
+
+                    delay = self.retry_policy.retry_after(e)
+                    if delay is not None and delay > self.retry_policy.max_delay:
+                        # 服务端要求的等待时间过长：交给熔断器冷却，本封邮件留待下次同步
+                        self.circuit_breaker.record_failure(cooldown=delay)
+                        raise
+                    self.circuit_breaker.record_failure()
+                    if attempt + 1 >= self.retry_policy.max_attempts:
+                        break
+                    if delay is None:
+                        delay = self.retry_policy.backoff(attempt)
+                    logging.warning(f"分析失败 (步骤 '{step}'，尝试 {attempt + 1}/{self.retry_policy.max_attempts}): {e}。"
+                                    f"{delay:.1f} 秒后重试...")
+                    time.sleep(delay)
+                    continue
+                self.circuit_breaker.record_success()
+                if step != degrade_chain[0][0]:
+                    logging.info(f"已降级为 '{step}' 完成分析 (模型: {model})。")
+                return result
+            logging.warning(f"降级步骤 '{step}' 失败。")
+        raise last_error
+
+    @staticmethod
+    def _collect_stream(response, on_delta, started_at):
+        """
+        逐块读取流式响应，把每段新文本交给 on_delta，返回拼接后的完整结果。
+        """
+        parts = []
+        first_chunk_at = None
+        for chunk in response:
+            # 部分兼容接口会发送不含 choices 的统计块
+            if not chunk.choices:
+                continue
+            text = chunk.choices[0].delta.content
+            if not text:
+                continue
+            if first_chunk_at is None:
+                first_chunk_at = datetime.now()
+                logging.info(f"收到首段分析内容，用时 {(first_chunk_at - started_at).total_seconds():.1f} 秒。")
+            parts.append(text)
+            on_delta(text)
+        return ''.join(parts)
+
 if __name__ == "__main__":
     # 这是一个简单的测试用例
     # 确保在运行前创建 src/email_server/prompts 目录并添加一些 .txt prompt 文件
@@ -0,0 +1,299 @@
+import email.utils
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# all_in_one prompt 中的邮件分类（兼容繁体输出），推广与订阅邮件按规则只需简短摘要和“低”紧急度
+CATEGORIES = {
+    "学术核心": ("学术核心", "學術核心"),
+    "学术相关": ("学术相关", "學術相關"),
+    "行政事务": ("行政事务", "行政事務"),
+    "推广与订阅": ("推广与订阅", "推廣與訂閱"),
+    "社交与个人": ("社交与个人", "社交與個人"),
+}
+BULK_CATEGORY = "推广与订阅"
+# 分流方式：full 为完整分析；cheap_model 使用纯文本的便宜模型；template 在本地生成模板化分析，不调用API
+ROUTES = ("full", "cheap_model", "template")
+# Precedence 头为这些值时表示群发邮件
+BULK_PRECEDENCE = frozenset({"bulk", "list", "junk"})
+WORD_PATTERN = re.compile(r"[a-z0-9]+(?:['\-][a-z0-9]+)*")
+CJK_PATTERN = re.compile(r'[\u4e00-\u9fff]+')
+# 模板化分析中摘要取正文开头的字符数
+TEMPLATE_SUMMARY_CHARS = 120
+
+
+def normalize_category(value):
+    """
+    将分析结果中的分类文本（可能带有 ** 或英文注释）归一为 CATEGORIES 的键，无法识别时返回 None。
+    """
+    if not value:
+        return None
+    for category, names in CATEGORIES.items():
+        if any(name in value for name in names):
+            return category
+    return None
+
+
+def _tokens(text):
+    """
+    把文本切分为特征词：英文按单词，中文按相邻两字，按集合去重（短文本上比计数更稳定）。
+    """
+    text = (text or '').lower()
+    tokens = {word for word in WORD_PATTERN.findall(text) if len(word) > 1 and not word.isdigit()}
+    for run in CJK_PATTERN.findall(text):
+        if len(run) == 1:
+            tokens.add(run)
+        tokens.update(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def email_features(from_name, from_email, subject):
+    """
+    分类器使用的特征：主题、发件人名称的词以及发件人地址和域名。
+    只使用入库时就能得到的字段，训练（数据库中的历史邮件）和预测（新邮件）的特征一致。
+    """
+    from_email = (from_email or '').strip().lower()
+    features = _tokens(subject)
+    features.update(f"name:{token}" for token in _tokens(from_name))
+    if from_email:
+        features.add(f"from:{from_email}")
+        features.add(f"domain:{from_email.rpartition('@')[2]}")
+    return features
+
+
+class NaiveBayesClassifier:
+    """
+    二值特征的多项式朴素贝叶斯分类器（拉普拉斯平滑），纯 Python 实现，训练几千封邮件只需几十毫秒。
+    """
+    def __init__(self, alpha=1.0):
+        self.alpha = alpha
+        self.class_counts = Counter()
+        self.feature_counts = defaultdict(Counter)
+        self.feature_totals = Counter()
+        self.vocabulary = set()
+
+    def fit(self, samples):
+        """
+        Args:
+            samples (iterable): (特征集合, 类别) 的序列。
+        """
+        for features, label in samples:
+            self.class_counts[label] += 1
+            self.feature_counts[label].update(features)
+            self.feature_totals[label] += len(features)
+            self.vocabulary.update(features)
+        return self
+
+    @property
+    def trained_samples(self):
+        return sum(self.class_counts.values())
+
+    def predict_proba(self, features):
+        """
+        返回各类别的后验概率 {类别: 概率}。未见过的特征不参与计算。
+        """
+        total = self.trained_samples
+        if not total:
+            return {}
+        vocabulary_size = len(self.vocabulary)
+        known = [feature for feature in features if feature in self.vocabulary]
+        scores = {}
+        for label, count in self.class_counts.items():
+            denominator = self.feature_totals[label] + self.alpha * vocabulary_size
+            counts = self.feature_counts[label]
+            score = math.log(count / total)
+            for feature in known:
+                score += math.log((counts[feature] + self.alpha) / denominator)
+            scores[label] = score
+        top = max(scores.values())
+        exp_scores = {label: math.exp(score - top) for label, score in scores.items()}
+        norm = sum(exp_scores.values())
+        return {label: value / norm for label, value in exp_scores.items()}
+
+
+class EmailTriage:
+    """
+    调用 analyze_email 之前的本地预分类：根据邮件头（List-Unsubscribe、Precedence）、
+    发件人的历史分类以及在历史分析结果上训练的朴素贝叶斯分类器，判断邮件是否为推广与订阅类群发邮件。
+
+    群发邮件按 bulk_route 分流到纯文本的便宜模型或本地模板，其余邮件照常完整分析。
+    由多个分析线程共享，计数器的更新是线程安全的。
+    """
+    def __init__(self, enabled=None, bulk_route=None, bulk_model=None, threshold=None,
+                 sender_min_emails=None, sender_bulk_ratio=None, min_training=None, training_limit=None):
+        """
+        Args:
+            enabled (bool): 是否启用预分类，默认读取 TRIAGE_ENABLED；关闭时所有邮件都完整分析。
+            bulk_route (str): 群发邮件的分流方式（ROUTES 之一），默认读取 TRIAGE_BULK_ROUTE。
+            bulk_model (str): cheap_model 使用的模型，默认读取 TRIAGE_MODEL；为空时由调用方决定。
+            threshold (float): 分类器判为推广与订阅的最低概率，默认读取 TRIAGE_CLASSIFIER_THRESHOLD。
+            sender_min_emails (int): 使用发件人历史所需的最少历史邮件数，默认读取 TRIAGE_SENDER_MIN_EMAILS。
+            sender_bulk_ratio (float): 发件人历史中推广与订阅的占比达到该值时直接判为群发，
+                默认读取 TRIAGE_SENDER_BULK_RATIO。
+            min_training (int): 启用分类器所需的最少训练样本数，默认读取 TRIAGE_MIN_TRAINING。
+            training_limit (int): 训练时最多读取的历史邮件数（最近的邮件优先），默认读取 TRIAGE_TRAINING_LIMIT。
+        """
+        self.enabled = enabled if enabled is not None else os.getenv("TRIAGE_ENABLED", "true").lower() != "false"
+        self.bulk_route = bulk_route or os.getenv("TRIAGE_BULK_ROUTE", "cheap_model")
+        if self.bulk_route not in ROUTES:
+            logging.warning(f"未知的分流方式 '{self.bulk_route}'，群发邮件将完整分析。可用方式: {', '.join(ROUTES)}")
+            self.bulk_route = "full"
+        self.bulk_model = bulk_model if bulk_model is not None else os.getenv("TRIAGE_MODEL")
+        self.threshold = float(threshold if threshold is not None else os.getenv("TRIAGE_CLASSIFIER_THRESHOLD", 0.9))
+        self.sender_min_emails = int(sender_min_emails if sender_min_emails is not None
+                                     else os.getenv("TRIAGE_SENDER_MIN_EMAILS", 3))
+        self.sender_bulk_ratio = float(sender_bulk_ratio if sender_bulk_ratio is not None
+                                       else os.getenv("TRIAGE_SENDER_BULK_RATIO", 0.9))
+        self.min_training = int(min_training if min_training is not None else os.getenv("TRIAGE_MIN_TRAINING", 30))
+        self.training_limit = int(training_limit if training_limit is not None
+                                  else os.getenv("TRIAGE_TRAINING_LIMIT", 3000))
+        self.classifier = None
+        self.sender_history = defaultdict(Counter)
+        self.route_counts = Counter()
+        self.category_counts = Counter()
+        self._lock = threading.Lock()
+
+    def train(self, data_manager):
+        """
+        用数据库中已有的分析结果训练分类器并统计发件人历史。模板化分析的邮件不参与训练，避免自我强化。
+        """
+        if not self.enabled:
+            return
+        samples = []
+        for from_name, from_email, subject, category in data_manager.get_triage_training_rows(self.training_limit):
+            category = normalize_category(category)
+            if category is None:
+                continue
+            samples.append((email_features(from_name, from_email, subject), category))
+            if from_email:
+                self.sender_history[from_email.strip().lower()][category] += 1
+
+        classifier = NaiveBayesClassifier().fit(samples)
+        if classifier.trained_samples >= self.min_training and len(classifier.class_counts) >= 2:
+            self.classifier = classifier
+            logging.info(f"预分类器已用 {classifier.trained_samples} 封历史邮件训练完成，"
+                         f"类别分布: {dict(classifier.class_counts)}。")
+        else:
+            logging.info(f"历史分析结果不足（{len(samples)} 封），预分类只使用发件人历史（邮件头需有发件人历史佐证）。")
+
+    @staticmethod
+    def _bulk_headers(email_data):
+        """
+        返回邮件头中表明群发的依据列表。
+        """
+        reasons = []
+        if email_data.get('List-Unsubscribe'):
+            reasons.append("List-Unsubscribe")
+        if (email_data.get('Precedence') or '').strip().lower() in BULK_PRECEDENCE:
+            reasons.append(f"Precedence: {email_data['Precedence'].strip()}")
+        return reasons
+
+    def classify(self, email_data):
+        """
+        判断一封邮件的分流方式。
+
+        Returns:
+            dict: {'route': ROUTES 之一, 'category': 预测的分类（未知时为 None）,
+                   'reason': 判断依据, 'confidence': 分类器给出的推广与订阅概率（未启用分类器时为 None）}。
+        """
+        decision = {"route": "full", "category": None, "reason": "", "confidence": None}
+        if not self.enabled:
+            decision["reason"] = "预分类未启用"
+            return self._record(decision)
+
+        from_name, from_email = email.utils.parseaddr(email_data.get('From') or '')
+        from_email = from_email.strip().lower()
+
+        probabilities = {}
+        if self.classifier is not None:
+            probabilities = self.classifier.predict_proba(
+                email_features(from_name, from_email, email_data.get('Subject'))
+            )
+            decision["category"] = max(probabilities, key=probabilities.get)
+            decision["confidence"] = probabilities.get(BULK_CATEGORY, 0.0)
+
+        history = self.sender_history.get(from_email)
+        history_total = sum(history.values()) if history else 0
+        header_reasons = self._bulk_headers(email_data)
+
+        is_bulk = False
+        if history_total >= self.sender_min_emails and history[BULK_CATEGORY] / history_total >= self.sender_bulk_ratio:
+            is_bulk = True
+            decision["reason"] = f"发件人历史 {history[BULK_CATEGORY]}/{history_total} 封为推广与订阅"
+        elif decision["confidence"] is not None and decision["confidence"] >= self.threshold:
+            is_bulk = True
+            decision["reason"] = f"分类器概率 {decision['confidence']:.2f}"
+        elif header_reasons:
+            # 学院的邮件列表同样带有 List-Unsubscribe，只有分类器或发件人历史也倾向推广与订阅时才分流；
+            # 冷启动（分类器未训练、发件人没有历史）时只凭邮件头不分流
+            if decision["category"] == BULK_CATEGORY:
+                is_bulk = True
+                decision["reason"] = "邮件头 " + "、".join(header_reasons) + "，分类器判为推广与订阅"
+            elif history_total and history[BULK_CATEGORY] * 2 > history_total:
+                is_bulk = True
+                decision["reason"] = ("邮件头 " + "、".join(header_reasons) +
+                                      f"，发件人历史 {history[BULK_CATEGORY]}/{history_total} 封为推广与订阅")
+            else:
+                decision["reason"] = "邮件头 " + "、".join(header_reasons) + "，但分类器和发件人历史均未确认"
+
+        if is_bulk:
+            decision["category"] = BULK_CATEGORY
+            decision["route"] = self.bulk_route
+        return self._record(decision)
+
+    def _record(self, decision):
+        with self._lock:
+            self.route_counts[decision["route"]] += 1
+            self.category_counts[decision["category"] or "未知"] += 1
+        return decision
+
+    def stats(self):
+        """
+        返回本次运行的分流计数 {'routes': {...}, 'categories': {...}}。
+        """
+        with self._lock:
+            return {"routes": dict(self.route_counts), "categories": dict(self.category_counts)}
+
+    def log_stats(self):
+        """
+        在日志中输出本次运行的分流和预测分类计数。
+        """
+        stats = self.stats()
+        if stats["routes"]:
+            logging.info(f"预分类统计: 分流 {stats['routes']}，预测分类 {stats['categories']}。")
+
+    @staticmethod
+    def template_analysis(email_data, text_content):
+        """
+        为群发邮件在本地生成与 all_in_one prompt 输出格式一致的分析结果，不调用API。
+        """
+        subject = email_data.get('Subject') or '无'
+        sender = email_data.get('From') or '无'
+        summary = ' '.join((text_content or '').split())
+        if len(summary) > TEMPLATE_SUMMARY_CHARS:
+            summary = summary[:TEMPLATE_SUMMARY_CHARS] + '…'
+        return (
+            "### 邮件摘要\n"
+            f"- **邮件分类**: {BULK_CATEGORY}\n"
+            f"- **主题**: {subject}\n"
+            f"- **发件人**: {sender}\n"
+            f"- **日期**: {email_data.get('Date') or '无'}\n"
+            f"- **摘要**: 推广/订阅类群发邮件（本地预分类生成，未经模型分析）。{summary}\n"
+            "\n### 工作安排\n无\n"
+            "\n### 日常安排\n无\n"
+            "\n### 行动事项\n"
+            "- **事项**: (可选)查阅详情\n"
+            "  - **描述**: (可选)查阅详情\n"
+            "  - **截止日期**: 无\n"
+            f"  - **关联人**: {sender}\n"
+            "  - **状态**: 待办\n"
+            "\n### 邮件紧急程度评估\n"
+            f"- **邮件主题**: {subject}\n"
+            "  - **紧急程度**: 低\n"
+            "  - **理由**: 推广与订阅类邮件。\n"
+        )
@@ -0,0 +1,178 @@
+import logging
+import os
+import re
+from backend.chatgpt_handlers.token_estimator import estimate_text_tokens
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 邮件页脚、退订和模板化提示等与内容无关的行。只在末尾部分按子串匹配，
+# 其余位置的行须较短且主要由这些标记组成才会去除，以免误删正文（如"版权所有权转让"）
+BOILERPLATE_PATTERN = re.compile(
+    r'unsubscribe|manage (your )?(email )?preferences|update your preferences|'
+    r'view (this email |it )?(online|in (your |a )?browser)|privacy policy|all rights reserved|copyright|©|'
+    r'(this|the) (e-?mail|message) was sent to|you (are receiving|received) this|do not reply|'
+    r'退订|退訂|取消订阅|取消訂閱|在浏览器中查看|在瀏覽器中查看|隐私政策|隱私政策|私隱政策|'
+    r'版权所有|版權所有|请勿回复|請勿回覆|請勿回復|此邮件由系统自动发送|此郵件由系統自動發送',
+    re.IGNORECASE,
+)
+# 出现在邮件末尾部分时，其后的内容整体视为页脚
+FOOTER_MARKER_PATTERN = re.compile(
+    r'unsubscribe|all rights reserved|copyright|©|(this|the) (e-?mail|message) was sent to|'
+    r'you (are receiving|received) this|退订|退訂|取消订阅|取消訂閱|版权所有|版權所有',
+    re.IGNORECASE,
+)
+# 页脚标记出现在最后这一比例的行中时才截去其后的内容
+FOOTER_TAIL_RATIO = 0.3
+# 行数少于该值的邮件不划分末尾部分，避免短邮件整体被当作页脚
+FOOTER_MIN_LINES = 4
+# 末尾部分以外，不超过该字符数且模板标记占非空白字符的比例不低于 BOILERPLATE_MIN_COVERAGE 的行才视为模板行
+BOILERPLATE_MAX_LINE_CHARS = 80
+BOILERPLATE_MIN_COVERAGE = 0.5
+URL_PATTERN = re.compile(r'https?://[^\s<>"\')\]]+')
+# 只剩标点、分隔符的行
+EMPTY_LINE_PATTERN = re.compile(r'^[\W_]*$')
+# 超出预算时每段至少保留的 token 数；段数过多时只保留前面的段落
+MIN_SECTION_TOKENS = 24
+TRUNCATION_MARK = '…'
+
+
+class PromptCompactor:
+    """
+    在调用 LLM 之前压缩邮件正文：去除页脚、退订块等模板内容和重复的链接与行，
+    再按段落把正文裁剪到 token 预算以内。
+
+    正文按行划分段落（与 EmailProcessor 提取的文本一致，每个 <p> 一行）。
+    超出预算时按最大最小公平分配：短段落完整保留，长段落截断到相同的份额，
+    因此 "Daily Notices" 这类汇总邮件的每一条通知都能保留开头部分。
+    """
+    def __init__(self, token_budget=None):
+        """
+        Args:
+            token_budget (int): 正文的 token 预算，默认读取 PROMPT_TOKEN_BUDGET；0 表示只清理不裁剪。
+        """
+        self.token_budget = token_budget if token_budget is not None else int(os.getenv("PROMPT_TOKEN_BUDGET", 3000))
+
+    def compact(self, text):
+        """
+        压缩邮件正文。
+
+        Args:
+            text (str): EmailProcessor 提取的纯文本正文。
+
+        Returns:
+            dict: {'text': 压缩后的正文, 'original_tokens': 原正文的估算 token 数,
+                   'compacted_tokens': 压缩后的估算 token 数, 'truncated': 是否按预算裁剪过}。
+        """
+        original_tokens = estimate_text_tokens(text)
+        lines = self._remove_boilerplate(text.split('\n')) if text else []
+        truncated = False
+        if self.token_budget and sum(estimate_text_tokens(line) for line in lines) > self.token_budget:
+            lines = self._fit_sections(lines, self.token_budget)
+            truncated = True
+        compacted = '\n'.join(lines)
+        return {
+            "text": compacted,
+            "original_tokens": original_tokens,
+            "compacted_tokens": estimate_text_tokens(compacted),
+            "truncated": truncated,
+        }
+
+    def _remove_boilerplate(self, lines):
+        """
+        去除页脚、模板行、重复出现的链接和重复的行。
+        """
+        lines = [' '.join(line.split()) for line in lines]
+        lines = [line for line in lines if line]
+
+        # 末尾部分出现页脚标记时，截去标记及其后的全部内容
+        tail_start = int(len(lines) * (1 - FOOTER_TAIL_RATIO)) if len(lines) >= FOOTER_MIN_LINES else len(lines)
+        for index in range(tail_start, len(lines)):
+            if FOOTER_MARKER_PATTERN.search(lines[index]):
+                lines = lines[:index]
+                break
+
+        seen_lines = set()
+        seen_urls = set()
+        result = []
+        for index, line in enumerate(lines):
+            if index >= tail_start:
+                if BOILERPLATE_PATTERN.search(line):
+                    continue
+            elif self._is_boilerplate_line(line):
+                continue
+
+            def drop_repeated_url(match):
+                url = match.group(0)
+                if url in seen_urls:
+                    return ''
+                seen_urls.add(url)
+                return url
+
+            line = ' '.join(URL_PATTERN.sub(drop_repeated_url, line).split())
+            if EMPTY_LINE_PATTERN.match(line):
+                continue
+            key = line.lower()
+            if key in seen_lines:
+                continue
+            seen_lines.add(key)
+            result.append(line)
+        return result
+
+    @staticmethod
+    def _is_boilerplate_line(line):
+        """
+        判断末尾部分以外的行是否为模板行：行较短，且去掉链接后主要由模板标记组成。
+        """
+        text = URL_PATTERN.sub('', line)
+        if len(text) > BOILERPLATE_MAX_LINE_CHARS:
+            return False
+        total = len(text) - text.count(' ')
+        matched = sum(len(match.group(0).replace(' ', '')) for match in BOILERPLATE_PATTERN.finditer(text))
+        return total > 0 and matched >= total * BOILERPLATE_MIN_COVERAGE
+
+    def _fit_sections(self, lines, budget):
+        """
+        按最大最小公平分配，把各段落裁剪到总预算以内。
+        """
+        omitted = 0
+        max_sections = max(1, budget // MIN_SECTION_TOKENS)
+        if len(lines) > max_sections:
+            omitted = len(lines) - max_sections
+            lines = lines[:max_sections]
+        omitted_note = f"[其余 {omitted} 段内容已省略]" if omitted else None
+        if omitted_note:
+            budget = max(budget - estimate_text_tokens(omitted_note), len(lines))
+
+        costs = [estimate_text_tokens(line) for line in lines]
+        allowances = [0] * len(lines)
+        remaining = budget
+        # 从最短的段落开始分配：不足份额的段落完整保留，剩余预算由更长的段落平分
+        order = sorted(range(len(lines)), key=lambda i: costs[i])
+        for position, index in enumerate(order):
+            share = remaining // (len(lines) - position)
+            allowances[index] = min(costs[index], share)
+            remaining -= allowances[index]
+
+        result = []
+        for line, cost, allowance in zip(lines, costs, allowances):
+            if allowance >= cost:
+                result.append(line)
+            elif allowance > 0:
+                result.append(self._truncate_to_tokens(line, allowance) + TRUNCATION_MARK)
+        if omitted_note:
+            result.append(omitted_note)
+        return result
+
+    @staticmethod
+    def _truncate_to_tokens(text, tokens):
+        """
+        返回 text 不超过 tokens 个估算 token 的最长前缀。
+        """
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if estimate_text_tokens(text[:middle]) <= tokens:
+                low = middle
+            else:
+                high = middle - 1
+        return text[:low].rstrip()
@@ -0,0 +1,73 @@
+import threading
+import time
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class TokenBucketRateLimiter:
+    """
+    线程安全的令牌桶限流器，同时限制每分钟请求数 (RPM) 和每分钟 token 数 (TPM)。
+
+    两个桶的容量均为一分钟的配额，并按时间连续补充；任一限制设为 0 或 None 表示不限制。
+    """
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.rpm = requests_per_minute or 0
+        self.tpm = tokens_per_minute or 0
+        self._request_allowance = float(self.rpm)
+        self._token_allowance = float(self.tpm)
+        self._last_refill = time.monotonic()
+        self._condition = threading.Condition()
+        logging.info(f"限流器初始化完成: RPM={self.rpm or '不限'}, TPM={self.tpm or '不限'}")
+
+    def _refill(self):
+        """
+        按距离上次补充经过的时间补充两个桶。
+        """
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        if self.rpm:
+            self._request_allowance = min(self.rpm, self._request_allowance + elapsed * self.rpm / 60.0)
+        if self.tpm:
+            self._token_allowance = min(self.tpm, self._token_allowance + elapsed * self.tpm / 60.0)
+
+    def _wait_time(self, tokens):
+        """
+        计算还需要等待多少秒才能同时满足请求数和 token 数。
+        """
+        wait = 0.0
+        if self.rpm and self._request_allowance < 1:
+            wait = max(wait, (1 - self._request_allowance) * 60.0 / self.rpm)
+        if self.tpm and self._token_allowance < tokens:
+            wait = max(wait, (tokens - self._token_allowance) * 60.0 / self.tpm)
+        return wait
+
+    def acquire(self, tokens=0):
+        """
+        阻塞直到可以发送一个请求（预计消耗 tokens 个 token）。
+
+        Args:
+            tokens (int): 本次请求的预计 token 数。超过每分钟上限时按上限计算，避免永久阻塞。
+
+        Returns:
+            float: 实际等待的秒数。
+        """
+        if self.tpm:
+            tokens = min(tokens, self.tpm)
+        waited = 0.0
+        with self._condition:
+            while True:
+                self._refill()
+                wait = self._wait_time(tokens)
+                if wait <= 0:
+                    break
+                self._condition.wait(wait)
+                waited += wait
+            if self.rpm:
+                self._request_allowance -= 1
+            if self.tpm:
+                self._token_allowance -= tokens
+        if waited:
+            logging.info(f"触发限流，等待了 {waited:.1f} 秒。")
+        return waited
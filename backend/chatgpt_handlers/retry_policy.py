@@ -0,0 +1,235 @@
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import openai
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 这些状态码表示服务端暂时无法处理（超时、冲突、限流、服务端错误），稍后重试可能成功
+RETRYABLE_STATUS_CODES = frozenset({408, 409, 429})
+
+
+class CircuitOpenError(RuntimeError):
+    """
+    熔断器处于打开状态时拒绝调用。remaining 为冷却期的剩余秒数。
+    """
+    def __init__(self, remaining):
+        super().__init__(f"OpenAI API 暂不可用，熔断冷却中（剩余 {remaining:.0f} 秒）。")
+        self.remaining = remaining
+
+
+class RetryPolicy:
+    """
+    OpenAI API 调用的重试策略：只重试暂时性错误（超时、连接错误、限流和 5xx），
+    等待时间优先采用服务端返回的 Retry-After，否则使用带完全抖动的指数退避，
+    避免多个分析线程在同一时刻集中重试。
+    """
+    def __init__(self, max_attempts=None, base_delay=None, max_delay=None):
+        """
+        Args:
+            max_attempts (int): 每个降级步骤的最多尝试次数，默认读取 OPENAI_RETRY_MAX_ATTEMPTS。
+            base_delay (float): 指数退避的基准秒数，默认读取 OPENAI_RETRY_BASE_DELAY。
+            max_delay (float): 单次等待的上限秒数，默认读取 OPENAI_RETRY_MAX_DELAY。
+                服务端要求等待的时间超过该值时不再原地等待，而是让熔断器冷却相应的时间。
+        """
+        self.max_attempts = max(1, int(max_attempts if max_attempts is not None
+                                       else os.getenv("OPENAI_RETRY_MAX_ATTEMPTS", 3)))
+        self.base_delay = float(base_delay if base_delay is not None else os.getenv("OPENAI_RETRY_BASE_DELAY", 2))
+        self.max_delay = float(max_delay if max_delay is not None else os.getenv("OPENAI_RETRY_MAX_DELAY", 60))
+
+    @staticmethod
+    def is_retryable(error):
+        """
+        判断错误是否为暂时性错误。请求本身有误（如 400、401）时重试没有意义。
+        """
+        if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+            return True
+        if isinstance(error, openai.APIStatusError):
+            return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+        return False
+
+    @staticmethod
+    def retry_after(error):
+        """
+        读取响应头中服务端要求的等待秒数（retry-after-ms 或 Retry-After，后者可以是秒数或HTTP日期）。
+
+        Returns:
+            float | None: 等待秒数；响应中没有该信息时返回 None。
+        """
+        response = getattr(error, 'response', None)
+        if response is None:
+            return None
+        headers = response.headers
+        value = headers.get('retry-after-ms')
+        if value:
+            try:
+                return max(0.0, float(value) / 1000)
+            except ValueError:
+                pass
+        value = headers.get('retry-after')
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+    def backoff(self, attempt):
+        """
+        第 attempt 次（从 0 开始）失败后的退避时间：在 [0, min(max_delay, base_delay * 2^attempt)] 内均匀取值。
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    线程安全的熔断器，由共享同一个 EmailAnalyzer 的所有分析线程共用。
+
+    - closed：正常调用，连续 failure_threshold 次暂时性失败后打开；
+    - open：冷却期内拒绝调用（抛出 CircuitOpenError），同步流程也暂停分发新邮件；
+    - half_open：冷却期结束后只放行一个试探请求，成功则关闭，失败则重新打开。
+      试探请求超过 probe_timeout 秒仍未报告结果时视为丢失，名额交给下一个调用。
+    """
+    def __init__(self, failure_threshold=None, cooldown=None, give_up_after=None, probe_timeout=None):
+        """
+        Args:
+            failure_threshold (int): 连续失败多少次后打开，默认读取 OPENAI_BREAKER_THRESHOLD；0 表示不熔断。
+            cooldown (float): 打开后的冷却秒数，默认读取 OPENAI_BREAKER_COOLDOWN。
+            give_up_after (float): 持续熔断超过该秒数后，wait_until_ready 不再等待，
+                默认读取 OPENAI_BREAKER_GIVE_UP。
+            probe_timeout (float): 试探请求的最长等待秒数，默认读取 OPENAI_BREAKER_PROBE_TIMEOUT。
+        """
+        self.failure_threshold = int(failure_threshold if failure_threshold is not None
+                                     else os.getenv("OPENAI_BREAKER_THRESHOLD", 5))
+        self.cooldown = float(cooldown if cooldown is not None else os.getenv("OPENAI_BREAKER_COOLDOWN", 60))
+        self.give_up_after = float(give_up_after if give_up_after is not None
+                                   else os.getenv("OPENAI_BREAKER_GIVE_UP", 600))
+        self.probe_timeout = float(probe_timeout if probe_timeout is not None
+                                   else os.getenv("OPENAI_BREAKER_PROBE_TIMEOUT", 300))
+        self.state = 'closed'
+        self._failures = 0
+        self._opened_until = 0.0
+        # 本轮熔断（从第一次打开到恢复）开始的时间
+        self._outage_started = None
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        self._condition = threading.Condition()
+
+    def _refresh(self, now):
+        """
+        冷却期结束时转入 half_open；试探请求超时未报告结果时释放名额。调用方需持有锁。
+        """
+        if self.state == 'open' and now >= self._opened_until:
+            self.state = 'half_open'
+            self._probe_in_flight = False
+        elif self.state == 'half_open' and self._probe_in_flight and now - self._probe_started >= self.probe_timeout:
+            logging.warning(f"试探请求超过 {self.probe_timeout:.0f} 秒未返回结果，重新发送试探请求。")
+            self._probe_in_flight = False
+
+    def before_call(self):
+        """
+        调用 API 前检查熔断器。half_open 状态下已有试探请求时，等待其结果（最多 probe_timeout 秒）后再决定。
+
+        Raises:
+            CircuitOpenError: 熔断器处于打开状态。
+        """
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._refresh(now)
+                if self.state == 'closed':
+                    return
+                if self.state == 'open':
+                    raise CircuitOpenError(self._opened_until - now)
+                if not self._probe_in_flight:
+                    self._probe_in_flight = True
+                    self._probe_started = now
+                    logging.info("熔断冷却结束，发送试探请求。")
+                    return
+                self._condition.wait(max(self._probe_started + self.probe_timeout - now, 0.01))
+
+    def record_success(self):
+        """
+        记录一次服务端有响应的调用（包括请求本身有误的 4xx），熔断器恢复为 closed。
+        """
+        with self._condition:
+            if self.state != 'closed':
+                logging.info("OpenAI API 已恢复，熔断器关闭。")
+            self.state = 'closed'
+            self._failures = 0
+            self._outage_started = None
+            self._probe_in_flight = False
+            self._condition.notify_all()
+
+    def release(self):
+        """
+        调用因与服务状态无关的原因失败（如本地处理出错）时，只释放试探名额，不改变熔断状态。
+        """
+        with self._condition:
+            self._probe_in_flight = False
+            self._condition.notify_all()
+
+    def record_failure(self, cooldown=None):
+        """
+        记录一次暂时性失败。
+
+        Args:
+            cooldown (float): 可选，立即打开并冷却指定秒数（如服务端要求的 Retry-After 超过了重试等待上限）。
+        """
+        with self._condition:
+            now = time.monotonic()
+            self._refresh(now)
+            self._failures += 1
+            requested = cooldown is not None
+            if requested or self.state == 'half_open' or \
+                    (self.failure_threshold and self._failures >= self.failure_threshold):
+                cooldown = max(cooldown or 0.0, self.cooldown)
+                self._opened_until = max(self._opened_until, now + cooldown)
+                if self.state != 'open':
+                    reason = "服务端要求暂停请求" if requested else f"连续失败 {self._failures} 次"
+                    logging.warning(f"OpenAI API {reason}，熔断 {cooldown:.0f} 秒。")
+                self.state = 'open'
+                self._probe_in_flight = False
+                if self._outage_started is None:
+                    self._outage_started = now
+            self._condition.notify_all()
+
+    def wait_until_ready(self, cancel_event=None):
+        """
+        供分发邮件的线程调用：熔断期间（包括试探请求尚未返回时）阻塞，避免把邮件交给注定失败的调用。
+
+        Returns:
+            bool: 可以继续分发时返回 True；同步被取消或持续熔断超过 give_up_after 秒时返回 False。
+        """
+        logged = False
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._refresh(now)
+                if self.state == 'closed' or (self.state == 'half_open' and not self._probe_in_flight):
+                    return True
+                if cancel_event is not None and cancel_event.is_set():
+                    return False
+                if self._outage_started is not None and now - self._outage_started >= self.give_up_after:
+                    logging.error(f"OpenAI API 已持续不可用超过 {self.give_up_after:.0f} 秒，停止分发新邮件。")
+                    return False
+                if not logged and self.state == 'open':
+                    logging.warning(f"熔断冷却中，暂停分发新邮件 {self._opened_until - now:.0f} 秒...")
+                    logged = True
+                # 分段等待以便及时响应取消
+                timeout = 1.0
+                if self.state == 'open':
+                    timeout = min(timeout, max(self._opened_until - now, 0.01))
+                self._condition.wait(timeout)
@@ -0,0 +1,41 @@
+import re
+
+# CJK 字符（中日韩统一表意文字、假名、韩文、全角标点）大约每个字符对应一个 token
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]')
+
+# 一张 detail=auto 的图片按高分辨率上限粗略估算
+IMAGE_TOKENS = 765
+# 每条消息的固定开销（角色标记等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_text_tokens(text):
+    """
+    在本地粗略估算一段文本的 token 数，不依赖分词器。
+
+    CJK 字符按每字 1 个 token 计算，其余字符按每 4 个字符 1 个 token 计算。
+    """
+    if not text:
+        return 0
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    other_count = len(text) - cjk_count
+    return cjk_count + (other_count + 3) // 4
+
+
+def estimate_message_tokens(messages):
+    """
+    估算 ChatGPT messages 列表的 token 数（包括文本和图片）。
+    """
+    total = 0
+    for msg in messages:
+        total += MESSAGE_OVERHEAD_TOKENS
+        content = msg.get('content')
+        if isinstance(content, str):
+            total += estimate_text_tokens(content)
+        elif isinstance(content, list):
+            for item in content:
+                if item.get('type') == 'text':
+                    total += estimate_text_tokens(item.get('text'))
+                elif item.get('type') == 'image_url':
+                    total += IMAGE_TOKENS
+    return total
@@ -0,0 +1,128 @@
+import sqlite3
+import logging
+import os
+import threading
+from dotenv import load_dotenv
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 连接级别的性能参数
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",        # 写入时不阻塞读取，同步进程和API请求可以并发
+    "PRAGMA synchronous = NORMAL",      # WAL 模式下 NORMAL 已能保证数据库一致性
+    "PRAGMA cache_size = -32000",       # 约32MB页缓存（负数表示KB）
+    "PRAGMA mmap_size = 268435456",     # 256MB 内存映射读取
+    "PRAGMA temp_store = MEMORY",
+)
+# 遇到写锁时的等待时间（秒）
+BUSY_TIMEOUT = 10
+# 每个数据库最多保留的空闲连接数
+MAX_IDLE_CONNECTIONS = 8
+
+
+class ConnectionManager:
+    """
+    进程级的SQLite连接管理器，每个数据库文件一个实例。
+
+    - 每个线程在使用期间独占一个连接，同一线程多次获取得到同一个连接；
+    - 线程用完后调用 release() 归还，连接进入空闲列表供后续线程复用，
+      避免每个请求都重新打开数据库和设置 PRAGMA；
+    - 表结构初始化（建表、迁移、索引）在每个进程中只执行一次。
+    """
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._idle = []
+        self._lock = threading.Lock()
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, db_path=None):
+        """
+        获取指定数据库文件的管理器实例；db_path 为空时使用 .env 中的 DB_PATH。
+        """
+        if db_path is None:
+            db_path = os.getenv("DB_PATH")
+            if db_path is None:
+                load_dotenv()
+                db_path = os.getenv("DB_PATH", "emails.db")
+        key = os.path.abspath(db_path)
+        with cls._instances_lock:
+            manager = cls._instances.get(key)
+            if manager is None:
+                manager = cls(db_path)
+                cls._instances[key] = manager
+            return manager
+
+    def _open(self):
+        """
+        打开一个新连接并设置 PRAGMA。连接可以在线程之间转移，但同一时间只由一个线程使用。
+        """
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        logging.info(f"成功打开数据库连接: {self.db_path}")
+        return conn
+
+    def connection(self):
+        """
+        返回当前线程的连接，没有则从空闲列表中取出或新建。
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = self._open()
+            self._local.conn = conn
+        return conn
+
+    def release(self):
+        """
+        归还当前线程的连接。未提交的事务会被回滚。
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+        self._local.conn = None
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error as e:
+            logging.warning(f"回滚未完成的事务失败，丢弃该连接: {e}")
+            conn.close()
+            return
+        with self._lock:
+            if len(self._idle) < MAX_IDLE_CONNECTIONS:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def ensure_schema(self, initializer):
+        """
+        在本进程中只执行一次表结构初始化。
+
+        Args:
+            initializer (callable): 完成建表、迁移等操作的无参函数。
+        """
+        if self._schema_ready:
+            return
+        with self._schema_lock:
+            if not self._schema_ready:
+                initializer()
+                self._schema_ready = True
+
+    def close_all(self):
+        """
+        关闭所有空闲连接以及当前线程的连接。
+        """
+        self.release()
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+        logging.info(f"已关闭数据库 {self.db_path} 的 {len(idle)} 个空闲连接。")
@@ -1,35 +1,91 @@
 import sqlite3
 import json
+import os
 import logging
 import re
-import os
-from dotenv import load_dotenv
+import hashlib
+import email.utils
+from datetime import timezone
+from backend.data_storage.connection_manager import ConnectionManager
+from backend.email_server.html_text_extractor import HTMLTextExtractor
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+def _analysis_field_sql(*paths):
+    """
+    生成从 analysis_json 中提取字段的SQL表达式，依次尝试简体/繁体等多个JSON路径。
+    """
+    extracts = ', '.join(f"json_extract(analysis_json, '{path}')" for path in paths)
+    return f"CASE WHEN json_valid(analysis_json) THEN COALESCE({extracts}) END"
+
+# 全文索引的列，与 emails 表中的同名列对应（外部内容表）。正文使用提取后的纯文本 body_text，
+# 而不是原始HTML，避免标签、样式和链接参数被索引
+FTS_COLUMNS = ('subject', 'from_name', 'from_email', 'body_text', 'analysis_markdown')
+# 回填 body_text 时每批处理的邮件数
+BODY_TEXT_BACKFILL_BATCH = 200
+
+# 紧急程度（兼容简体/繁体的分析结果）
+URGENCY_SQL = _analysis_field_sql('$."邮件紧急程度评估"[0]."- **紧急程度**"', '$."郵件緊急程度評估"[0]."- **緊急程度**"')
+
+# 邮件列表使用的轻量投影：不包含正文、分析Markdown和完整的分析JSON，
+# 紧急程度、分类和摘要标题直接在SQL中从 analysis_json 提取
+LIST_COLUMNS = f"""
+    id, subject, from_name, from_email, received_date, received_ts, mailbox, is_starred, is_read,
+    COALESCE(manually_marked_unread, 0) as manually_marked_unread,
+    {URGENCY_SQL} as urgency,
+    {_analysis_field_sql('$."邮件摘要"[0]."**邮件分类**"', '$."郵件摘要"[0]."**郵件分類**"')} as category,
+    {_analysis_field_sql('$."邮件摘要"[0]."**主题**"', '$."郵件摘要"[0]."**主題**"')} as summary_title
+"""
+
+# analysis_json 以紧凑格式存储，API 直接把存储的文本拼接进响应，不再逐行解析
+ANALYSIS_JSON_SEPARATORS = (',', ':')
+
+# 读取 analysis_json 时由SQLite校验，非法内容以空对象代替，保证可直接拼接
+ANALYSIS_JSON_COLUMN = "CASE WHEN json_valid(analysis_json) THEN analysis_json ELSE '{}' END"
+
+def dump_analysis_json(data):
+    """
+    将分析结果序列化为紧凑的JSON文本。
+    """
+    return json.dumps(data, ensure_ascii=False, separators=ANALYSIS_JSON_SEPARATORS)
+
 class EmailDataManager:
     """
     用于解析ChatGPT返回的Markdown文本，并将其与原始邮件数据一起存入SQLite数据库。
     """
     def __init__(self, db_path=None):
         """
-        初始化DataManager，连接到SQLite数据库并创建表。
+        初始化DataManager，从进程级连接管理器获取当前线程的数据库连接。
+        表结构初始化在每个进程中只执行一次。
         """
-        load_dotenv(override=True)
-        if db_path is None:
-            db_path = os.getenv("DB_PATH", "emails.db")
-
-        self.db_path = db_path
+        self.connection_manager = ConnectionManager.get(db_path)
+        self.db_path = self.connection_manager.db_path
         self.conn = None
         try:
-            self.conn = sqlite3.connect(self.db_path)
-            self._create_table()
-            self._migrate_schema() # 确保数据库结构是最新的
-            logging.info(f"成功连接到数据库: {self.db_path}")
+            self.conn = self.connection_manager.connection()
+            self.connection_manager.ensure_schema(self._initialize_schema)
         except sqlite3.Error as e:
             logging.error(f"数据库连接失败: {e}")
             raise
 
+    @classmethod
+    def initialize_database(cls, db_path=None):
+        """
+        在服务启动时完成表结构初始化并压缩变更日志，之后的请求只需为自己的查询付出开销。
+        """
+        manager = cls(db_path=db_path)
+        manager.compact_changes()
+        manager.close()
+
+    def _initialize_schema(self):
+        """
+        创建表、执行迁移并建立全文索引。
+        """
+        self._create_table()
+        self._migrate_schema() # 确保数据库结构是最新的
+        self._create_search_index()
+        logging.info(f"数据库结构初始化完成: {self.db_path}")
+
     def _create_table(self):
         """
         创建用于存储邮件数据的表。
@@ -43,15 +99,49 @@ class EmailDataManager:
                     from_name TEXT,
                     from_email TEXT,
                     received_date TEXT,
+                    received_ts INTEGER,
+                    message_id TEXT,
                     raw_email_body TEXT,
+                    body_text TEXT,
                     analysis_markdown TEXT,
                     analysis_json TEXT,
                     mailbox TEXT,
                     is_starred INTEGER DEFAULT 0,
                     is_read INTEGER DEFAULT 0,
+                    original_tokens INTEGER,
+                    compacted_tokens INTEGER,
+                    triage_route TEXT,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             """)
+            # 每个邮箱的增量同步检查点（IMAP UIDVALIDITY / UIDNEXT）
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS mailbox_sync_state (
+                    mailbox TEXT PRIMARY KEY,
+                    uidvalidity INTEGER NOT NULL,
+                    uidnext INTEGER NOT NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            # 单调递增的数据变更版本号，API据此生成ETag
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS db_meta (
+                    key TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                )
+            """)
+            cursor.execute("INSERT OR IGNORE INTO db_meta (key, value) VALUES ('change_version', 0)")
+            # 变更日志：每封邮件只保留最近一次变更，客户端据此增量更新列表
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS email_changes (
+                    email_id INTEGER PRIMARY KEY,
+                    version INTEGER NOT NULL,
+                    kind TEXT NOT NULL
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_email_changes_version ON email_changes (version)")
+            # 早于该版本的变更已被压缩，客户端需要重新加载完整列表
+            cursor.execute("INSERT OR IGNORE INTO db_meta (key, value) VALUES ('changes_floor', 0)")
             self.conn.commit()
             logging.info("表 'emails' 已成功创建或已存在。")
         except sqlite3.Error as e:
@@ -71,9 +161,169 @@ class EmailDataManager:
                 cursor.execute("ALTER TABLE emails ADD COLUMN manually_marked_unread BOOLEAN DEFAULT 0")
                 self.conn.commit()
                 logging.info("列 'manually_marked_unread' 添加成功。")
+            # 检查 'received_ts' 列（解析后的UTC时间戳）是否存在，并回填历史数据
+            if 'received_ts' not in columns:
+                logging.info("正在向 'emails' 表添加 'received_ts' 列...")
+                cursor.execute("ALTER TABLE emails ADD COLUMN received_ts INTEGER")
+                self.conn.commit()
+                logging.info("列 'received_ts' 添加成功。")
+            cursor.execute("SELECT id, received_date FROM emails WHERE received_ts IS NULL")
+            rows = cursor.fetchall()
+            if rows:
+                logging.info(f"正在为 {len(rows)} 封邮件回填 'received_ts'...")
+                cursor.executemany(
+                    "UPDATE emails SET received_ts = ? WHERE id = ?",
+                    [(self._parse_received_ts(date_str), email_id) for email_id, date_str in rows]
+                )
+                self.conn.commit()
+            # 检查 'message_id' 列是否存在；历史邮件没有保存原始 Message-ID，使用合成键回填
+            if 'message_id' not in columns:
+                logging.info("正在向 'emails' 表添加 'message_id' 列...")
+                cursor.execute("ALTER TABLE emails ADD COLUMN message_id TEXT")
+                self.conn.commit()
+                logging.info("列 'message_id' 添加成功。")
+            # 正文压缩前后的估算 token 数（历史邮件为空）
+            for column in ('original_tokens', 'compacted_tokens'):
+                if column not in columns:
+                    logging.info(f"正在向 'emails' 表添加 '{column}' 列...")
+                    cursor.execute(f"ALTER TABLE emails ADD COLUMN {column} INTEGER")
+                    self.conn.commit()
+            # 预分类的分流方式（历史邮件为空，视为完整分析）
+            if 'triage_route' not in columns:
+                logging.info("正在向 'emails' 表添加 'triage_route' 列...")
+                cursor.execute("ALTER TABLE emails ADD COLUMN triage_route TEXT")
+                self.conn.commit()
+            # 正文的纯文本（供全文索引和搜索使用），历史邮件从原始正文提取回填
+            if 'body_text' not in columns:
+                logging.info("正在向 'emails' 表添加 'body_text' 列...")
+                cursor.execute("ALTER TABLE emails ADD COLUMN body_text TEXT")
+                self.conn.commit()
+            self._backfill_body_text(cursor)
+            cursor.execute("SELECT id, subject, from_email, received_date FROM emails WHERE message_id IS NULL ORDER BY id")
+            rows = cursor.fetchall()
+            if rows:
+                logging.info(f"正在为 {len(rows)} 封邮件回填 'message_id'...")
+                cursor.execute("SELECT message_id FROM emails WHERE message_id IS NOT NULL")
+                seen = {row[0] for row in cursor.fetchall()}
+                updates = []
+                for email_id, subject, from_email, received_date in rows:
+                    key = self._fallback_message_id(subject, from_email, received_date)
+                    # 历史数据中可能已有重复邮件，为后出现的重复项加上ID后缀以满足唯一约束
+                    if key in seen:
+                        key = f"{key}#{email_id}"
+                    seen.add(key)
+                    updates.append((key, email_id))
+                cursor.executemany("UPDATE emails SET message_id = ? WHERE id = ?", updates)
+                self.conn.commit()
+
+            # 排序、分页和去重所依赖的索引
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_emails_mailbox_received ON emails (mailbox, received_ts)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_emails_received ON emails (received_ts)")
+            cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_emails_message_id ON emails (message_id)")
+            self.conn.commit()
+
+            # 将历史的 indent=4 格式 analysis_json 压缩存储，非法内容替换为空对象（只执行一次）
+            cursor.execute("SELECT 1 FROM db_meta WHERE key = 'analysis_json_compacted'")
+            if cursor.fetchone() is None:
+                logging.info("正在压缩历史邮件的 'analysis_json'...")
+                cursor.execute("""
+                    UPDATE emails
+                    SET analysis_json = CASE WHEN json_valid(analysis_json) THEN json(analysis_json) ELSE '{}' END
+                    WHERE analysis_json IS NULL OR NOT json_valid(analysis_json) OR analysis_json <> json(analysis_json)
+                """)
+                logging.info(f"已压缩 {cursor.rowcount} 条 'analysis_json'。")
+                cursor.execute("INSERT INTO db_meta (key, value) VALUES ('analysis_json_compacted', 1)")
+                self.conn.commit()
         except sqlite3.Error as e:
             logging.error(f"数据库迁移失败: {e}")
 
+    @staticmethod
+    def extract_body_text(body):
+        """
+        从原始正文（HTML或纯文本）中提取供全文索引使用的纯文本。
+        """
+        if not body:
+            return ''
+        try:
+            text, _ = HTMLTextExtractor().extract(body)
+        except Exception as e:
+            logging.warning(f"提取正文纯文本失败: {e}")
+            return ''
+        return text
+
+    def _backfill_body_text(self, cursor):
+        """
+        为没有 body_text 的历史邮件从原始正文提取纯文本，分批写入以限制内存占用。
+        """
+        cursor.execute("SELECT id FROM emails WHERE body_text IS NULL ORDER BY id")
+        email_ids = [row[0] for row in cursor.fetchall()]
+        if not email_ids:
+            return
+        logging.info(f"正在为 {len(email_ids)} 封邮件回填 'body_text'...")
+        for start in range(0, len(email_ids), BODY_TEXT_BACKFILL_BATCH):
+            chunk = email_ids[start:start + BODY_TEXT_BACKFILL_BATCH]
+            cursor.execute(
+                f"SELECT id, raw_email_body FROM emails WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+            )
+            updates = [(self.extract_body_text(body), email_id) for email_id, body in cursor.fetchall()]
+            cursor.executemany("UPDATE emails SET body_text = ? WHERE id = ?", updates)
+            self.conn.commit()
+
+    def _create_search_index(self):
+        """
+        创建 FTS5 全文索引（外部内容表，指向 emails）及维护索引的触发器。
+
+        使用 trigram 分词器，以支持中文等没有空格分词的文本的子串搜索。
+        索引首次创建或列定义变化（早期版本索引的是原始HTML正文）时会根据现有邮件重建。
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'emails_fts'")
+            row = cursor.fetchone()
+            index_exists = row is not None
+            if index_exists and 'raw_email_body' in row[0]:
+                logging.info("全文索引的列定义已变化，正在重建全文索引...")
+                cursor.executescript("""
+                    DROP TRIGGER IF EXISTS emails_fts_ai;
+                    DROP TRIGGER IF EXISTS emails_fts_ad;
+                    DROP TRIGGER IF EXISTS emails_fts_au;
+                    DROP TABLE emails_fts;
+                """)
+                index_exists = False
+
+            columns = ', '.join(FTS_COLUMNS)
+            new_values = ', '.join(f'new.{column}' for column in FTS_COLUMNS)
+            old_values = ', '.join(f'old.{column}' for column in FTS_COLUMNS)
+            cursor.execute(f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS emails_fts USING fts5(
+                    {columns},
+                    content='emails', content_rowid='id', tokenize='trigram'
+                )
+            """)
+            cursor.executescript(f"""
+                CREATE TRIGGER IF NOT EXISTS emails_fts_ai AFTER INSERT ON emails BEGIN
+                    INSERT INTO emails_fts(rowid, {columns})
+                    VALUES (new.id, {new_values});
+                END;
+                CREATE TRIGGER IF NOT EXISTS emails_fts_ad AFTER DELETE ON emails BEGIN
+                    INSERT INTO emails_fts(emails_fts, rowid, {columns})
+                    VALUES ('delete', old.id, {old_values});
+                END;
+                CREATE TRIGGER IF NOT EXISTS emails_fts_au
+                AFTER UPDATE OF {columns} ON emails BEGIN
+                    INSERT INTO emails_fts(emails_fts, rowid, {columns})
+                    VALUES ('delete', old.id, {old_values});
+                    INSERT INTO emails_fts(rowid, {columns})
+                    VALUES (new.id, {new_values});
+                END;
+            """)
+            if not index_exists:
+                logging.info("正在为现有邮件构建全文索引...")
+                cursor.execute("INSERT INTO emails_fts(emails_fts) VALUES ('rebuild')")
+            self.conn.commit()
+        except sqlite3.Error as e:
+            logging.error(f"创建全文索引失败: {e}")
+
     def _parse_from_address(self, from_string):
         """
         从 "Name <email@example.com>" 格式的字符串中提取姓名和邮箱地址。
@@ -90,25 +340,244 @@ class EmailDataManager:
         # 如果没有匹配到 < >，则假定整个字符串是邮箱地址
         return "", from_string
 
-    def email_exists(self, subject, from_email, received_date):
+    def _parse_received_ts(self, date_str):
         """
-        检查具有相同主题、发件人和接收日期的邮件是否已存在。
+        将 RFC 2822 格式的日期字符串解析为UTC时间戳（秒）。无法解析时返回 0，使其排在最后。
         """
+        if not date_str:
+            return 0
+        try:
+            parsed = email.utils.parsedate_to_datetime(date_str)
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=timezone.utc)
+            return int(parsed.timestamp())
+        except (TypeError, ValueError, IndexError, OverflowError):
+            logging.warning(f"无法解析邮件日期: '{date_str}'")
+            return 0
+
+    @staticmethod
+    def _fallback_message_id(subject, from_email, received_date):
+        """
+        为没有 Message-ID 的邮件（以及迁移前的历史邮件）生成稳定的合成键。
+        """
+        raw = f"{subject or ''}\x1f{from_email or ''}\x1f{received_date or ''}"
+        return f"<legacy-{hashlib.sha1(raw.encode('utf-8')).hexdigest()}@email-gpt>"
+
+    def _dedup_keys(self, message_id, subject, from_string, received_date):
+        """
+        返回一封邮件可能对应的去重键：原始 Message-ID（如果有）以及合成键。
+        合成键用于匹配没有 Message-ID 的邮件和迁移前入库的历史邮件。
+        """
+        _, from_email = self._parse_from_address(from_string)
+        keys = [self._fallback_message_id(subject, from_email, received_date)]
+        if message_id:
+            keys.insert(0, message_id.strip())
+        return keys
+
+    def message_key(self, email_data):
+        """
+        返回邮件入库时使用的去重键：原始 Message-ID，缺失时为合成键。批处理分析以此作为 custom_id。
+        """
+        return self._dedup_keys(
+            email_data.get('Message-ID'), email_data.get('Subject'), email_data.get('From'), email_data.get('Date')
+        )[0]
+
+    def email_exists(self, subject, from_email, received_date, message_id=None):
+        """
+        检查邮件是否已存在。优先按 Message-ID 判断，同时兼容按主题、发件人和接收日期生成的合成键。
+        查询走 message_id 唯一索引。
+        """
+        keys = [self._fallback_message_id(subject, from_email, received_date)]
+        if message_id:
+            keys.append(message_id.strip())
         try:
             cursor = self.conn.cursor()
-            cursor.execute("""
-                SELECT id FROM emails 
-                WHERE subject = ? AND from_email = ? AND received_date = ?
-            """, (subject, from_email, received_date))
+            cursor.execute(
+                f"SELECT 1 FROM emails WHERE message_id IN ({','.join('?' * len(keys))}) LIMIT 1",
+                keys
+            )
             return cursor.fetchone() is not None
         except sqlite3.Error as e:
             logging.error(f"查询邮件是否存在时出错: {e}")
             return False # 发生错误时，保守地返回False
 
-    def parse_markdown_to_json(self, markdown_text):
+    def filter_new_emails(self, headers):
+        """
+        批量检查邮件头列表，返回数据库中尚不存在的邮件。
+
+        Args:
+            headers (list): EmailFetcher.fetch_headers 返回的邮件头字典列表。
+
+        Returns:
+            list: 未入库的邮件头字典，保持原有顺序。
+        """
+        if not headers:
+            return []
+
+        header_keys = [
+            self._dedup_keys(h.get('Message-ID'), h.get('Subject'), h.get('From'), h.get('Date'))
+            for h in headers
+        ]
+        all_keys = list({key for keys in header_keys for key in keys})
+        existing = set()
+        try:
+            cursor = self.conn.cursor()
+            # SQLite 对单条语句的参数数量有限制，分批查询
+            for i in range(0, len(all_keys), 500):
+                chunk = all_keys[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                cursor.execute(f"SELECT message_id FROM emails WHERE message_id IN ({placeholders})", chunk)
+                existing.update(row[0] for row in cursor.fetchall())
+        except sqlite3.Error as e:
+            logging.error(f"批量查询邮件是否存在时出错: {e}")
+            return list(headers) # 发生错误时，保守地视为全部是新邮件
+
+        new_headers = []
+        for h, keys in zip(headers, header_keys):
+            if any(key in existing for key in keys):
+                logging.info(f"邮件 '{h.get('Subject')}' 已存在于数据库中，跳过。")
+            else:
+                new_headers.append(h)
+        return new_headers
+
+    def get_sync_state(self, mailbox):
+        """
+        获取指定邮箱上次同步保存的 UIDVALIDITY 和 UIDNEXT。
+
+        Returns:
+            dict | None: {'uidvalidity': int, 'uidnext': int}，从未同步过则返回 None。
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                "SELECT uidvalidity, uidnext FROM mailbox_sync_state WHERE mailbox = ?",
+                (mailbox,)
+            )
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return {"uidvalidity": row[0], "uidnext": row[1]}
+        except sqlite3.Error as e:
+            logging.error(f"读取邮箱 '{mailbox}' 的同步状态失败: {e}")
+            return None
+
+    def save_sync_state(self, mailbox, uidvalidity, uidnext):
+        """
+        保存指定邮箱的同步检查点，下次同步将从 uidnext 开始增量获取。
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("""
+                INSERT INTO mailbox_sync_state (mailbox, uidvalidity, uidnext, updated_at)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(mailbox) DO UPDATE SET
+                    uidvalidity = excluded.uidvalidity,
+                    uidnext = excluded.uidnext,
+                    updated_at = CURRENT_TIMESTAMP
+            """, (mailbox, uidvalidity, uidnext))
+            self.conn.commit()
+            logging.info(f"已保存邮箱 '{mailbox}' 的同步状态: UIDVALIDITY={uidvalidity}, UIDNEXT={uidnext}")
+        except sqlite3.Error as e:
+            logging.error(f"保存邮箱 '{mailbox}' 的同步状态失败: {e}")
+
+    def get_change_version(self):
+        """
+        获取当前的数据变更版本号。只读取 db_meta 中的一行，不访问 emails 表。
+
+        Returns:
+            int | None: 版本号；读取失败时返回 None。
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT value FROM db_meta WHERE key = 'change_version'")
+            row = cursor.fetchone()
+            return row[0] if row else 0
+        except sqlite3.Error as e:
+            logging.error(f"读取数据变更版本号失败: {e}")
+            return None
+
+    def _bump_change_version(self, cursor, email_ids, kind='update'):
+        """
+        在当前事务中递增数据变更版本号，并在变更日志中记录受影响的邮件，需与对应的写操作一起提交。
+
+        Args:
+            cursor: 当前事务使用的游标。
+            email_ids (list): 受影响的邮件ID。
+            kind (str): 变更类型，'insert' 或 'update'。
+
+        Returns:
+            int: 新的版本号。
+        """
+        cursor.execute("UPDATE db_meta SET value = value + 1 WHERE key = 'change_version'")
+        cursor.execute("SELECT value FROM db_meta WHERE key = 'change_version'")
+        version = cursor.fetchone()[0]
+        cursor.executemany("""
+            INSERT INTO email_changes (email_id, version, kind) VALUES (?, ?, ?)
+            ON CONFLICT(email_id) DO UPDATE SET version = excluded.version, kind = excluded.kind
+        """, [(email_id, version, kind) for email_id in email_ids])
+        return version
+
+    def get_changes(self, since, mailbox_filter=None):
+        """
+        获取版本号 since 之后发生变更的邮件（列表投影）。
+
+        Args:
+            since (int): 客户端已知的版本号。
+            mailbox_filter (str): 可选，只返回指定邮箱的邮件。
+
+        Returns:
+            dict: {'version': 当前版本号, 'reset': 是否需要重新加载完整列表, 'changes': [邮件字典]}。
+                每个邮件字典额外包含 change_kind 字段（该邮件最近一次变更的类型），
+                客户端应按ID插入或替换。
+        """
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT key, value FROM db_meta WHERE key IN ('change_version', 'changes_floor')")
+        meta = dict(cursor.fetchall())
+        version, floor = meta.get('change_version', 0), meta.get('changes_floor', 0)
+        if since < floor:
+            return {"version": version, "reset": True, "changes": []}
+
+        where, params = ["c.version > ?"], [since]
+        if mailbox_filter:
+            where.append("e.mailbox = ?")
+            params.append(mailbox_filter)
+        rows = self.execute_query(f"""
+            SELECT {LIST_COLUMNS}, c.kind as change_kind
+            FROM email_changes c JOIN emails e ON e.id = c.email_id
+            WHERE {' AND '.join(where)}
+            ORDER BY c.version
+        """, params)
+        return {"version": version, "reset": False, "changes": rows}
+
+    def compact_changes(self, keep_versions=None):
+        """
+        压缩变更日志：删除早于最近 keep_versions 个版本的记录，并相应提高 changes_floor。
+        已知版本低于 changes_floor 的客户端会收到 reset，重新加载完整列表。
+        """
+        if keep_versions is None:
+            keep_versions = int(os.getenv("CHANGELOG_KEEP_VERSIONS", 5000))
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT value FROM db_meta WHERE key = 'change_version'")
+            floor = cursor.fetchone()[0] - keep_versions
+            if floor <= 0:
+                return 0
+            cursor.execute("DELETE FROM email_changes WHERE version <= ?", (floor,))
+            deleted = cursor.rowcount
+            cursor.execute("UPDATE db_meta SET value = MAX(value, ?) WHERE key = 'changes_floor'", (floor,))
+            self.conn.commit()
+            if deleted:
+                logging.info(f"已压缩变更日志，删除 {deleted} 条早于版本 {floor} 的记录。")
+            return deleted
+        except sqlite3.Error as e:
+            logging.error(f"压缩变更日志失败: {e}")
+            return 0
+
+    @staticmethod
+    def parse_markdown_to_json(markdown_text):
         """
         将特定格式的Markdown文本解析为JSON对象。
-        使用正则表达式来提取各个部分。
+        使用正则表达式来提取各个部分。不依赖数据库连接，流式分析时也用于逐章节解析。
         """
         if not markdown_text:
             return "{}"
@@ -159,55 +628,85 @@ class EmailDataManager:
             
             data[section_key] = items
 
-        return json.dumps(data, ensure_ascii=False, indent=4)
+        return dump_analysis_json(data)
 
     def save_email_data(self, email_data, analysis_markdown, mailbox):
         """
         将邮件数据、分析结果（Markdown和JSON）存入数据库。
+        Message-ID 已存在时不会重复插入。
 
         Args:
-            email_data (dict): 包含 'From', 'Subject', 'Date', 'Body' 的邮件字典。
+            email_data (dict): 包含 'From', 'Subject', 'Date', 'Body'，以及可选 'Message-ID'、
+                'text_content'（解析阶段提取的纯文本，缺省时从 'Body' 提取，用于全文索引）、
+                'original_tokens'、'compacted_tokens'（正文压缩前后的估算 token 数）、
+                'triage_route'（预分类的分流方式）的邮件字典。
             analysis_markdown (str): ChatGPT返回的Markdown格式分析结果。
             mailbox (str): 邮件所属的邮箱名称。
+
+        Returns:
+            int | None: 新插入邮件的ID；邮件已存在时返回 None。
+
+        Raises:
+            Exception: 解析或写入失败时回滚并重新抛出，调用方据此把邮件计为失败（不推进同步检查点）。
         """
         try:
             analysis_json = self.parse_markdown_to_json(analysis_markdown)
             
             cursor = self.conn.cursor()
             from_name, from_email = self._parse_from_address(email_data.get('From'))
+            message_id = self.message_key(email_data)
 
             cursor.execute("""
-                INSERT INTO emails (subject, from_name, from_email, received_date, raw_email_body, analysis_markdown, analysis_json, mailbox)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                INSERT INTO emails (subject, from_name, from_email, received_date, received_ts, message_id, raw_email_body, body_text, analysis_markdown, analysis_json, mailbox,
+                                    original_tokens, compacted_tokens, triage_route)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(message_id) DO NOTHING
             """, (
                 email_data.get('Subject'),
                 from_name,
                 from_email,
                 email_data.get('Date'),
+                self._parse_received_ts(email_data.get('Date')),
+                message_id,
                 email_data.get('Body'),
+                email_data['text_content'] if 'text_content' in email_data else self.extract_body_text(email_data.get('Body')),
                 analysis_markdown,
                 analysis_json,
-                mailbox
+                mailbox,
+                email_data.get('original_tokens'),
+                email_data.get('compacted_tokens'),
+                email_data.get('triage_route')
             ))
+            if cursor.rowcount == 0:
+                self.conn.commit()
+                logging.info(f"邮件 '{email_data.get('Subject')}' 已存在于数据库中，未重复存储。")
+                return None
+            email_id = cursor.lastrowid
+            self._bump_change_version(cursor, [email_id], kind='insert')
             self.conn.commit()
             logging.info(f"成功将邮件 '{email_data.get('Subject')}' 的数据存入数据库。")
+            return email_id
         except sqlite3.Error as e:
             logging.error(f"数据存储失败: {e}")
+            self.conn.rollback()
+            raise
         except Exception as e:
             logging.error(f"解析或存储过程中发生错误: {e}")
+            self.conn.rollback()
+            raise
 
     def get_email_by_id(self, email_id):
         """
         根据邮件ID获取单个邮件的完整数据。
         """
         try:
-            self.conn.row_factory = sqlite3.Row
             cursor = self.conn.cursor()
+            cursor.row_factory = sqlite3.Row
             # 使用 COALESCE 确保即使列刚被添加（值为NULL），也能返回一个默认值
-            cursor.execute("""
-                SELECT id, subject, from_name, from_email, received_date, 
-                       raw_email_body, analysis_markdown, analysis_json, mailbox, is_starred, is_read,
-                       COALESCE(manually_marked_unread, 0) as manually_marked_unread
+            cursor.execute(f"""
+                SELECT {LIST_COLUMNS},
+                       raw_email_body, analysis_markdown, {ANALYSIS_JSON_COLUMN} as analysis_json,
+                       original_tokens, compacted_tokens, triage_route
                 FROM emails WHERE id = ?
             """, (email_id,))
             row = cursor.fetchone()
@@ -215,16 +714,40 @@ class EmailDataManager:
         except sqlite3.Error as e:
             logging.error(f"获取邮件 ID: {email_id} 失败: {e}")
             return None
-        finally:
-            self.conn.row_factory = None # 确保在任何情况下都重置 row_factory
+
+    def get_email_summary(self, email_id):
+        """
+        获取单封邮件的列表投影（与 list_emails 返回的字段相同）。
+        """
+        rows = self.execute_query(f"SELECT {LIST_COLUMNS} FROM emails WHERE id = ?", (email_id,))
+        return rows[0] if rows else None
+
+    def get_triage_training_rows(self, limit):
+        """
+        返回预分类器的训练数据：最近 limit 封经模型分析的邮件的 (发件人名称, 发件人地址, 主题, 分类)。
+        本地模板生成的分析结果不包含在内。
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(f"""
+                SELECT from_name, from_email, subject,
+                       {_analysis_field_sql('$."邮件摘要"[0]."**邮件分类**"', '$."郵件摘要"[0]."**郵件分類**"')} as category
+                FROM emails
+                WHERE triage_route IS NULL OR triage_route <> 'template'
+                ORDER BY id DESC LIMIT ?
+            """, (limit,))
+            return [row for row in cursor.fetchall() if row[3]]
+        except sqlite3.Error as e:
+            logging.error(f"读取预分类训练数据失败: {e}")
+            return []
 
     def get_all_emails(self, mailbox_filter=None):
         """
         获取所有邮件数据，可选择按邮箱过滤。
         """
         try:
-            self.conn.row_factory = sqlite3.Row
             cursor = self.conn.cursor()
+            cursor.row_factory = sqlite3.Row
             
             base_query = """
                 SELECT id, subject, from_name, from_email, received_date, 
@@ -234,9 +757,9 @@ class EmailDataManager:
             """
 
             if mailbox_filter:
-                cursor.execute(base_query + "WHERE mailbox = ? ORDER BY received_date DESC", (mailbox_filter,))
+                cursor.execute(base_query + "WHERE mailbox = ? ORDER BY received_ts DESC, id DESC", (mailbox_filter,))
             else:
-                cursor.execute(base_query + "ORDER BY received_date DESC")
+                cursor.execute(base_query + "ORDER BY received_ts DESC, id DESC")
 
             rows = cursor.fetchall()
             # 将 Row 对象转换为字典列表
@@ -244,36 +767,83 @@ class EmailDataManager:
         except sqlite3.Error as e:
             logging.error(f"获取所有邮件失败: {e}")
             return []
-        finally:
-            self.conn.row_factory = None
+
+    def list_emails(self, mailbox_filter=None, limit=50, cursor=None, include_analysis=False):
+        """
+        按接收时间倒序分页获取邮件列表的轻量投影（不含正文和分析全文）。
+
+        使用 (received_ts, id) 作为键集分页游标，翻页开销与页码无关。
+
+        Args:
+            mailbox_filter (str): 可选，只返回指定邮箱的邮件。
+            limit (int): 每页邮件数。
+            cursor (str): 上一页返回的 next_cursor，格式为 "<received_ts>:<id>"；为空表示第一页。
+            include_analysis (bool): 是否同时返回已校验的 analysis_json 文本。
+
+        Returns:
+            tuple: (邮件字典列表, next_cursor)。没有更多数据时 next_cursor 为 None。
+        """
+        where, params = [], []
+        if mailbox_filter:
+            where.append("mailbox = ?")
+            params.append(mailbox_filter)
+        if cursor:
+            cursor_ts, cursor_id = self.parse_cursor(cursor)
+            where.append("(received_ts < ? OR (received_ts = ? AND id < ?))")
+            params.extend([cursor_ts, cursor_ts, cursor_id])
+
+        columns = LIST_COLUMNS + (f", {ANALYSIS_JSON_COLUMN} as analysis_json" if include_analysis else '')
+        query = f"""
+            SELECT {columns}
+            FROM emails
+            {'WHERE ' + ' AND '.join(where) if where else ''}
+            ORDER BY received_ts DESC, id DESC
+            LIMIT ?
+        """
+        rows = self.execute_query(query, params + [limit + 1])
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = f"{rows[-1]['received_ts']}:{rows[-1]['id']}"
+        return rows, next_cursor
+
+    @staticmethod
+    def parse_cursor(cursor):
+        """
+        解析 "<received_ts>:<id>" 格式的分页游标。格式错误时抛出 ValueError。
+        """
+        ts_part, _, id_part = str(cursor).partition(':')
+        return int(ts_part), int(id_part)
 
     def execute_query(self, query, params=()):
         """
         执行一个原始的SQL查询并返回结果。
         """
         try:
-            self.conn.row_factory = sqlite3.Row
             cursor = self.conn.cursor()
+            cursor.row_factory = sqlite3.Row
             cursor.execute(query, params)
             rows = cursor.fetchall()
             return [dict(row) for row in rows]
         except sqlite3.Error as e:
             logging.error(f"执行查询失败: {query} with params {params}. Error: {e}")
             return []
-        finally:
-            self.conn.row_factory = None
 
     def update_analysis_data(self, email_id, new_markdown, new_json):
         """
         根据邮件ID更新 analysis_markdown 和 analysis_json 字段。
+        new_json 由SQLite校验并压缩后存储，非法JSON存为空对象。
         """
         try:
             cursor = self.conn.cursor()
             cursor.execute("""
                 UPDATE emails
-                SET analysis_markdown = ?, analysis_json = ?
+                SET analysis_markdown = ?,
+                    analysis_json = CASE WHEN json_valid(?) THEN json(?) ELSE '{}' END
                 WHERE id = ?
-            """, (new_markdown, new_json, email_id))
+            """, (new_markdown, new_json, new_json, email_id))
+            if cursor.rowcount:
+                self._bump_change_version(cursor, [email_id])
             self.conn.commit()
             logging.info(f"成功更新邮件 ID: {email_id} 的分析数据。")
         except sqlite3.Error as e:
@@ -290,7 +860,8 @@ class EmailDataManager:
 
         try:
             cursor = self.conn.cursor()
-            
+            changed = 0
+
             if is_read is not None:
                 # 如果 is_read 发生变化，则同时更新 is_read 和 manually_marked_unread
                 manually_marked_unread = not is_read  # True if marking as unread, False if marking as read
@@ -298,6 +869,7 @@ class EmailDataManager:
                     "UPDATE emails SET is_read = ?, manually_marked_unread = ? WHERE id = ?",
                     (is_read, manually_marked_unread, email_id)
                 )
+                changed += cursor.rowcount
                 logging.info(f"更新邮件 {email_id}: is_read={is_read}, manually_marked_unread={manually_marked_unread}")
 
             if is_starred is not None:
@@ -306,13 +878,86 @@ class EmailDataManager:
                     "UPDATE emails SET is_starred = ? WHERE id = ?",
                     (is_starred, email_id)
                 )
+                changed += cursor.rowcount
                 logging.info(f"更新邮件 {email_id}: is_starred={is_starred}")
 
+            if changed:
+                self._bump_change_version(cursor, [email_id])
             self.conn.commit()
             logging.info(f"成功更新邮件 ID: {email_id} 的状态。")
         except sqlite3.Error as e:
             logging.error(f"更新邮件 ID: {email_id} 状态失败: {e}")
 
+    def bulk_update_status(self, email_ids=None, filters=None, is_starred=None, is_read=None):
+        """
+        批量更新邮件的星标或已读状态，所有更新在一个事务中用一次 executemany 完成。
+
+        Args:
+            email_ids (list): 要更新的邮件ID列表；与 filters 至少提供一个，同时提供时取交集。
+            filters (dict): 可选的筛选条件，支持 mailbox、from_ts、to_ts（received_ts 的
+                [from_ts, to_ts) 区间，Unix 时间戳）和 urgency。
+            is_starred (bool): 新的星标状态，None 表示不修改。
+            is_read (bool): 新的已读状态，None 表示不修改；同时会更新 manually_marked_unread。
+
+        Returns:
+            dict: {'ids': 实际发生变化的邮件ID列表, 'version': 更新后的数据变更版本号}。
+        """
+        filters = filters or {}
+        where, params = [], []
+        if email_ids is not None:
+            where.append(f"id IN ({','.join('?' * len(email_ids))})")
+            params.extend(email_ids)
+        if filters.get('mailbox'):
+            where.append("mailbox = ?")
+            params.append(filters['mailbox'])
+        if filters.get('from_ts') is not None:
+            where.append("received_ts >= ?")
+            params.append(int(filters['from_ts']))
+        if filters.get('to_ts') is not None:
+            where.append("received_ts < ?")
+            params.append(int(filters['to_ts']))
+        if filters.get('urgency'):
+            where.append(f"{URGENCY_SQL} = ?")
+            params.append(filters['urgency'])
+
+        # 只更新状态确实会变化的邮件，避免无意义的写入和变更记录；
+        # 比较和写入使用同一个归一化后的值，两者不会因类型不同而不一致
+        changes, assignments = [], []
+        if is_read is not None:
+            is_read = bool(is_read)
+            changes.append("is_read IS NOT ?")
+            params.append(is_read)
+            assignments.append(("is_read = ?", is_read))
+            assignments.append(("manually_marked_unread = ?", not is_read))
+        if is_starred is not None:
+            is_starred = bool(is_starred)
+            changes.append("is_starred IS NOT ?")
+            params.append(is_starred)
+            assignments.append(("is_starred = ?", is_starred))
+        where.append(f"({' OR '.join(changes)})")
+
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(f"SELECT id FROM emails WHERE {' AND '.join(where)}", params)
+            affected = [row[0] for row in cursor.fetchall()]
+            if not affected:
+                return {"ids": [], "version": self.get_change_version()}
+
+            set_clause = ', '.join(clause for clause, _ in assignments)
+            values = tuple(value for _, value in assignments)
+            cursor.executemany(
+                f"UPDATE emails SET {set_clause} WHERE id = ?",
+                [values + (email_id,) for email_id in affected]
+            )
+            version = self._bump_change_version(cursor, affected)
+            self.conn.commit()
+            logging.info(f"批量更新了 {len(affected)} 封邮件的状态: is_read={is_read}, is_starred={is_starred}")
+            return {"ids": affected, "version": version}
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logging.error(f"批量更新邮件状态失败: {e}")
+            raise
+
     def update_email_urgency(self, email_id, new_urgency):
         """
         更新指定邮件的紧急程度。
@@ -353,7 +998,7 @@ class EmailDataManager:
                 # 设置值
                 analysis_data[urgency_keys[0]][0][urgency_field_keys[0]] = new_urgency
 
-            new_json_str = json.dumps(analysis_data, ensure_ascii=False, indent=4)
+            new_json_str = dump_analysis_json(analysis_data)
 
             # 2. 更新 analysis_markdown
             analysis_markdown = email.get('analysis_markdown', '')
@@ -382,11 +1027,11 @@ class EmailDataManager:
 
     def close(self):
         """
-        关闭数据库连接。
+        将数据库连接归还给连接管理器，供后续请求复用。
         """
         if self.conn:
-            self.conn.close()
-            logging.info("数据库连接已关闭。")
+            self.connection_manager.release()
+            self.conn = None
 
 if __name__ == '__main__':
     # 这是一个简单的测试用例
@@ -0,0 +1,40 @@
+import json
+
+# 直接以原始文本拼接进响应的字段（数据库中已校验过的JSON）
+RAW_JSON_FIELDS = ('analysis_json',)
+
+
+def dumps_row(row, raw_fields=RAW_JSON_FIELDS):
+    """
+    将一行数据序列化为JSON对象文本。
+
+    raw_fields 中的字段被视为已校验的JSON文本，原样拼接进输出，
+    不经过 json.loads / json.dumps 的往返。
+
+    Args:
+        row (dict): 数据库行（字段名到值的字典）。
+        raw_fields (tuple): 需要原样拼接的字段名。
+
+    Returns:
+        str: JSON对象文本。
+    """
+    plain = {}
+    raw_parts = []
+    for key, value in row.items():
+        if key in raw_fields:
+            raw_parts.append(json.dumps(key) + ':' + (value or '{}'))
+        else:
+            plain[key] = value
+
+    body = json.dumps(plain, ensure_ascii=False, separators=(',', ':'))
+    if not raw_parts:
+        return body
+    separator = ',' if plain else ''
+    return body[:-1] + separator + ','.join(raw_parts) + '}'
+
+
+def dumps_rows(rows, raw_fields=RAW_JSON_FIELDS):
+    """
+    将多行数据序列化为JSON数组文本。
+    """
+    return '[' + ','.join(dumps_row(row, raw_fields) for row in rows) + ']'
@@ -0,0 +1,153 @@
+import sqlite3
+import logging
+import re
+import os
+import sys
+# 将项目根目录添加到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.data_storage.email_data_manager import EmailDataManager, LIST_COLUMNS
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 搜索前缀与 FTS5 列的对应关系，与前端 SearchBar.js 中的快捷指令保持一致
+PREFIX_COLUMNS = {
+    'from': ['from_name', 'from_email'],
+    'subject': ['subject'],
+    'body': ['body_text'],
+    'analysis': ['analysis_markdown'],
+}
+
+# bm25 各列权重，顺序与 emails_fts 的列定义一致：
+# subject, from_name, from_email, body_text, analysis_markdown
+BM25_WEIGHTS = (10.0, 5.0, 5.0, 1.0, 2.0)
+
+# trigram 分词器只能匹配不少于3个字符的词
+MIN_TRIGRAM_LENGTH = 3
+# 过短的词退回 LIKE 子串匹配时检查的列：只查提取后的纯文本，不查原始HTML
+LIKE_COLUMNS = ['subject', 'from_name', 'from_email', 'body_text', 'analysis_markdown']
+
+
+class EmailSearcher:
+    """
+    基于 SQLite FTS5 全文索引的邮件搜索，结果按 BM25 相关度排序。
+
+    支持的查询语法:
+        关键词              在所有字段中搜索
+        /from:关键词        按发件人（姓名或邮箱）搜索
+        /subject:关键词     按主题搜索
+        /body:关键词        按正文搜索
+        /analysis:关键词    按分析内容搜索
+        /starred [关键词]   只看星标邮件
+
+    少于3个字符的词无法使用 trigram 索引，退回到对主题、发件人、正文纯文本和分析内容的 LIKE 子串匹配。
+    只有短词时需要扫描全表（受 mailbox、星标条件限制），和长词一起使用时只在全文索引的匹配结果中过滤。
+    """
+    def __init__(self, db_path=None):
+        """
+        初始化EmailSearcher，复用 EmailDataManager 的连接（同时确保索引已创建）。
+        """
+        self.data_manager = EmailDataManager(db_path=db_path)
+        self.conn = self.data_manager.conn
+
+    def parse_query(self, query):
+        """
+        解析查询字符串。
+
+        Returns:
+            tuple: (columns, terms, starred_only)，columns 为 None 表示搜索所有字段。
+        """
+        query = (query or '').strip()
+        columns = None
+        starred_only = False
+
+        if query.lower().startswith('/starred'):
+            starred_only = True
+            query = query[len('/starred'):].strip()
+        else:
+            match = re.match(r'^/(\w+):(.*)$', query, flags=re.DOTALL)
+            if match and match.group(1).lower() in PREFIX_COLUMNS:
+                columns = PREFIX_COLUMNS[match.group(1).lower()]
+                query = match.group(2).strip()
+
+        terms = [t for t in query.split() if t]
+        return columns, terms, starred_only
+
+    def _build_match_expression(self, columns, terms):
+        """
+        将关键词构造成 FTS5 MATCH 表达式，每个词作为短语并以 AND 连接。
+        """
+        phrases = ' AND '.join('"' + term.replace('"', '""') + '"' for term in terms)
+        if columns:
+            return '{' + ' '.join(columns) + '} : (' + phrases + ')'
+        return phrases
+
+    def search(self, query, mailbox=None, limit=50):
+        """
+        搜索邮件。
+
+        Args:
+            query (str): 查询字符串，支持上述前缀语法。
+            mailbox (str): 可选，只搜索指定邮箱中的邮件。
+            limit (int): 最多返回的结果数。
+
+        Returns:
+            list: 邮件列表投影（与 /api/emails 相同的字段），按相关度（无关键词时按接收时间倒序）排序。
+        """
+        columns, terms, starred_only = self.parse_query(query)
+        if not terms and not starred_only:
+            return []
+
+        where, params = [], []
+        if starred_only:
+            where.append("is_starred = 1")
+        if mailbox:
+            where.append("mailbox = ?")
+            params.append(mailbox)
+
+        long_terms = [t for t in terms if len(t) >= MIN_TRIGRAM_LENGTH]
+        short_terms = [t for t in terms if len(t) < MIN_TRIGRAM_LENGTH]
+        # 过短的词无法使用 trigram 索引，退回到对相应列的 LIKE 匹配
+        like_columns = columns or LIKE_COLUMNS
+        for term in short_terms:
+            escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            where.append('(' + ' OR '.join(f"{c} LIKE ? ESCAPE '\\'" for c in like_columns) + ')')
+            params.extend([f'%{escaped}%'] * len(like_columns))
+
+        try:
+            cursor = self.conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            if long_terms:
+                # 在子查询中完成全文匹配和打分，外层只暴露 emails 的列，避免与 FTS 表列名冲突
+                sql = f"""
+                    SELECT {LIST_COLUMNS}
+                    FROM emails JOIN (
+                        SELECT rowid AS match_id,
+                               bm25(emails_fts, {', '.join(str(w) for w in BM25_WEIGHTS)}) AS rank
+                        FROM emails_fts WHERE emails_fts MATCH ?
+                    ) matches ON emails.id = matches.match_id
+                    {'WHERE ' + ' AND '.join(where) if where else ''}
+                    ORDER BY matches.rank
+                    LIMIT ?
+                """
+                cursor.execute(sql, [self._build_match_expression(columns, long_terms)] + params + [limit])
+            else:
+                sql = f"""
+                    SELECT {LIST_COLUMNS}
+                    FROM emails
+                    {'WHERE ' + ' AND '.join(where) if where else ''}
+                    ORDER BY received_ts DESC, id DESC
+                    LIMIT ?
+                """
+                cursor.execute(sql, params + [limit])
+            results = [dict(row) for row in cursor.fetchall()]
+            logging.info(f"搜索 '{query}' 返回 {len(results)} 条结果。")
+            return results
+        except sqlite3.Error as e:
+            logging.error(f"搜索邮件失败: {query}. Error: {e}")
+            return []
+
+    def close(self):
+        """
+        关闭数据库连接。
+        """
+        self.data_manager.close()
@@ -1,9 +1,15 @@
 import os
 import imaplib
 import email
+import email.header
+import re
+import select
+import time
+from collections import deque
 from dotenv import load_dotenv
 import logging
 from datetime import datetime, timedelta
+import codecs
 import chardet # 导入 chardet 库
 from backend.email_server.email_processor import EmailProcessor
 from backend.chatgpt_handlers.email_analyzer import EmailAnalyzer
@@ -13,6 +19,83 @@ from backend.email_server.email_name_decode import IMAP_UTF7_Decoder # 导入解
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# 编码检测只取正文开头的这些字节，避免对大型HTML邮件整体运行 chardet
+CHARSET_DETECT_SAMPLE_BYTES = 16 * 1024
+NON_ASCII_PATTERN = re.compile(rb'[\x80-\xff]')
+
+# 常见编码（以 codecs 规范名表示）与其超集的对应关系：
+# 邮件中标注为 gb2312 的内容经常包含 GBK 字符，big5、euc-kr、shift_jis 同理
+CHARSET_SUPERSETS = {
+    'gb2312': 'gb18030',
+    'gbk': 'gb18030',
+    'big5': 'big5hkscs',
+    'euc_kr': 'cp949',
+    'shift_jis': 'cp932',
+    'iso8859-1': 'cp1252',
+}
+
+# 单字节编码几乎能“成功”解码任何字节，这类声明常被误用于UTF-8内容，需要先尝试UTF-8
+WEAK_CHARSETS = {'ascii', 'cp1252'}
+
+def _normalize_charset(name):
+    """
+    将编码名转换为 codecs 规范名并替换为其超集；未知编码和 base64、hex、rot13 等非文本编解码器返回 None。
+    """
+    try:
+        codec = codecs.lookup(name.strip().strip('"'))
+    except LookupError:
+        return None
+    if not getattr(codec, '_is_text_encoding', True):
+        return None
+    return CHARSET_SUPERSETS.get(codec.name, codec.name)
+
+def decode_text_payload(payload, declared_charset=None):
+    """
+    将MIME文本部分的字节解码为字符串。
+
+    依次尝试：
+    1. 声明的编码（合法且能严格解码时直接采用；单字节编码先尝试UTF-8）；
+    2. 严格的UTF-8；
+    3. 从第一个非ASCII字节起取 CHARSET_DETECT_SAMPLE_BYTES 字节运行 chardet 检测；
+    4. UTF-8（替换无法解码的字符）。
+
+    Args:
+        payload (bytes): 已完成传输编码（base64 / quoted-printable）解码的字节。
+        declared_charset (str): Content-Type 中声明的 charset，可为 None。
+
+    Returns:
+        str: 解码后的文本。
+    """
+    if not payload:
+        return ""
+
+    charset = _normalize_charset(declared_charset) if declared_charset else None
+    if declared_charset and charset is None:
+        logging.warning(f"邮件声明了未知或不是文本编码的 charset: {declared_charset}")
+
+    if charset and charset not in WEAK_CHARSETS:
+        try:
+            return payload.decode(charset)
+        except UnicodeDecodeError:
+            logging.info(f"按声明的编码 {declared_charset} 解码失败，尝试其他编码。")
+
+    try:
+        return payload.decode('utf-8')
+    except UnicodeDecodeError:
+        pass
+
+    if charset == 'cp1252':
+        return payload.decode(charset, errors='replace')
+
+    # 纯ASCII的开头（如HTML头部和样式）对检测没有帮助，从第一个非ASCII字节开始取样
+    first_non_ascii = NON_ASCII_PATTERN.search(payload)
+    start = first_non_ascii.start() if first_non_ascii else 0
+    detected = chardet.detect(payload[start:start + CHARSET_DETECT_SAMPLE_BYTES])['encoding']
+    detected_charset = _normalize_charset(detected) if detected else None
+    if detected_charset:
+        return payload.decode(detected_charset, errors='replace')
+    return payload.decode('utf-8', errors='replace')
+
 class EmailFetcher:
     """
     用于连接IMAP服务器并获取邮件的类。
@@ -28,6 +111,8 @@ class EmailFetcher:
         self.username = os.getenv("IMAP_USERNAME")
         self.password = os.getenv("IMAP_PASSWORD")
         self.mailbox_name = os.getenv("MAILBOX", "INBOX") # 从环境变量加载mailbox，默认为INBOX
+        self.fetch_batch_size = int(os.getenv("FETCH_BATCH_SIZE", 20)) # 每次FETCH请求包含的邮件数
+        self.fetch_batch_max_bytes = int(os.getenv("FETCH_BATCH_MAX_BYTES", 5 * 1024 * 1024)) # 每次FETCH请求的字节上限
         self.mail = None
         self.decoder = IMAP_UTF7_Decoder() # 实例化解码器
         logging.info("EmailFetcher 初始化完成，配置已加载。")
@@ -51,6 +136,10 @@ class EmailFetcher:
 
         Returns:
             dict: 包含邮箱名称映射的字典，键为原始邮箱名，值为解码后的邮箱名。
+
+        Raises:
+            imaplib.IMAP4.error / OSError: LIST 命令失败或连接出错。异常不在这里吞掉，
+                以便连接池把该连接作为损坏连接丢弃。
         """
         if not self.mail:
             logging.warning("IMAP连接未建立，请先调用connect()方法。")
@@ -60,8 +149,7 @@ class EmailFetcher:
             logging.info("正在获取邮箱列表...")
             status, mailbox_list = self.mail.list()
             if status != 'OK':
-                logging.error(f"获取邮箱列表失败: {status}")
-                return {}
+                raise imaplib.IMAP4.error(f"获取邮箱列表失败: {status}")
 
             mailboxes_map = {}
             for item in mailbox_list:
@@ -95,7 +183,327 @@ class EmailFetcher:
             return mailboxes_map
         except Exception as e:
             logging.error(f"获取邮箱列表时发生错误: {e}")
-            return {}
+            raise
+
+    def _encode_mailbox(self, mailbox):
+        """
+        将邮箱名编码为IMAP兼容的UTF-7格式。
+        """
+        # IMAP协议的邮箱名通常需要以UTF-7编码，或者更准确地说是IMAP的修改UTF-7规范
+        # Python的imaplib库在处理非ASCII邮箱名时，需要进行此编码
+        return mailbox.encode('utf-7').decode('ascii')
+
+    def select_mailbox(self, mailbox="INBOX"):
+        """
+        选择邮箱，并返回其 UIDVALIDITY 和 UIDNEXT。
+
+        Returns:
+            dict | None: {'uidvalidity': int|None, 'uidnext': int|None}，选择失败时返回 None。
+        """
+        if not self.mail:
+            logging.warning("IMAP连接未建立，请先调用connect()方法。")
+            return None
+
+        encoded_mailbox = self._encode_mailbox(mailbox)
+        logging.info(f"选择邮箱: {mailbox}")
+        status, _ = self.mail.select(encoded_mailbox)
+        if status != 'OK':
+            logging.error(f"选择邮箱失败: {status}")
+            return None
+
+        info = {
+            "uidvalidity": self._untagged_int('UIDVALIDITY'),
+            "uidnext": self._untagged_int('UIDNEXT'),
+        }
+        # 部分服务器在 SELECT 响应中不返回 UIDNEXT，此时回退到 STATUS 命令
+        if info["uidvalidity"] is None or info["uidnext"] is None:
+            try:
+                status, data = self.mail.status(encoded_mailbox, '(UIDVALIDITY UIDNEXT)')
+                if status == 'OK' and data and data[0]:
+                    text = data[0].decode('utf-8', 'ignore')
+                    for key in ('UIDVALIDITY', 'UIDNEXT'):
+                        match = re.search(rf'{key} (\d+)', text)
+                        if match and info[key.lower()] is None:
+                            info[key.lower()] = int(match.group(1))
+            except Exception as e:
+                logging.warning(f"获取邮箱 '{mailbox}' 的 STATUS 失败: {e}")
+
+        logging.info(f"邮箱 '{mailbox}' UIDVALIDITY={info['uidvalidity']}, UIDNEXT={info['uidnext']}")
+        return info
+
+    def _untagged_int(self, code):
+        """
+        从最近一次命令的未标记响应中读取整数值（如 UIDVALIDITY、UIDNEXT）。
+        """
+        _, data = self.mail.response(code)
+        if data and data[-1] is not None:
+            try:
+                return int(data[-1])
+            except (TypeError, ValueError):
+                return None
+        return None
+
+    def supports_idle(self):
+        """
+        服务器是否支持 IDLE 扩展（RFC 2177）。
+        """
+        return self.mail is not None and 'IDLE' in self.mail.capabilities
+
+    def wait_for_changes(self, timeout, stop_event=None):
+        """
+        使用 IDLE 等待当前选中邮箱的变化，最多等待 timeout 秒。
+
+        imaplib 没有提供 IDLE 命令，这里直接收发协议行：发送 IDLE 后
+        用 select 等待服务器推送，收到 EXISTS/RECENT 或超时后发送 DONE 结束。
+        网络异常会直接抛出，由调用方重建连接。
+
+        Args:
+            timeout (float): 最长等待秒数，RFC 建议不超过29分钟。
+            stop_event (threading.Event): 可选，被设置后尽快结束等待。
+
+        Returns:
+            bool: 是否有新邮件到达。
+        """
+        tag = f"IDLE{int(time.time())}".encode('ascii')
+        self.mail.send(tag + b' IDLE\r\n')
+        line = self.mail.readline()
+        if not line.startswith(b'+'):
+            raise imaplib.IMAP4.error(f"服务器拒绝 IDLE 命令: {line!r}")
+
+        changed = False
+        sock = self.mail.socket()
+        deadline = time.monotonic() + timeout
+        while not changed and not (stop_event and stop_event.is_set()):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            # SSL 层可能已缓存了数据，此时 select 不会报告可读
+            pending = sock.pending() if hasattr(sock, 'pending') else 0
+            if not pending and not select.select([sock], [], [], min(remaining, 1.0))[0]:
+                continue
+            line = self.mail.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("IDLE 期间服务器关闭了连接")
+            if re.match(rb'\* \d+ (EXISTS|RECENT)', line):
+                changed = True
+
+        self.mail.send(b'DONE\r\n')
+        while True:
+            line = self.mail.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("结束 IDLE 时服务器关闭了连接")
+            if line.startswith(tag + b' '):
+                if not line[len(tag) + 1:].startswith(b'OK'):
+                    raise imaplib.IMAP4.error(f"IDLE 命令失败: {line!r}")
+                break
+            # DONE 之前到达的推送同样需要处理
+            if re.match(rb'\* \d+ (EXISTS|RECENT)', line):
+                changed = True
+        return changed
+
+    def poll_for_changes(self, interval, stop_event=None):
+        """
+        不支持 IDLE 时的回退方案：等待 interval 秒后发送 NOOP，检查是否有新的 EXISTS 响应。
+
+        Returns:
+            bool: 是否有新邮件到达。
+        """
+        # 丢弃之前命令（如 SELECT）留下的 EXISTS 响应
+        self.mail.response('EXISTS')
+        self.mail.response('RECENT')
+        if stop_event:
+            if stop_event.wait(interval):
+                return False
+        else:
+            time.sleep(interval)
+
+        status, _ = self.mail.noop()
+        if status != 'OK':
+            raise imaplib.IMAP4.error(f"NOOP 命令失败: {status}")
+        _, exists = self.mail.response('EXISTS')
+        _, recent = self.mail.response('RECENT')
+        return exists != [None] or recent != [None]
+
+    def search_uids(self, criteria='ALL'):
+        """
+        在当前选中的邮箱中按条件搜索，返回邮件 UID 列表（升序）。
+
+        Args:
+            criteria (str): IMAP搜索条件，例如 'SINCE 01-Jan-2025' 或 'UID 1234:*'。
+        """
+        if not self.mail:
+            logging.warning("IMAP连接未建立，请先调用connect()方法。")
+            return []
+
+        logging.info(f"按UID搜索邮件，条件: {criteria}")
+        status, data = self.mail.uid('SEARCH', None, criteria)
+        if status != 'OK':
+            logging.error(f"搜索邮件失败: {status}")
+            return []
+        return sorted(int(uid) for uid in data[0].split())
+
+    def _uid_set(self, uids):
+        """
+        将 UID 列表压缩为 IMAP 序列集合字符串，例如 [1, 2, 3, 7] -> '1:3,7'。
+        """
+        ranges = []
+        for uid in sorted(set(uids)):
+            if ranges and uid == ranges[-1][1] + 1:
+                ranges[-1][1] = uid
+            else:
+                ranges.append([uid, uid])
+        return ','.join(str(a) if a == b else f"{a}:{b}" for a, b in ranges)
+
+    def _iter_fetch_items(self, data):
+        """
+        将 UID FETCH 的原始响应拆分为 (元数据字节串, 字面量数据) 对。
+
+        imaplib 对每封邮件返回一个 (前缀, 字面量) 元组，之后跟随一个 b')' 结尾；
+        部分服务器会把 UID 等字段放在字面量之后的结尾字节串中，这里会一并拼接到元数据里。
+        """
+        meta, literal = None, None
+        for part in data:
+            if isinstance(part, tuple):
+                if meta is not None:
+                    yield meta, literal
+                meta, literal = part[0], part[1]
+            elif isinstance(part, bytes) and meta is not None:
+                meta += b' ' + part
+        if meta is not None:
+            yield meta, literal
+
+    def fetch_headers(self, uids):
+        """
+        通过一次批量 UID FETCH 获取邮件的关键头部字段和大小，不下载正文。
+
+        Returns:
+            list: 每封邮件一个字典，包含 'UID', 'Message-ID', 'Subject', 'From', 'Date', 'Size'。
+        """
+        if not self.mail:
+            logging.warning("IMAP连接未建立，请先调用connect()方法。")
+            return []
+        if not uids:
+            return []
+
+        status, data = self.mail.uid(
+            'FETCH', self._uid_set(uids),
+            '(UID RFC822.SIZE BODY.PEEK[HEADER.FIELDS (MESSAGE-ID SUBJECT FROM DATE)])'
+        )
+        if status != 'OK':
+            logging.error(f"批量获取邮件头失败: {status}")
+            return []
+
+        headers = []
+        for meta, literal in self._iter_fetch_items(data):
+            uid_match = re.search(rb'UID (\d+)', meta)
+            if not uid_match:
+                continue
+            size_match = re.search(rb'RFC822\.SIZE (\d+)', meta)
+            msg = email.message_from_bytes(literal or b'')
+            headers.append({
+                "UID": int(uid_match.group(1)),
+                "Message-ID": (msg.get("Message-ID") or "").strip(),
+                "Subject": self._decode_header_value(msg.get("Subject", ""), "主题"),
+                "From": self._decode_header_value(msg.get("From", ""), "发件人"),
+                "Date": msg.get("Date"),
+                "Size": int(size_match.group(1)) if size_match else 0,
+            })
+        logging.info(f"已批量获取 {len(headers)} 封邮件的头部信息。")
+        return headers
+
+    def _plan_batches(self, uids, sizes=None, batch_size=None, max_batch_bytes=None):
+        """
+        将 UID 划分为多个 FETCH 批次：每批最多 batch_size 封邮件，且（已知大小时）总字节数不超过 max_batch_bytes。
+        单封超过字节上限的邮件单独成批。
+        """
+        batch_size = batch_size or self.fetch_batch_size
+        max_batch_bytes = max_batch_bytes or self.fetch_batch_max_bytes
+        sizes = sizes or {}
+
+        batch, batch_bytes = [], 0
+        for uid in sorted(uids):
+            size = sizes.get(uid, 0)
+            if batch and (len(batch) >= batch_size or batch_bytes + size > max_batch_bytes):
+                yield batch
+                batch, batch_bytes = [], 0
+            batch.append(uid)
+            batch_bytes += size
+        if batch:
+            yield batch
+
+    def iter_raw_batches(self, uids, sizes=None, batch_size=None, max_batch_bytes=None):
+        """
+        按批次获取邮件的原始RFC822数据，不做解析，供解析进程池使用。
+
+        Args:
+            uids (list): 要获取的邮件 UID。
+            sizes (dict): 可选的 {UID: RFC822.SIZE}，用于按字节数划分批次。
+            batch_size (int): 每批最多邮件数，默认读取 FETCH_BATCH_SIZE。
+            max_batch_bytes (int): 每批最多字节数，默认读取 FETCH_BATCH_MAX_BYTES。
+
+        Yields:
+            list: 每个 FETCH 批次一个 [(UID, 原始字节), ...] 列表。
+        """
+        if not self.mail:
+            logging.warning("IMAP连接未建立，请先调用connect()方法。")
+            return
+
+        for chunk in self._plan_batches(uids, sizes, batch_size, max_batch_bytes):
+            try:
+                status, data = self.mail.uid('FETCH', self._uid_set(chunk), '(UID RFC822)')
+            except Exception as e:
+                logging.error(f"获取邮件 UID {chunk} 过程中发生错误: {e}")
+                continue
+            if status != 'OK':
+                logging.warning(f"获取邮件 UID {chunk} 失败: {status}")
+                continue
+
+            batch = []
+            for meta, literal in self._iter_fetch_items(data):
+                uid_match = re.search(rb'UID (\d+)', meta)
+                if uid_match and literal is not None:
+                    batch.append((int(uid_match.group(1)), literal))
+            del data
+            yield batch
+
+    def iter_emails(self, uids, sizes=None, batch_size=None, max_batch_bytes=None):
+        """
+        按 UID 逐封获取并解析邮件的生成器，每次 FETCH 请求包含多封邮件。
+
+        与 fetch_emails_by_uids 不同，邮件被逐封产出、用完即可释放，
+        峰值内存只取决于单个 FETCH 批次，而不是整个同步窗口。
+
+        Args:
+            uids (list): 要获取的邮件 UID。
+            sizes (dict): 可选的 {UID: RFC822.SIZE}，用于按字节数划分批次。
+            batch_size (int): 每批最多邮件数，默认读取 FETCH_BATCH_SIZE。
+            max_batch_bytes (int): 每批最多字节数，默认读取 FETCH_BATCH_MAX_BYTES。
+
+        Yields:
+            dict: 单封邮件的字典，额外包含 'UID' 字段。
+        """
+        for batch in self.iter_raw_batches(uids, sizes, batch_size, max_batch_bytes):
+            # 逐个弹出响应项，解析后立即丢弃原始字节
+            items = deque(batch)
+            del batch
+            while items:
+                uid, literal = items.popleft()
+                try:
+                    mail_data = self._parse_message(literal)
+                except Exception as e:
+                    logging.error(f"解析邮件 UID {uid} 失败: {e}")
+                    continue
+                mail_data["UID"] = uid
+                yield mail_data
+
+    def fetch_emails_by_uids(self, uids, batch_size=None):
+        """
+        按 UID 获取当前选中邮箱中的邮件正文。
+
+        Returns:
+            list: 包含邮件内容的列表，每封邮件是一个字典，额外包含 'UID' 字段。
+        """
+        return list(self.iter_emails(uids, batch_size=batch_size))
 
     def fetch_emails(self, mailbox="INBOX", criteria='ALL'):
         """
@@ -113,116 +521,81 @@ class EmailFetcher:
             return []
 
         try:
-            logging.info(f"选择邮箱: {mailbox}")
-            # 将邮箱名编码为IMAP兼容的UTF-7格式
-            # IMAP协议的邮箱名通常需要以UTF-7编码，或者更准确地说是IMAP的修改UTF-7规范
-            # Python的imaplib库在处理非ASCII邮箱名时，需要进行此编码
-            encoded_mailbox = mailbox.encode('utf-7').decode('ascii')
-            status, messages = self.mail.select(encoded_mailbox)
-            if status != 'OK':
-                logging.error(f"选择邮箱失败: {status}")
+            if self.select_mailbox(mailbox) is None:
                 return []
-
-            logging.info(f"搜索邮件，条件: {criteria}")
-            status, message_numbers = self.mail.search(None, criteria)
-            if status != 'OK':
-                logging.error(f"搜索邮件失败: {status}")
-                return []
-
-            email_list = []
-            for num in message_numbers[0].split():
-                status, data = self.mail.fetch(num, '(RFC822)')
-                if status != 'OK':
-                    logging.warning(f"获取邮件 {num} 失败: {status}")
-                    continue
-
-                msg = email.message_from_bytes(data[0][1])
-                
-                # 解码主题，处理乱码
-                decoded_subject = ""
-                try:
-                    # decode_header 返回一个 (value, charset) 对的列表
-                    # 遍历列表并解码每个部分
-                    parts = email.header.decode_header(msg.get("Subject", ""))
-                    for value, charset in parts:
-                        if isinstance(value, bytes):
-                            try:
-                                decoded_subject += value.decode(charset or 'utf-8', errors='replace')
-                            except (UnicodeDecodeError, LookupError):
-                                decoded_subject += value.decode('latin-1', errors='replace') # 尝试其他编码或替换错误
-                        else:
-                            decoded_subject += value
-                except Exception as e:
-                    logging.warning(f"解码邮件主题失败: {e}")
-                    decoded_subject = msg.get("Subject", "") # 失败则使用原始主题
-
-                # 解码发件人，处理乱码
-                decoded_from = ""
-                try:
-                    parts = email.header.decode_header(msg.get("From", ""))
-                    for value, charset in parts:
-                        if isinstance(value, bytes):
-                            try:
-                                decoded_from += value.decode(charset or 'utf-8', errors='replace')
-                            except (UnicodeDecodeError, LookupError):
-                                decoded_from += value.decode('latin-1', errors='replace')
-                        else:
-                            decoded_from += value
-                except Exception as e:
-                    logging.warning(f"解码邮件发件人失败: {e}")
-                    decoded_from = msg.get("From", "") # 失败则使用原始发件人
-
-                mail_data = {
-                    "From": decoded_from, # 使用解码后的发件人
-                    "To": msg.get("To"),
-                    "Subject": decoded_subject, # 使用解码后的主题
-                    "Date": msg.get("Date"),
-                    "Body": self._get_email_body(msg), # 仍然提供解析后的body，但用户主要关注Raw
-                    "Raw": data[0][1] # 原始RFC822数据
-                }
-                email_list.append(mail_data)
-                logging.info(f"已获取邮件: Subject='{msg.get('Subject')}' From='{msg.get('From')}'")
-            return email_list
+            return self.fetch_emails_by_uids(self.search_uids(criteria))
         except Exception as e:
             logging.error(f"获取邮件过程中发生错误: {e}")
             return []
 
-    def _get_email_body(self, msg):
+    @staticmethod
+    def _decode_header_value(raw_value, field_name):
         """
-        解析邮件内容，获取文本部分。
+        解码邮件头（如主题、发件人），处理乱码。
         """
-        body = ""
-        if msg.is_multipart():
-            for part in msg.walk():
-                ctype = part.get_content_type()
-                cdispo = str(part.get('Content-Disposition'))
-
-                # 忽略附件
-                if ctype == 'text/html' and 'attachment' not in cdispo:
-                    payload = part.get_payload(decode=True)
-                    detected_charset = chardet.detect(payload)['encoding']
+        decoded = ""
+        try:
+            # decode_header 返回一个 (value, charset) 对的列表
+            # 遍历列表并解码每个部分
+            parts = email.header.decode_header(raw_value or "")
+            for value, charset in parts:
+                if isinstance(value, bytes):
                     try:
-                        # 优先获取HTML内容，尝试使用检测到的编码，如果失败则回退到utf-8或latin-1
-                        body = payload.decode(detected_charset or part.get_content_charset() or 'utf-8', errors='replace')
-                        break # 如果成功获取HTML，则不再继续查找纯文本
-                    except Exception as e:
-                        logging.warning(f"解码邮件HTML部分失败 (尝试编码: {detected_charset}): {e}")
-                elif ctype == 'text/plain' and 'attachment' not in cdispo:
-                    if not body: # 如果HTML内容未找到或解码失败，则尝试获取纯文本
-                        payload = part.get_payload(decode=True)
-                        detected_charset = chardet.detect(payload)['encoding']
-                        try:
-                            body = payload.decode(detected_charset or part.get_content_charset() or 'utf-8', errors='replace')
-                        except Exception as e:
-                            logging.warning(f"解码邮件文本部分失败 (尝试编码: {detected_charset}): {e}")
-        else:
-            payload = msg.get_payload(decode=True)
-            detected_charset = chardet.detect(payload)['encoding']
-            try:
-                body = payload.decode(detected_charset or msg.get_content_charset() or 'utf-8', errors='replace')
-            except Exception as e:
-                logging.warning(f"解码邮件单一部分失败 (尝试编码: {detected_charset}): {e}")
-        return body
+                        decoded += value.decode(charset or 'utf-8', errors='replace')
+                    except (UnicodeDecodeError, LookupError):
+                        decoded += value.decode('latin-1', errors='replace') # 尝试其他编码或替换错误
+                else:
+                    decoded += value
+        except Exception as e:
+            logging.warning(f"解码邮件{field_name}失败: {e}")
+            decoded = raw_value or "" # 失败则使用原始值
+        return decoded
+
+    @staticmethod
+    def _parse_message(raw_bytes):
+        """
+        将原始RFC822数据解析为邮件字典。不依赖连接状态，可在解析子进程中调用。
+        """
+        msg = email.message_from_bytes(raw_bytes)
+        mail_data = {
+            "From": EmailFetcher._decode_header_value(msg.get("From", ""), "发件人"), # 使用解码后的发件人
+            "To": msg.get("To"),
+            "Subject": EmailFetcher._decode_header_value(msg.get("Subject", ""), "主题"), # 使用解码后的主题
+            "Date": msg.get("Date"),
+            "Message-ID": (msg.get("Message-ID") or "").strip(),
+            # 群发邮件的标志，供分析前的预分类使用
+            "List-Unsubscribe": msg.get("List-Unsubscribe"),
+            "Precedence": msg.get("Precedence"),
+            "Body": EmailFetcher._get_email_body(msg), # 仍然提供解析后的body，但用户主要关注Raw
+            "Raw": raw_bytes # 原始RFC822数据
+        }
+        logging.info(f"已获取邮件: Subject='{msg.get('Subject')}' From='{msg.get('From')}'")
+        return mail_data
+
+    @staticmethod
+    def _get_email_body(msg):
+        """
+        解析邮件内容，获取文本部分。优先返回HTML部分，没有时返回纯文本部分。
+        """
+        if not msg.is_multipart():
+            return decode_text_payload(msg.get_payload(decode=True), msg.get_content_charset())
+
+        plain_part = None
+        for part in msg.walk():
+            ctype = part.get_content_type()
+            # 忽略附件
+            if ctype not in ('text/html', 'text/plain') or 'attachment' in str(part.get('Content-Disposition')):
+                continue
+            if ctype == 'text/html':
+                body = decode_text_payload(part.get_payload(decode=True), part.get_content_charset())
+                if body:
+                    return body
+            elif plain_part is None:
+                plain_part = part
+
+        if plain_part is not None:
+            return decode_text_payload(plain_part.get_payload(decode=True), plain_part.get_content_charset())
+        return ""
 
     def logout(self):
         """
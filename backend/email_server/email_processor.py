@@ -1,7 +1,7 @@
 import email
-from bs4 import BeautifulSoup
 import logging
-import urllib.parse
+from backend.email_server.html_text_extractor import HTMLTextExtractor
+from backend.email_server.image_selector import ImageSelector
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -10,11 +10,15 @@ class EmailProcessor:
     用于处理原始邮件数据，提取文本内容和图片链接，并转换为ChatGPT友好格式的类。
     """
     def __init__(self):
-        logging.info("EmailProcessor 初始化完成。")
+        self.extractor = HTMLTextExtractor()
+        self.image_selector = ImageSelector()
+        logging.info(f"EmailProcessor 初始化完成（HTML解析器: {self.extractor.backend}）。")
 
     def process_email_for_chatgpt(self, html_content):
         """
         从HTML内容中提取文本内容和图片链接，并格式化为ChatGPT能使用的结构。
+        非正文元素（样式、脚本、隐藏元素和追踪表格）被跳过；图片经 ImageSelector 筛选，
+        过滤GIF、追踪像素和图标，去重并限制数量，内联图片被缩放。
 
         Args:
             html_content (str): 邮件的HTML内容字符串。
@@ -22,39 +26,18 @@ class EmailProcessor:
         Returns:
             dict: 包含 'text_content' 和 'image_urls' 的字典。
                   'text_content' 是纯文本内容。
-                  'image_urls' 是一个包含所有图片URL的列表。
+                  'image_urls' 是筛选后的图片URL列表。
         """
         text_content = ""
         image_urls = []
 
         if html_content:
             try:
-                soup = BeautifulSoup(html_content, 'html.parser')
-
-                # 提取所有图片链接，并过滤掉GIF格式
-                for img in soup.find_all('img'):
-                    if 'src' in img.attrs:
-                        img_url = img['src']
-                        # 解析URL以获取路径部分，忽略查询参数
-                        parsed_url = urllib.parse.urlparse(img_url)
-                        path = parsed_url.path
-                        # 检查路径的扩展名，如果不是gif，则添加
-                        if not path.lower().endswith('.gif'):
-                            image_urls.append(img_url)
-                        else:
-                            # logging.info(f"已跳过GIF图片: {img_url}")
-                            pass
-                
-                # 提取纯文本内容（从HTML中），处理P标签换行问题
-                paragraphs = soup.find_all('p')
-                if paragraphs:
-                    text_content = "\n".join([p.get_text(strip=True) for p in paragraphs])
-                else:
-                    # 如果没有P标签，则使用默认的get_text
-                    text_content = soup.get_text(separator='\n', strip=True)
+                text_content, images = self.extractor.extract(html_content)
+                image_urls = self.image_selector.select(images)
             except Exception as e:
                 logging.warning(f"处理HTML内容失败: {e}")
-        
+
         return {
             "text_content": text_content,
             "image_urls": image_urls
@@ -0,0 +1,222 @@
+import logging
+import os
+import re
+import urllib.parse
+from html.parser import HTMLParser
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:  # lxml 为可选依赖，未安装时使用标准库解析器
+    lxml_etree = None
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 内容不属于正文的元素，其内部的文本和图片全部跳过
+NON_CONTENT_TAGS = frozenset({
+    'head', 'title', 'style', 'script', 'noscript', 'template',
+    'svg', 'math', 'iframe', 'object', 'canvas', 'select', 'button',
+})
+# 没有结束标签的元素，不入栈
+VOID_TAGS = frozenset({
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+    'link', 'meta', 'param', 'source', 'track', 'wbr',
+})
+# 常见的隐藏写法：营销邮件的预览文本、追踪表格和针对 Outlook 的隐藏块
+HIDDEN_STYLE_PATTERN = re.compile(
+    r'display\s*:\s*none|visibility\s*:\s*hidden|mso-hide\s*:\s*all|max-height\s*:\s*0(?![.\d])',
+    re.IGNORECASE,
+)
+# 宽或高不超过1像素的表格视为追踪/占位表格
+TRACKING_TABLE_SIZES = frozenset({'0', '1', '0px', '1px'})
+WHITESPACE_PATTERN = re.compile(r'\s+')
+# 随图片链接一起保留的属性，供后续的图片筛选使用
+IMAGE_ATTRIBUTES = ('width', 'height', 'style', 'alt')
+
+
+def _is_hidden(tag, attrs):
+    """
+    判断元素是否对读者不可见（其内容不计入正文）。
+    """
+    if 'hidden' in attrs:
+        return True
+    style = attrs.get('style')
+    if style and HIDDEN_STYLE_PATTERN.search(style):
+        return True
+    if tag == 'table':
+        width = (attrs.get('width') or '').strip().lower()
+        height = (attrs.get('height') or '').strip().lower()
+        if width in TRACKING_TABLE_SIZES or height in TRACKING_TABLE_SIZES:
+            return True
+    return False
+
+
+class _TextCollector:
+    """
+    单遍收集正文文本和图片链接的事件处理器。
+
+    方法签名与 lxml 的解析目标（target）接口一致，标准库解析器通过 _StdlibParser 转发事件。
+    文本规则与原先基于 BeautifulSoup 的实现保持一致：
+    - 存在 <p> 时，每个段落的文本片段去除首尾空白后直接拼接，段落之间以换行分隔；
+    - 没有 <p> 时，所有文本片段去除首尾空白后以换行分隔。
+    """
+    def __init__(self, max_chars):
+        self.max_chars = max_chars
+        self.images = []
+        # 打开的元素栈：(标签名, 是否跳过其内容)
+        self._stack = []
+        self._skip_depth = 0
+        # 没有 <p> 时使用的全文片段
+        self._lines = []
+        # 已开始的段落（按出现顺序）和当前打开的段落
+        self._paragraphs = []
+        self._open_paragraphs = []
+        self._chars = 0
+        self.truncated = False
+
+    def start(self, tag, attrs):
+        tag = tag.lower()
+        if self._skip_depth:
+            if tag not in VOID_TAGS:
+                self._stack.append((tag, False))
+            return
+
+        if tag == 'img':
+            if not _is_hidden(tag, attrs):
+                self._add_image(attrs)
+            return
+        if tag in VOID_TAGS:
+            return
+
+        skip = tag in NON_CONTENT_TAGS or _is_hidden(tag, attrs)
+        self._stack.append((tag, skip))
+        if skip:
+            self._skip_depth += 1
+        elif tag == 'p':
+            paragraph = []
+            self._paragraphs.append(paragraph)
+            self._open_paragraphs.append(paragraph)
+
+    def end(self, tag):
+        tag = tag.lower()
+        if tag in VOID_TAGS:
+            return
+        # 未闭合的内层元素随外层结束标签一并关闭；找不到对应开始标签的结束标签忽略
+        for index in range(len(self._stack) - 1, -1, -1):
+            if self._stack[index][0] == tag:
+                break
+        else:
+            return
+        while len(self._stack) > index:
+            closed_tag, skip = self._stack.pop()
+            if skip:
+                self._skip_depth -= 1
+            elif closed_tag == 'p' and not self._skip_depth and self._open_paragraphs:
+                self._open_paragraphs.pop()
+
+    def data(self, text):
+        if self._skip_depth or self.truncated:
+            return
+        text = text.strip()
+        if not text:
+            return
+        text = WHITESPACE_PATTERN.sub(' ', text)
+        if self.max_chars and self._chars + len(text) > self.max_chars:
+            text = text[:max(self.max_chars - self._chars, 0)]
+            self.truncated = True
+        self._chars += len(text)
+        self._lines.append(text)
+        # 嵌套段落中的文本同时属于外层段落，与 BeautifulSoup 的 get_text 一致
+        for paragraph in self._open_paragraphs:
+            paragraph.append(text)
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        if self._paragraphs:
+            text = "\n".join(''.join(parts) for parts in self._paragraphs if parts)
+        else:
+            text = "\n".join(self._lines)
+        if self.max_chars and len(text) > self.max_chars:
+            text = text[:self.max_chars]
+        return text
+
+    def _add_image(self, attrs):
+        url = attrs.get('src')
+        if not url:
+            return
+        # 解析URL以获取路径部分，忽略查询参数；跳过GIF图片
+        path = urllib.parse.urlparse(url).path
+        if not path.lower().endswith('.gif'):
+            image = {name: attrs[name] for name in IMAGE_ATTRIBUTES if attrs.get(name)}
+            image['src'] = url
+            self.images.append(image)
+
+
+class _StdlibParser(HTMLParser):
+    """
+    将 html.parser 的事件转发给 _TextCollector。
+    """
+    def __init__(self, collector):
+        super().__init__(convert_charrefs=True)
+        self.collector = collector
+
+    def handle_starttag(self, tag, attrs):
+        self.collector.start(tag, {name: value or '' for name, value in attrs})
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        self.collector.end(tag)
+
+    def handle_endtag(self, tag):
+        self.collector.end(tag)
+
+    def handle_data(self, data):
+        self.collector.data(data)
+
+
+class HTMLTextExtractor:
+    """
+    流式的HTML正文提取器：一次遍历同时提取纯文本和图片链接，不构建文档树。
+
+    跳过 <head>、<style>、<script> 等非正文元素以及隐藏元素和追踪表格，
+    折叠连续空白，正文超过 max_chars 后停止收集文本。
+    安装了 lxml 时使用其 C 实现的解析器，否则使用标准库的 html.parser。
+    """
+    def __init__(self, max_chars=None, backend=None):
+        """
+        Args:
+            max_chars (int): 正文最大字符数，默认读取 HTML_TEXT_MAX_CHARS；0 表示不限制。
+            backend (str): 'lxml' 或 'stdlib'，默认安装了 lxml 时使用 lxml。
+        """
+        self.max_chars = max_chars if max_chars is not None else int(os.getenv("HTML_TEXT_MAX_CHARS", 20000))
+        if backend is None:
+            backend = 'lxml' if lxml_etree is not None else 'stdlib'
+        if backend == 'lxml' and lxml_etree is None:
+            raise ValueError("未安装 lxml，无法使用 lxml 解析器。")
+        if backend not in ('lxml', 'stdlib'):
+            raise ValueError(f"未知的HTML解析器: {backend}")
+        self.backend = backend
+
+    def extract(self, html_content):
+        """
+        提取HTML的正文文本和图片。
+
+        Args:
+            html_content (str): HTML内容字符串。
+
+        Returns:
+            tuple: (text_content, images)。images 是按文档顺序排列的图片字典列表，
+                包含 'src' 以及声明了的 'width'、'height'、'style'、'alt'。
+        """
+        collector = _TextCollector(self.max_chars)
+        if self.backend == 'lxml':
+            parser = lxml_etree.HTMLParser(target=collector, recover=True, no_network=True)
+            parser.feed(html_content)
+            text = parser.close()
+        else:
+            parser = _StdlibParser(collector)
+            parser.feed(html_content)
+            parser.close()
+            text = collector.close()
+        return text, collector.images
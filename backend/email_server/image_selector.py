@@ -0,0 +1,259 @@
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import os
+import re
+import urllib.parse
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow 为可选依赖，未安装时不缩放内联图片
+    Image = None
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+SOCIAL_NAMES = r'facebook|fb|twitter|instagram|linkedin|youtube|wechat|weibo|whatsapp|tiktok|appstore|googleplay'
+# URL（域名和路径）中出现这些词时，视为追踪像素、占位图或社交图标
+NON_CONTENT_IMAGE_PATTERN = re.compile(
+    r'(?:^|[/_.\-=?&])('
+    r'pixel|tracking|beacon|spacer|transparent|favicon|' + SOCIAL_NAMES +
+    r')(?:[/_.\-=?&]|\d|$)',
+    re.IGNORECASE,
+)
+# 这些常见词也会出现在正文图片的文件名中（如 open-day.jpg），只在URL路径中出现且声明的尺寸为图标大小时才过滤
+ICON_PATH_PATTERN = re.compile(
+    r'(?:^|[/_.\-=?&])(open|track|blank|icon|icons|badge|bullet|divider|social)(?:[/_.\-=?&]|\d|$)',
+    re.IGNORECASE,
+)
+# 替代文本只由社交平台名称（可带 icon/logo）组成时视为社交图标；其余替代文本不参与判断
+SOCIAL_ALT_PATTERN = re.compile(r'^\s*(?:' + SOCIAL_NAMES + r')(?:\s+(?:icon|logo))?\s*$', re.IGNORECASE)
+# 声明的宽和高都不超过 min_dimension 的该倍数时视为图标大小
+ICON_DIMENSION_FACTOR = 2
+DATA_URI_PATTERN = re.compile(r'^data:(image/[\w.+-]+)((?:;[^,;]*)*?);base64,(.*)$', re.IGNORECASE | re.DOTALL)
+DIMENSION_PATTERN = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*(px)?\s*$', re.IGNORECASE)
+STYLE_DIMENSION_PATTERN = re.compile(r'(?:^|;)\s*(width|height)\s*:\s*(\d+(?:\.\d+)?)\s*px', re.IGNORECASE)
+# 缩放后重新编码使用的 JPEG 质量
+JPEG_QUALITY = 80
+
+
+def _declared_size(image):
+    """
+    返回 <img> 声明的 (宽, 高) 像素值，未声明或不是像素值时对应项为 None。
+    style 中的像素值优先于 width/height 属性。
+    """
+    size = {}
+    for name in ('width', 'height'):
+        match = DIMENSION_PATTERN.match(image.get(name) or '')
+        if match:
+            size[name] = float(match.group(1))
+    for name, value in STYLE_DIMENSION_PATTERN.findall(image.get('style') or ''):
+        size[name.lower()] = float(value)
+    return size.get('width'), size.get('height')
+
+
+class ImageSelector:
+    """
+    选择随邮件发送给视觉模型的图片。
+
+    - 按声明的尺寸过滤追踪像素和小图标，按URL过滤追踪和社交图标等非内容图片；
+    - 按URL（内联图片按内容哈希）去重，每封邮件最多保留 max_images 张；
+    - 内联的 data: 图片在本地缩放到 max_dimension 以内并重新编码，
+      处理结果按内容哈希缓存在 cache_dir 中（需要 Pillow；未安装时只保留体积不超过上限的内联图片）。
+    """
+    def __init__(self, max_images=None, min_dimension=None, max_dimension=None,
+                 inline_max_bytes=None, cache_dir=None, cache_max_files=None):
+        """
+        Args:
+            max_images (int): 每封邮件最多保留的图片数，默认读取 IMAGE_MAX_PER_EMAIL；0 表示不发送图片。
+            min_dimension (int): 声明的宽或高小于该值（像素）的图片被过滤，默认读取 IMAGE_MIN_DIMENSION。
+            max_dimension (int): 内联图片缩放后的最长边（像素），默认读取 IMAGE_MAX_DIMENSION。
+            inline_max_bytes (int): 无法缩放时允许发送的内联图片最大字节数，默认读取 IMAGE_INLINE_MAX_BYTES。
+            cache_dir (str): 处理结果缓存目录，默认读取 IMAGE_CACHE_DIR，第一次写入时创建；为空字符串时不缓存。
+            cache_max_files (int): 缓存的最大文件数，超过后删除最早的文件。
+        """
+        self.max_images = int(max_images if max_images is not None else os.getenv("IMAGE_MAX_PER_EMAIL", 4))
+        self.min_dimension = int(min_dimension if min_dimension is not None else os.getenv("IMAGE_MIN_DIMENSION", 48))
+        self.max_dimension = int(max_dimension if max_dimension is not None else os.getenv("IMAGE_MAX_DIMENSION", 1024))
+        self.inline_max_bytes = int(inline_max_bytes if inline_max_bytes is not None
+                                    else os.getenv("IMAGE_INLINE_MAX_BYTES", 512 * 1024))
+        self.cache_dir = cache_dir if cache_dir is not None else os.getenv("IMAGE_CACHE_DIR", "image_cache")
+        self.cache_max_files = int(cache_max_files if cache_max_files is not None
+                                   else os.getenv("IMAGE_CACHE_MAX_FILES", 2000))
+        # 缓存目录在第一次写入时才创建，只解析文本的进程不会在当前目录留下空目录
+        if self.cache_dir and os.path.isdir(self.cache_dir):
+            self._evict_cache()
+
+    def select(self, images):
+        """
+        从邮件中的图片里选出要发送给模型的图片。
+
+        Args:
+            images (list): HTMLTextExtractor 提取的图片字典列表，包含 'src' 以及可选的
+                'width'、'height'、'style'、'alt'。
+
+        Returns:
+            list: 图片URL列表（内联图片为处理后的 data URI），按文档顺序排列。
+        """
+        selected = []
+        seen = set()
+        skipped = {"filtered": 0, "duplicate": 0, "over_limit": 0}
+        for image in images:
+            src = (image.get('src') or '').strip()
+            if not self._is_content_image(src, image):
+                skipped["filtered"] += 1
+                continue
+
+            if src.lower().startswith('data:'):
+                key, url = self._process_inline_image(src)
+            else:
+                key, url = src, src
+            if url is None:
+                skipped["filtered"] += 1
+                continue
+            if key in seen:
+                skipped["duplicate"] += 1
+                continue
+            seen.add(key)
+
+            if len(selected) >= self.max_images:
+                skipped["over_limit"] += 1
+                continue
+            selected.append(url)
+
+        if any(skipped.values()):
+            logging.info(f"图片筛选: 保留 {len(selected)}/{len(images)} 张（过滤 {skipped['filtered']}，"
+                         f"重复 {skipped['duplicate']}，超出上限 {skipped['over_limit']}）。")
+        return selected
+
+    def _is_content_image(self, src, image):
+        """
+        根据URL形式、声明的尺寸和URL/替代文本判断图片是否可能是正文内容。
+
+        open、icon、social 等常见词只在URL路径中且图片声明为图标大小时才作为过滤依据，
+        避免误删 "Open Day 2025"、open-day.jpg 这类正文图片。
+        """
+        if not src:
+            return False
+        scheme = urllib.parse.urlparse(src).scheme.lower()
+        # cid: 等引用无法被模型获取
+        if scheme not in ('http', 'https', 'data'):
+            return False
+        width, height = _declared_size(image)
+        if (width is not None and width < self.min_dimension) or (height is not None and height < self.min_dimension):
+            return False
+        if scheme != 'data':
+            parsed = urllib.parse.urlparse(src)
+            if NON_CONTENT_IMAGE_PATTERN.search(f"{parsed.netloc}{parsed.path}"):
+                return False
+            icon_sized = (width is not None or height is not None) and \
+                max(width or 0, height or 0) <= self.min_dimension * ICON_DIMENSION_FACTOR
+            if icon_sized and ICON_PATH_PATTERN.search(parsed.path):
+                return False
+        if SOCIAL_ALT_PATTERN.match(image.get('alt') or ''):
+            return False
+        return True
+
+    def _process_inline_image(self, src):
+        """
+        解码并缩放内联图片。
+
+        Returns:
+            tuple: (内容哈希, 处理后的 data URI)；图片无法解码或应被丢弃时 data URI 为 None。
+        """
+        match = DATA_URI_PATTERN.match(src)
+        if not match:
+            return src, None
+        try:
+            data = base64.b64decode(re.sub(r'\s+', '', match.group(3)), validate=True)
+        except (binascii.Error, ValueError):
+            return src, None
+
+        content_hash = hashlib.sha256(data).hexdigest()
+        cache_key = hashlib.sha256(
+            f"{content_hash}:{self.max_dimension}:{self.min_dimension}:{JPEG_QUALITY}:{Image is not None}".encode('ascii')
+        ).hexdigest()
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return content_hash, cached or None
+
+        url = self._downscale(data, match.group(1).lower())
+        self._cache_put(cache_key, url or '')
+        return content_hash, url
+
+    def _downscale(self, data, mime_type):
+        """
+        将图片缩放到 max_dimension 以内并重新编码，返回 data URI；图片过小或无法处理时返回 None。
+        """
+        if Image is None:
+            if len(data) > self.inline_max_bytes:
+                logging.info(f"内联图片 {len(data) // 1024} KB 超过上限且未安装 Pillow，已跳过。")
+                return None
+            return f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}"
+
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                if min(img.size) < self.min_dimension:
+                    return None
+                if max(img.size) <= self.max_dimension and len(data) <= self.inline_max_bytes:
+                    return f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}"
+                img.thumbnail((self.max_dimension, self.max_dimension))
+                has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+                output = io.BytesIO()
+                if has_alpha:
+                    img.save(output, format='PNG', optimize=True)
+                    mime_type = 'image/png'
+                else:
+                    img.convert('RGB').save(output, format='JPEG', quality=JPEG_QUALITY, optimize=True)
+                    mime_type = 'image/jpeg'
+        except Exception as e:
+            logging.warning(f"处理内联图片失败: {e}")
+            return None
+        return f"data:{mime_type};base64,{base64.b64encode(output.getvalue()).decode('ascii')}"
+
+    def _cache_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.uri")
+
+    def _cache_get(self, key):
+        """
+        返回缓存的 data URI（空字符串表示该图片应被丢弃）；未缓存时返回 None。
+        """
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._cache_path(key), 'r', encoding='ascii') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _cache_put(self, key, url):
+        """
+        写入缓存。先写临时文件再替换，多个解析进程同时写入同一张图片也不会读到不完整的内容。
+        """
+        if not self.cache_dir:
+            return
+        path = self._cache_path(key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(temp_path, 'w', encoding='ascii') as f:
+                f.write(url)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logging.warning(f"写入图片缓存失败: {e}")
+
+    def _evict_cache(self):
+        """
+        缓存文件数超过 cache_max_files 时，按修改时间删除最早的文件。
+        """
+        try:
+            entries = [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith('.uri')]
+            if len(entries) <= self.cache_max_files:
+                return
+            entries.sort(key=lambda entry: entry.stat().st_mtime)
+            for entry in entries[:len(entries) - self.cache_max_files]:
+                os.remove(entry.path)
+            logging.info(f"图片缓存已淘汰 {len(entries) - self.cache_max_files} 个文件。")
+        except OSError as e:
+            logging.warning(f"淘汰图片缓存失败: {e}")
@@ -0,0 +1,117 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from backend.email_server.email_fetcher import EmailFetcher
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class IMAPConnectionPool:
+    """
+    线程安全的IMAP连接池，复用已登录的 EmailFetcher，避免每次请求都进行TLS握手和登录。
+
+    空闲超过 health_check_interval 秒的连接在借出前会用 NOOP 检查，
+    空闲超过 max_idle_seconds 秒的连接直接关闭重建。
+    """
+    def __init__(self, max_size=2, health_check_interval=30, max_idle_seconds=600):
+        self.max_size = max_size
+        self.health_check_interval = health_check_interval
+        self.max_idle_seconds = max_idle_seconds
+        self._idle = []  # [(fetcher, 最近一次归还的时间)]
+        self._in_use = 0
+        self._condition = threading.Condition()
+        logging.info(f"IMAP连接池初始化完成，最大连接数: {max_size}")
+
+    def _is_healthy(self, fetcher, idle_seconds):
+        """
+        检查连接是否可用：空闲太久直接判定为不可用，空闲较久则发送 NOOP 验证。
+        """
+        if fetcher.mail is None:
+            return False
+        if idle_seconds > self.max_idle_seconds:
+            return False
+        if idle_seconds > self.health_check_interval:
+            try:
+                status, _ = fetcher.mail.noop()
+                return status == 'OK'
+            except Exception as e:
+                logging.warning(f"IMAP连接健康检查失败: {e}")
+                return False
+        return True
+
+    def _checkout(self):
+        """
+        取出一个可用连接，没有空闲连接且未达上限时新建，达到上限时等待。
+        """
+        with self._condition:
+            while not self._idle and self._in_use >= self.max_size:
+                self._condition.wait()
+            self._in_use += 1
+            candidates = self._idle
+            self._idle = []
+
+        # 在锁外进行网络操作
+        fetcher = None
+        try:
+            while candidates:
+                candidate, returned_at = candidates.pop()
+                if fetcher is None and self._is_healthy(candidate, time.monotonic() - returned_at):
+                    fetcher = candidate
+                elif fetcher is not None:
+                    # 其余连接放回空闲列表
+                    with self._condition:
+                        self._idle.append((candidate, returned_at))
+                else:
+                    candidate.logout()
+            if fetcher is None:
+                fetcher = EmailFetcher()
+                fetcher.connect()
+            return fetcher
+        except Exception:
+            with self._condition:
+                self._in_use -= 1
+                self._condition.notify()
+            raise
+
+    def _checkin(self, fetcher, broken=False):
+        """
+        归还连接；出错的连接直接关闭，不再复用。
+        """
+        if broken:
+            fetcher.logout()
+        with self._condition:
+            self._in_use -= 1
+            if not broken and fetcher.mail is not None:
+                self._idle.append((fetcher, time.monotonic()))
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self):
+        """
+        以上下文管理器的方式借用一个已登录的 EmailFetcher。
+
+        用法:
+            with pool.connection() as fetcher:
+                fetcher.list_mailboxes()
+        """
+        fetcher = self._checkout()
+        broken = False
+        try:
+            yield fetcher
+        except Exception:
+            broken = True
+            raise
+        finally:
+            self._checkin(fetcher, broken=broken)
+
+    def close_all(self):
+        """
+        关闭所有空闲连接，例如在IMAP配置变更后调用。正在使用的连接归还后仍会被复用，
+        因此配置变更时应配合重启或在归还前调用本方法。
+        """
+        with self._condition:
+            idle, self._idle = self._idle, []
+        for fetcher, _ in idle:
+            fetcher.logout()
+        logging.info(f"已关闭 {len(idle)} 个空闲IMAP连接。")
@@ -0,0 +1,83 @@
+import logging
+import os
+import threading
+from backend.email_server.email_fetcher import EmailFetcher
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class MailboxWatcher:
+    """
+    在后台线程中监听邮箱的新邮件，发现新邮件后调用回调（通常是启动增量同步）。
+
+    服务器支持 IDLE 时使用 IDLE 等待推送，否则每隔 poll_interval 秒发送 NOOP 检查。
+    监听使用独立的IMAP连接；连接出错后等待 reconnect_delay 秒重连。
+    """
+    def __init__(self, on_new_mail, mailbox=None, idle_timeout=None, poll_interval=None, reconnect_delay=30):
+        """
+        Args:
+            on_new_mail (callable): 检测到新邮件时调用的无参函数。
+            mailbox (str): 监听的邮箱，默认使用 .env 中的 MAILBOX。
+            idle_timeout (int): 每轮 IDLE 的最长秒数，超时后重新发起 IDLE 以保持连接。
+            poll_interval (int): NOOP 轮询间隔（秒）。
+            reconnect_delay (int): 连接出错后的重连等待时间（秒）。
+        """
+        self.on_new_mail = on_new_mail
+        self.mailbox = mailbox or os.getenv("MAILBOX", "INBOX")
+        self.idle_timeout = idle_timeout or int(os.getenv("IMAP_IDLE_TIMEOUT", 1500))
+        self.poll_interval = poll_interval or int(os.getenv("IMAP_POLL_INTERVAL", 60))
+        self.reconnect_delay = reconnect_delay
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        启动监听线程。
+        """
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="mailbox-watcher", daemon=True)
+        self._thread.start()
+        logging.info(f"开始监听邮箱 '{self.mailbox}' 的新邮件。")
+
+    def stop(self, timeout=5):
+        """
+        停止监听线程。
+        """
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+        logging.info(f"已停止监听邮箱 '{self.mailbox}'。")
+
+    def _notify(self):
+        try:
+            self.on_new_mail()
+        except Exception as e:
+            logging.error(f"处理新邮件通知时发生错误: {e}", exc_info=True)
+
+    def _run(self):
+        # 启动时先同步一次，补上服务离线期间到达的邮件
+        self._notify()
+        while not self._stop_event.is_set():
+            fetcher = EmailFetcher()
+            try:
+                fetcher.connect()
+                if fetcher.select_mailbox(self.mailbox) is None:
+                    raise RuntimeError(f"无法选择邮箱 '{self.mailbox}'")
+                use_idle = fetcher.supports_idle()
+                logging.info(f"邮箱监听使用 {'IDLE' if use_idle else 'NOOP 轮询'} 模式。")
+
+                while not self._stop_event.is_set():
+                    if use_idle:
+                        changed = fetcher.wait_for_changes(self.idle_timeout, self._stop_event)
+                    else:
+                        changed = fetcher.poll_for_changes(self.poll_interval, self._stop_event)
+                    if changed:
+                        logging.info(f"邮箱 '{self.mailbox}' 有新邮件到达。")
+                        self._notify()
+            except Exception as e:
+                logging.error(f"邮箱监听出错，{self.reconnect_delay} 秒后重连: {e}")
+                self._stop_event.wait(self.reconnect_delay)
+            finally:
+                fetcher.logout()
@@ -0,0 +1,109 @@
+import logging
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from backend.email_server.email_fetcher import EmailFetcher
+from backend.email_server.email_processor import EmailProcessor
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 每个解析进程内复用的 EmailProcessor
+_processor = None
+
+
+def parse_raw_batch(batch):
+    """
+    解析一批原始邮件：MIME解析、邮件头解码，以及提取正文文本和图片链接。
+    在解析子进程中执行（也可在当前进程中直接调用）。
+
+    Args:
+        batch (list): [(UID, 原始RFC822字节), ...]。
+
+    Returns:
+        list: 解析成功的邮件记录，包含 'UID', 'From', 'To', 'Subject', 'Date', 'Message-ID',
+            'List-Unsubscribe', 'Precedence', 'Body', 'text_content', 'image_urls'，不含原始字节。解析失败的邮件被跳过。
+    """
+    global _processor
+    if _processor is None:
+        _processor = EmailProcessor()
+
+    records = []
+    for uid, raw_bytes in batch:
+        try:
+            record = EmailFetcher._parse_message(raw_bytes)
+        except Exception as e:
+            logging.error(f"解析邮件 UID {uid} 失败: {e}")
+            continue
+        # 原始数据在后续流程中不再使用，不传回主进程
+        record.pop('Raw', None)
+        record['UID'] = uid
+        record.update(_processor.process_email_for_chatgpt(record['Body']))
+        records.append(record)
+    return records
+
+
+class ParsePool:
+    """
+    多进程的邮件解析阶段：接收按批次获取的原始邮件，按原顺序产出解析后的记录。
+
+    workers 小于2时不启动子进程，直接在当前进程中解析。
+    同时在途的批次数有上限，避免获取速度远快于解析时占用过多内存。
+
+    子进程以 spawn 方式启动，会把入口脚本重新导入为 __mp_main__，因此入口模块必须可以安全导入：
+    初始化数据库、启动服务或后台线程等操作需放在 `if __name__ == '__main__':` 或应用工厂中。
+    """
+    def __init__(self, workers=None, max_pending_batches=None):
+        """
+        Args:
+            workers (int): 解析进程数，默认读取 PARSE_WORKERS。
+            max_pending_batches (int): 最多同时在途的批次数，默认为进程数的2倍。
+        """
+        self.workers = workers if workers is not None else int(os.getenv("PARSE_WORKERS", 2))
+        self.max_pending_batches = max_pending_batches or max(2, self.workers * 2)
+        self._executor = None
+
+    def __enter__(self):
+        if self.workers > 1:
+            # 使用 spawn 启动子进程：与 Windows 行为一致，也避免在多线程的服务进程中 fork
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+            )
+            logging.info(f"已启动 {self.workers} 个邮件解析进程。")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        """
+        关闭解析进程，丢弃尚未开始的批次。
+        """
+        if self._executor:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def iter_parsed(self, batches):
+        """
+        解析 batches 中的每一批原始邮件，按输入顺序逐封产出邮件记录。
+
+        Args:
+            batches (iterable): 产出 [(UID, 原始字节), ...] 列表的可迭代对象，
+                例如 EmailFetcher.iter_raw_batches()。
+
+        Yields:
+            dict: 解析后的邮件记录，见 parse_raw_batch。
+        """
+        if self._executor is None:
+            for batch in batches:
+                yield from parse_raw_batch(batch)
+            return
+
+        pending = deque()
+        for batch in batches:
+            pending.append(self._executor.submit(parse_raw_batch, batch))
+            # 最早提交的批次已完成或在途批次达到上限时，先产出最早的批次，保持顺序
+            while pending and (pending[0].done() or len(pending) >= self.max_pending_batches):
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
@@ -0,0 +1,249 @@
+import logging
+import queue
+import threading
+import time
+import uuid
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 同步任务使用的线程名前缀，日志转发只收集这些线程产生的记录
+SYNC_THREAD_PREFIXES = ('sync-job', 'analyzer')
+# 订阅者等待新事件的超时（秒），超时后产出 None 供调用方发送心跳
+SUBSCRIBER_WAIT_TIMEOUT = 15
+# 每个广播订阅者最多积压的事件数，超过后该订阅者被断开
+BROKER_QUEUE_SIZE = 1000
+
+
+class SyncJob:
+    """
+    一次后台同步任务的状态和事件记录。
+
+    事件按顺序追加到 events 中，每个订阅者各自记录读取位置，
+    因此中途加入的订阅者也能看到完整的进度。
+    """
+    def __init__(self, on_event=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.on_event = on_event
+        self.status = 'running'   # running / succeeded / failed / cancelled
+        self.started_at = time.time()
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.cancel_event = threading.Event()
+        self.events = []
+        self.condition = threading.Condition()
+        # 'finished' 事件写入后置为 True，之后不会再有新事件
+        self.closed = False
+
+    @property
+    def finished(self):
+        return self.status != 'running'
+
+    def emit(self, event_type, **data):
+        """
+        追加一条事件并唤醒所有订阅者。
+        """
+        event = {"type": event_type, "job_id": self.id, "time": time.time()}
+        event.update(data)
+        with self.condition:
+            event["seq"] = len(self.events)
+            self.events.append(event)
+            if event_type == 'finished':
+                self.closed = True
+            self.condition.notify_all()
+        if self.on_event:
+            self.on_event(event)
+
+    def to_dict(self):
+        """
+        返回任务状态摘要（不含事件列表）。
+        """
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+            "cancel_requested": self.cancel_event.is_set(),
+            "event_count": len(self.events),
+        }
+
+
+class _JobLogHandler(logging.Handler):
+    """
+    将同步线程产生的日志转发为任务的 'log' 事件，保持与原先子进程输出日志相同的体验。
+    """
+    def __init__(self, job):
+        super().__init__(level=logging.INFO)
+        self.job = job
+
+    def emit(self, record):
+        if not record.threadName.startswith(SYNC_THREAD_PREFIXES):
+            return
+        try:
+            self.job.emit('log', level=record.levelname, message=record.getMessage())
+        except Exception:
+            self.handleError(record)
+
+
+class SyncJobManager:
+    """
+    进程内的后台同步任务管理器。
+
+    - 同一时间最多运行一个同步任务，并发的同步请求会加入正在运行的任务；
+    - 任务在独立的工作线程中执行同步流程，进度以结构化事件分发给任意数量的订阅者；
+    - 支持取消：已在分析中的邮件处理完后结束，未处理的邮件留给下次同步。
+    """
+    def __init__(self, target, on_event=None):
+        """
+        Args:
+            target (callable): 同步函数，签名为 target(cancel_event=..., report=...)，返回结果摘要。
+            on_event (callable): 可选，每个任务事件产生时调用，用于转发到全局事件流。
+        """
+        self.target = target
+        self.on_event = on_event
+        self._lock = threading.Lock()
+        self._current = None
+        self._follow_up = False
+
+    def start(self, follow_up=False):
+        """
+        启动同步任务；已有任务在运行时直接返回该任务。
+
+        Args:
+            follow_up (bool): 已有任务在运行时，是否在其结束后再同步一次。
+                新邮件通知应使用此选项，因为正在运行的任务可能已经错过了刚到达的邮件。
+
+        Returns:
+            tuple: (SyncJob, created)，created 表示是否新建了任务。
+        """
+        with self._lock:
+            if self._current is not None and not self._current.finished:
+                logging.info(f"同步任务 {self._current.id} 正在运行，新的请求将加入该任务。")
+                self._follow_up = self._follow_up or follow_up
+                return self._current, False
+            job = SyncJob(on_event=self.on_event)
+            self._current = job
+
+        thread = threading.Thread(target=self._run, args=(job,), name=f"sync-job-{job.id}", daemon=True)
+        thread.start()
+        return job, True
+
+    def _run(self, job):
+        """
+        在工作线程中执行同步流程，并记录开始、结束事件。
+        """
+        log_handler = _JobLogHandler(job)
+        root_logger = logging.getLogger()
+        root_logger.addHandler(log_handler)
+        job.emit('started')
+        logging.info(f"同步任务 {job.id} 开始。")
+        try:
+            job.result = self.target(cancel_event=job.cancel_event, report=job.emit)
+            job.status = 'cancelled' if job.cancel_event.is_set() else 'succeeded'
+        except Exception as e:
+            logging.error(f"同步任务 {job.id} 失败: {e}", exc_info=True)
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished_at = time.time()
+            logging.info(f"同步任务 {job.id} 结束，状态: {job.status}。")
+            root_logger.removeHandler(log_handler)
+            job.emit('finished', status=job.status, result=job.result, error=job.error)
+
+        with self._lock:
+            follow_up, self._follow_up = self._follow_up, False
+        if follow_up and job.status != 'cancelled':
+            logging.info("同步期间收到了新邮件通知，再执行一次同步。")
+            self.start()
+
+    def cancel(self):
+        """
+        请求取消正在运行的同步任务。
+
+        Returns:
+            SyncJob | None: 被请求取消的任务；没有运行中的任务时返回 None。
+        """
+        with self._lock:
+            job = self._current
+        if job is None or job.finished:
+            return None
+        job.cancel_event.set()
+        job.emit('cancel_requested')
+        logging.info(f"已请求取消同步任务 {job.id}。")
+        return job
+
+    def status(self):
+        """
+        返回当前（或最近一次）同步任务的状态摘要；从未同步过时返回 None。
+        """
+        with self._lock:
+            job = self._current
+        return job.to_dict() if job else None
+
+    def subscribe(self, job):
+        """
+        逐条产出任务的事件，任务结束后停止。
+
+        等待超过 SUBSCRIBER_WAIT_TIMEOUT 秒没有新事件时产出 None，调用方可借此发送心跳。
+        """
+        position = 0
+        while True:
+            with job.condition:
+                if position >= len(job.events) and not job.closed:
+                    job.condition.wait(timeout=SUBSCRIBER_WAIT_TIMEOUT)
+                new_events = job.events[position:]
+                # 'finished' 事件是最后一条，读到它即可结束
+                done = job.closed
+            position += len(new_events)
+            if not new_events and not done:
+                yield None
+            for event in new_events:
+                yield event
+            if done:
+                return
+
+
+class EventBroker:
+    """
+    进程内的事件广播：每个订阅者拥有独立的队列，发布的事件复制给所有订阅者。
+    """
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def publish(self, event):
+        """
+        将事件发送给所有订阅者。积压过多的订阅者会被断开，避免占用过多内存。
+        """
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                logging.warning("事件订阅者积压过多，断开该订阅者。")
+                with self._lock:
+                    self._subscribers.discard(subscriber)
+
+    def subscribe(self):
+        """
+        逐条产出发布的事件；超过 SUBSCRIBER_WAIT_TIMEOUT 秒没有事件时产出 None 作为心跳。
+        生成器被关闭（客户端断开）时自动取消订阅。
+        """
+        subscriber = queue.Queue(maxsize=BROKER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        try:
+            while True:
+                with self._lock:
+                    if subscriber not in self._subscribers:
+                        return
+                try:
+                    yield subscriber.get(timeout=SUBSCRIBER_WAIT_TIMEOUT)
+                except queue.Empty:
+                    yield None
+        finally:
+            with self._lock:
+                self._subscribers.discard(subscriber)
@@ -1,17 +1,25 @@
+import argparse
 import logging
 from datetime import datetime, timedelta
 import os
+import sqlite3
 import sys
-import openai
 from dotenv import load_dotenv
-import time # 导入 time 模块
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 # 将项目根目录添加到Python路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from backend.email_server.email_fetcher import EmailFetcher
 from backend.email_server.email_processor import EmailProcessor
+from backend.email_server.parse_pool import ParsePool
 from backend.chatgpt_handlers.email_analyzer import EmailAnalyzer
+from backend.chatgpt_handlers.prompt_compactor import PromptCompactor
+from backend.chatgpt_handlers.analysis_stream import AnalysisProgressReporter
+from backend.chatgpt_handlers.email_triage import EmailTriage
+from backend.chatgpt_handlers.rate_limiter import TokenBucketRateLimiter
+from backend.chatgpt_handlers.retry_policy import CircuitOpenError
+from backend.chatgpt_handlers.batch_client import BatchRunner, LocalBatchBackend, OpenAIBatchBackend
 from backend.data_storage.email_data_manager import EmailDataManager
 
 # 配置日志
@@ -20,10 +28,250 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # 加载环境变量
 load_dotenv()
 
-def update_emails_from_server():
+def search_new_uids(fetcher, data_manager, mailbox, mailbox_info, days_ago):
+    """
+    根据已保存的检查点搜索需要同步的邮件 UID。
+
+    - 检查点存在且 UIDVALIDITY 未变化：使用 'UID n:*' 只搜索新邮件。
+    - 首次同步或 UIDVALIDITY 变化：回退为 'SINCE <FETCH_DAYS_AGO>' 全量同步。
+    """
+    state = data_manager.get_sync_state(mailbox)
+    uidvalidity = mailbox_info.get('uidvalidity')
+
+    if state and uidvalidity is not None and state['uidvalidity'] == uidvalidity:
+        uidnext = state['uidnext']
+        logging.info(f"从邮箱 '{mailbox}' 增量同步 UID >= {uidnext} 的邮件...")
+        # 'n:*' 在没有新邮件时仍会返回最后一封邮件，因此需要再过滤一次
+        return [uid for uid in fetcher.search_uids(f'UID {uidnext}:*') if uid >= uidnext]
+
+    if state:
+        logging.warning(f"邮箱 '{mailbox}' 的 UIDVALIDITY 已变化 ({state['uidvalidity']} -> {uidvalidity})，将进行全量同步。")
+
+    date_criteria = (datetime.now() - timedelta(days=days_ago)).strftime('%d-%b-%Y')
+    criteria = f'SINCE {date_criteria}'
+    logging.info(f"开始从邮箱 '{mailbox}' 获取 '{criteria}' 的邮件...")
+    return fetcher.search_uids(criteria)
+
+def save_checkpoint(data_manager, mailbox, mailbox_info, uids, failed_uids):
+    """
+    保存同步检查点。若有邮件处理失败，则检查点停在最小的失败 UID，保证下次重试。
+    """
+    uidvalidity = mailbox_info.get('uidvalidity')
+    if uidvalidity is None:
+        logging.warning(f"服务器未提供邮箱 '{mailbox}' 的 UIDVALIDITY，不保存同步检查点。")
+        return
+
+    if failed_uids:
+        uidnext = min(failed_uids)
+    else:
+        candidates = [mailbox_info.get('uidnext') or 0]
+        if uids:
+            candidates.append(max(uids) + 1)
+        state = data_manager.get_sync_state(mailbox)
+        if state and state['uidvalidity'] == uidvalidity:
+            candidates.append(state['uidnext'])
+        uidnext = max(candidates)
+
+    if uidnext:
+        data_manager.save_sync_state(mailbox, uidvalidity, uidnext)
+
+def prepare_chatgpt_messages(processor, email_data, compactor=None):
+    """
+    提取邮件内容、压缩正文并格式化为ChatGPT输入。
+
+    正文压缩前后的估算 token 数记录在 email_data 的 'original_tokens' 和 'compacted_tokens' 中，
+    随邮件一起入库。
+
+    Returns:
+        list: ChatGPT messages。
+    """
+    subject = email_data.get('Subject')
+
+    # a. 处理邮件内容（解析阶段已提取过时直接使用）
+    if 'text_content' in email_data:
+        processed_data = email_data
+    else:
+        processed_data = processor.process_email_for_chatgpt(email_data['Body'])
+
+    # b. 去除模板内容并按 token 预算裁剪正文
+    text_content = processed_data['text_content']
+    if compactor:
+        compacted = compactor.compact(text_content)
+        text_content = compacted['text']
+        email_data['original_tokens'] = compacted['original_tokens']
+        email_data['compacted_tokens'] = compacted['compacted_tokens']
+        if compacted['compacted_tokens'] < compacted['original_tokens']:
+            logging.info(f"邮件 '{subject}' 正文已压缩: 约 {compacted['original_tokens']} -> {compacted['compacted_tokens']} tokens"
+                         f"{'（已按预算裁剪）' if compacted['truncated'] else ''}。")
+
+    # c. 格式化为ChatGPT输入
+    return processor.format_for_chatgpt_messages(
+        email_data['From'],
+        subject,
+        email_data.get('Date'),
+        text_content,
+        processed_data['image_urls']
+    )
+
+def find_new_emails(fetcher, data_manager, mailbox, mailbox_info, days_ago):
+    """
+    搜索需要同步的邮件，批量获取邮件头并与数据库去重，之后只需下载新邮件的正文。
+
+    Returns:
+        tuple: (搜索到的全部UID, 新邮件的邮件头列表, 邮件头获取失败的UID列表)。
+    """
+    uids = search_new_uids(fetcher, data_manager, mailbox, mailbox_info, days_ago)
+    if not uids:
+        return uids, [], []
+
+    headers = fetcher.fetch_headers(uids)
+    new_headers = data_manager.filter_new_emails(headers)
+    logging.info(f"共 {len(headers)} 封邮件，其中 {len(new_headers)} 封为新邮件。")
+    # 头部获取失败的 UID 视为失败，下次同步重试
+    header_uids = {h['UID'] for h in headers}
+    failed_uids = [uid for uid in uids if uid not in header_uids]
+    return uids, new_headers, failed_uids
+
+def analyze_email_data(processor, analyzer, email_data, compactor=None, report=None, triage=None):
+    """
+    在分析线程中处理单封邮件：预分类、准备ChatGPT输入并调用AI分析。
+    重试、熔断和降级（如去掉图片、换用备用模型）由 EmailAnalyzer.analyze_with_fallback 负责。
+
+    提供 triage 时先在本地预分类：群发邮件改用纯文本的便宜模型（失败时退回本地模板）或直接使用本地模板，
+    分流方式记录在 email_data 的 'triage_route' 中，随邮件一起入库。
+
+    提供 report 时以流式方式分析，生成过程以 'analysis_progress' 和 'analysis_section' 事件报告。
+
+    Returns:
+        str | None: 分析结果Markdown，降级链全部失败或熔断期间返回 None。
+    """
+    subject = email_data.get('Subject')
+
+    logging.info(f"处理新邮件: '{subject}'")
+    route = "full"
+    if triage:
+        decision = triage.classify(email_data)
+        route = decision['route']
+        if route != "full":
+            logging.info(f"邮件 '{subject}' 预分类为{decision['category']}（{decision['reason']}），分流方式: {route}。")
+    email_data['triage_route'] = route
+    chatgpt_messages = prepare_chatgpt_messages(processor, email_data, compactor)
+
+    progress = None
+    if report:
+        progress = AnalysisProgressReporter(report, email_data['UID'], subject, EmailDataManager.parse_markdown_to_json)
+
+    if route == "template":
+        return _template_analysis(email_data, progress)
+
+    degrade_chain = None
+    if route == "cheap_model":
+        degrade_chain = [("cheap_model", False, triage.bulk_model or analyzer.fallback_model or analyzer.model)]
+    try:
+        all_in_one_result = analyzer.analyze_with_fallback(
+            chatgpt_messages, "all_in_one",
+            on_delta=progress.on_delta if progress else None,
+            on_retry=progress.restart if progress else None,
+            degrade_chain=degrade_chain,
+        )
+    except CircuitOpenError as e:
+        logging.warning(f"邮件 '{subject}' 未分析: {e}")
+        return None
+    except Exception as e:
+        if route == "cheap_model":
+            logging.warning(f"群发邮件 '{subject}' 使用便宜模型分析失败: {e}。改用本地模板。")
+            if progress:
+                progress.restart()
+            email_data['triage_route'] = "template"
+            return _template_analysis(email_data, progress)
+        logging.error(f"邮件 '{subject}' 分析失败: {e}")
+        return None
+    if progress:
+        progress.finish()
+    logging.info(f"邮件 '{subject}' 分析成功。")
+    return all_in_one_result
+
+def _template_analysis(email_data, progress=None):
+    """
+    为群发邮件生成本地模板化的分析结果，并作为一次完整的生成过程报告给订阅者。
+    """
+    result = EmailTriage.template_analysis(email_data, email_data.get('text_content'))
+    if progress:
+        progress.on_delta(result)
+        progress.finish()
+    return result
+
+def store_analysis_result(future, email_data, data_manager, mailbox, failed_uids, report=None):
+    """
+    在写入线程中保存一封邮件的分析结果。所有数据库写入都经由此函数串行执行。
+
+    Args:
+        report (callable): 可选的进度回调，签名为 report(event_type, **data)。
+    """
+    report = report or _ignore_progress
+    subject = email_data.get('Subject')
+    if future.cancelled():
+        # 同步被取消时尚未开始的分析任务，计为失败以便下次重试
+        failed_uids.append(email_data['UID'])
+        return
+
+    try:
+        all_in_one_result = future.result()
+    except Exception as e:
+        logging.error(f"邮件 '{subject}' 分析过程中发生错误: {e}")
+        all_in_one_result = None
+
+    if all_in_one_result is None:
+        failed_uids.append(email_data['UID'])
+        report('email_failed', uid=email_data['UID'], subject=subject)
+        return
+
+    try:
+        # 传递 mailbox 参数
+        email_id = data_manager.save_email_data(email_data, all_in_one_result, mailbox)
+        if email_id is None:
+            report('email_skipped', uid=email_data['UID'], subject=subject)
+        else:
+            report('email_stored', uid=email_data['UID'], subject=subject, email_id=email_id,
+                   email=data_manager.get_email_summary(email_id),
+                   original_tokens=email_data.get('original_tokens'),
+                   compacted_tokens=email_data.get('compacted_tokens'),
+                   triage_route=email_data.get('triage_route'))
+    except Exception as db_e:
+        logging.error(f"存储邮件 '{subject}' 到数据库失败: {db_e}")
+        failed_uids.append(email_data['UID'])
+        report('email_failed', uid=email_data['UID'], subject=subject)
+
+def _ignore_progress(event_type, **data):
+    """默认的进度回调，不做任何事。"""
+
+def update_emails_from_server(cancel_event=None, report=None):
     """
     主函数，用于获取、检查、分析和存储新邮件。
+
+    Args:
+        cancel_event (threading.Event): 可选，被设置后停止获取新邮件，已在分析中的邮件处理完后结束。
+        report (callable): 可选的进度回调，签名为 report(event_type, **data)。
+
+    Returns:
+        dict: 同步结果摘要 {'found', 'stored', 'failed', 'cancelled', 'original_tokens', 'compacted_tokens', 'triage'}，
+            'original_tokens' 和 'compacted_tokens' 为已入库邮件正文压缩前后的估算 token 总数，
+            'triage' 为预分类的分流和预测分类计数。
     """
+    report = report or _ignore_progress
+    summary = {"found": 0, "stored": 0, "failed": 0, "cancelled": False,
+               "original_tokens": 0, "compacted_tokens": 0}
+
+    def is_cancelled():
+        return cancel_event is not None and cancel_event.is_set()
+
+    def report_and_count(event_type, **data):
+        if event_type == 'email_stored':
+            summary['stored'] += 1
+            summary['original_tokens'] += data.get('original_tokens') or 0
+            summary['compacted_tokens'] += data.get('compacted_tokens') or 0
+        report(event_type, **data)
+
     fetcher = EmailFetcher()
     data_manager = EmailDataManager() # db_path 将从 .env 加载
     
@@ -31,100 +279,307 @@ def update_emails_from_server():
         # 1. 连接到邮件服务器
         fetcher.connect()
 
-        # 2. 从 .env 文件获取搜索条件
+        # 2. 从 .env 文件获取搜索条件，并根据检查点决定增量或全量同步
         days_ago = int(os.getenv("FETCH_DAYS_AGO", 1))
         mailbox = os.getenv("MAILBOX", "INBOX")
-        date_criteria = (datetime.now() - timedelta(days=days_ago)).strftime('%d-%b-%Y')
-        criteria = f'SINCE {date_criteria}'
-        
-        logging.info(f"开始从邮箱 '{mailbox}' 获取 '{criteria}' 的邮件...")
-        emails = fetcher.fetch_emails(mailbox=mailbox, criteria=criteria)
-        
-        if not emails:
+
+        mailbox_info = fetcher.select_mailbox(mailbox)
+        if mailbox_info is None:
+            logging.error(f"无法选择邮箱 '{mailbox}'，同步终止。")
+            raise RuntimeError(f"无法选择邮箱 '{mailbox}'")
+
+        uids, new_headers, failed_uids = find_new_emails(fetcher, data_manager, mailbox, mailbox_info, days_ago)
+        new_uids = [h['UID'] for h in new_headers]
+        summary['found'] = len(new_uids)
+        report('found', total=len(new_uids), mailbox=mailbox)
+        if not new_uids:
             logging.info("没有找到新邮件。")
-            return
+            save_checkpoint(data_manager, mailbox, mailbox_info, uids, failed_uids)
+            return summary
 
-        logging.info(f"获取到 {len(emails)} 封邮件，开始处理...")
+        logging.info(f"开始逐封获取并处理 {len(new_uids)} 封新邮件...")
+        sizes = {h['UID']: h['Size'] for h in new_headers}
+        fetched_uids = set()
 
-        # 3. 初始化处理器和分析器
+        # 3. 初始化处理器、限流器和分析器
         processor = EmailProcessor()
-        analyzer = EmailAnalyzer()
+        rate_limiter = TokenBucketRateLimiter(
+            requests_per_minute=int(os.getenv("OPENAI_RPM", 60)),
+            tokens_per_minute=int(os.getenv("OPENAI_TPM", 0))
+        )
+        analyzer = EmailAnalyzer(rate_limiter=rate_limiter)
+        compactor = PromptCompactor()
+        triage = EmailTriage()
+        triage.train(data_manager)
+        concurrency = max(1, int(os.getenv("ANALYSIS_CONCURRENCY", 4)))
+        # 邮件较多（如首次全量同步）时才启动解析进程池，少量邮件在当前进程中解析更快
+        parse_workers = int(os.getenv("PARSE_WORKERS", 2))
+        if len(new_uids) < int(os.getenv("PARSE_POOL_MIN_EMAILS", 50)):
+            parse_workers = 0
 
-        # 4. 遍历邮件并更新到数据库
-        for email_data in emails:
-            subject = email_data.get('Subject')
-            received_date = email_data.get('Date')
-            # 从原始 'From' 字段解析出纯邮箱地址用于检查
-            _, from_email = data_manager._parse_from_address(email_data.get('From'))
+        # 4. 以流水线方式分批获取原始邮件，经解析进程池按顺序产出，再交给分析线程池；
+        #    数据库写入只在当前线程进行
+        pending = {}
+        with ParsePool(workers=parse_workers) as parse_pool, \
+                ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="analyzer") as executor:
+            parsed_emails = parse_pool.iter_parsed(fetcher.iter_raw_batches(new_uids, sizes=sizes))
+            for email_data in parsed_emails:
+                if is_cancelled():
+                    logging.warning("同步已被取消，停止获取新邮件。")
+                    break
+                # 熔断期间暂停分发；持续不可用时结束本次同步，剩余邮件留待下次
+                if not analyzer.circuit_breaker.wait_until_ready(cancel_event):
+                    break
+                fetched_uids.add(email_data['UID'])
+                future = executor.submit(analyze_email_data, processor, analyzer, email_data, compactor, report_and_count,
+                                         triage)
+                pending[future] = email_data
+                # 限制在途邮件数量，避免获取速度远快于分析时占用过多内存
+                if len(pending) >= concurrency * 2:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        store_analysis_result(future, pending.pop(future), data_manager, mailbox, failed_uids, report_and_count)
 
-            # 检查邮件是否已存在
-            if data_manager.email_exists(subject, from_email, received_date):
-                logging.info(f"邮件 '{subject}' 已存在于数据库中，跳过。")
-                continue
+            # 取消时丢弃尚未开始的分析任务，等待正在进行的任务完成
+            if is_cancelled():
+                for future in pending:
+                    future.cancel()
+
+            # 等待剩余的分析任务完成
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    store_analysis_result(future, pending.pop(future), data_manager, mailbox, failed_uids, report_and_count)
+
+        if analyzer.cache:
+            analyzer.cache.log_stats()
+        triage.log_stats()
+        summary['triage'] = triage.stats()
+        if summary['original_tokens']:
+            saved = summary['original_tokens'] - summary['compacted_tokens']
+            logging.info(f"本次入库邮件正文约 {summary['original_tokens']} tokens，压缩后约 {summary['compacted_tokens']} tokens，"
+                         f"节省 {saved / summary['original_tokens']:.0%}。")
 
-            logging.info(f"处理新邮件: '{subject}'")
-            
-            # a. 处理邮件内容
-            processed_data = processor.process_email_for_chatgpt(email_data['Body'])
-            
-            # b. 格式化为ChatGPT输入
-            chatgpt_messages = processor.format_for_chatgpt_messages(
-                email_data['From'],
-                subject,
-                received_date,
-                processed_data['text_content'],
-                processed_data['image_urls']
-            )
-            
-            # c. 使用AI分析邮件，带重试逻辑
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    # 第一次尝试：带图片分析
-                    all_in_one_result = analyzer.analyze_email(chatgpt_messages, "all_in_one", include_images=True)
-                    logging.info(f"邮件 '{subject}' (带图片)分析成功。")
-                    break # 成功则跳出重试循环
-                except openai.APIError as e:
-                    if "Request timed out." in str(e):
-                        delay = 20
-                        logging.warning(f"带图片的邮件分析请求超时: {e}。将在 {delay} 秒后重试 (尝试 {attempt + 1}/{max_retries})...")
-                        time.sleep(delay)
-                    else:
-                        delay = 10
-                        logging.warning(f"带图片的邮件分析失败: {e}。将在 {delay} 秒后重试 (尝试 {attempt + 1}/{max_retries})...")
-                        time.sleep(delay)
-                except Exception as e:
-                    delay = 10
-                    logging.warning(f"带图片的邮件分析发生未知错误: {e}。将在 {delay} 秒后重试 (尝试 {attempt + 1}/{max_retries})...")
-                    time.sleep(delay)
-            else: # 如果所有重试都失败了
-                logging.error(f"邮件 '{subject}' 经过 {max_retries} 次重试后仍无法带图片分析。将尝试不带图片进行分析...")
-                try:
-                    # 尝试不带图片分析
-                    all_in_one_result = analyzer.analyze_email(chatgpt_messages, "all_in_one", include_images=False)
-                    logging.info(f"邮件 '{subject}' (不带图片)分析成功。")
-                except Exception as retry_e:
-                    logging.error(f"邮件 '{subject}' 不带图片的分析也失败了: {retry_e}")
-                    continue # 跳过这封邮件的处理
-
-            # d. 存储到数据库
-            try:
-                # 传递 mailbox 参数
-                data_manager.save_email_data(email_data, all_in_one_result, mailbox)
-            except Exception as db_e:
-                logging.error(f"存储邮件 '{subject}' 到数据库失败: {db_e}")
-            
-            time.sleep(5) # 每处理一封邮件后等待5秒
+        # 5. 保存同步检查点（未能获取到的邮件同样视为失败）
+        failed_uids += [uid for uid in new_uids if uid not in fetched_uids]
+        save_checkpoint(data_manager, mailbox, mailbox_info, uids, failed_uids)
+        # 每次同步后顺带压缩变更日志
+        data_manager.compact_changes()
+        summary['failed'] = len(set(failed_uids) & set(new_uids))
+        summary['cancelled'] = is_cancelled()
+        return summary
 
     except Exception as e:
         logging.error(f"执行邮件更新时发生严重错误: {e}")
+        # 由调用方（如后台同步任务）决定如何处理失败
+        raise
     finally:
-        # 5. 关闭连接
+        # 6. 关闭连接
         if fetcher:
             fetcher.logout()
         if data_manager:
             data_manager.close()
         logging.info("邮件更新流程结束。")
 
+def create_batch_runner(analyzer):
+    """
+    根据 BATCH_BACKEND 创建批处理管理器：'openai'（默认）使用 OpenAI Batch API，
+    'local' 使用本地替身（用于测试）。
+    """
+    batch_dir = os.getenv("BATCH_DIR", "batches")
+    if os.getenv("BATCH_BACKEND", "openai").lower() == 'local':
+        backend = LocalBatchBackend(os.path.join(batch_dir, 'local'))
+    else:
+        backend = OpenAIBatchBackend(analyzer.client)
+    return BatchRunner(backend, batch_dir=batch_dir)
+
+def ingest_batch_results(runner, state, data_manager, report):
+    """
+    将已结束的批处理结果经 save_email_data 入库。按 custom_id（邮件去重键）对应清单中的邮件，
+    已入库的邮件不会重复写入，因此重复执行是安全的。
+    有结果写入数据库失败时不标记该批处理已入库，下次运行重新入库（结果不会因此丢失或被重复提交）；
+    空结果或无法解析的结果与分析失败相同，只计为失败，批处理照常标记入库，邮件在下次运行时重新提交。
+
+    Returns:
+        tuple: (成功入库或已存在的 custom_id 集合, 失败的 custom_id 集合)。
+    """
+    manifest = runner.load_manifest(state)
+    ingested, failed = set(), set()
+    store_failed = False
+    for custom_id, content, error in runner.iter_results(state):
+        entry = manifest.get(custom_id)
+        if entry is None:
+            logging.warning(f"批处理 {state['batch_id']} 返回了未知的 custom_id: {custom_id}")
+            continue
+        email_data = entry['email']
+        subject = email_data.get('Subject')
+        if not error and not (isinstance(content, str) and content.strip()):
+            error = "模型返回了空结果"
+        if error:
+            logging.error(f"邮件 '{subject}' 批处理分析失败: {error}")
+            failed.add(custom_id)
+            report('email_failed', uid=entry['uid'], subject=subject)
+            continue
+        try:
+            email_id = data_manager.save_email_data(email_data, EmailAnalyzer.clean_result(content), entry['mailbox'])
+        except sqlite3.Error as db_e:
+            # 只有数据库写入失败时保留批处理，下次运行重新入库
+            logging.error(f"存储邮件 '{subject}' 到数据库失败: {db_e}")
+            failed.add(custom_id)
+            store_failed = True
+            report('email_failed', uid=entry['uid'], subject=subject)
+            continue
+        except Exception as e:
+            logging.error(f"邮件 '{subject}' 的批处理结果无法入库: {e}")
+            failed.add(custom_id)
+            report('email_failed', uid=entry['uid'], subject=subject)
+            continue
+        ingested.add(custom_id)
+        if email_id is None:
+            report('email_skipped', uid=entry['uid'], subject=subject)
+        else:
+            report('email_stored', uid=entry['uid'], subject=subject, email_id=email_id,
+                   email=data_manager.get_email_summary(email_id),
+                   original_tokens=email_data.get('original_tokens'),
+                   compacted_tokens=email_data.get('compacted_tokens'))
+    # 没有返回结果的请求（批处理过期或被取消）同样视为失败
+    failed.update(set(manifest) - ingested - failed)
+    if store_failed:
+        logging.warning(f"批处理 {state['batch_id']} 有结果未能写入数据库，将在下次运行时重新入库。")
+    else:
+        runner.mark_ingested(state)
+    logging.info(f"批处理 {state['batch_id']} 已入库: 成功 {len(ingested)} 封，失败 {len(failed)} 封。")
+    return ingested, failed
+
+def update_emails_in_batch(cancel_event=None, report=None):
+    """
+    批处理模式的同步：把新邮件的分析请求写成 JSONL 文件提交给批处理接口，
+    轮询到结束后把结果入库。适合回填和夜间任务，不受实时接口的速率限制。
+
+    每次运行会先继续之前未入库的批处理；仍在处理中的批次里的邮件不会被重复提交。
+    等待超过 BATCH_WAIT_TIMEOUT 秒时直接结束，结果留给下次运行入库。
+
+    Returns:
+        dict: 同步结果摘要 {'found', 'stored', 'failed', 'cancelled', 'submitted', 'pending_batches'}。
+    """
+    report = report or _ignore_progress
+    summary = {"found": 0, "stored": 0, "failed": 0, "cancelled": False, "submitted": 0, "pending_batches": 0}
+
+    def report_and_count(event_type, **data):
+        if event_type == 'email_stored':
+            summary['stored'] += 1
+        elif event_type == 'email_failed':
+            summary['failed'] += 1
+        report(event_type, **data)
+
+    fetcher = EmailFetcher()
+    data_manager = EmailDataManager()
+    wait_timeout = float(os.getenv("BATCH_WAIT_TIMEOUT", 86400))
+
+    try:
+        analyzer = EmailAnalyzer()
+        runner = create_batch_runner(analyzer)
+
+        # 1. 先入库之前已完成的批处理
+        for state in runner.pending():
+            if state['status'] == 'submitted' and not runner.wait(state, timeout=0):
+                summary['pending_batches'] += 1
+                continue
+            ingest_batch_results(runner, state, data_manager, report_and_count)
+
+        # 2. 搜索新邮件，跳过仍在处理中的批次里已提交的邮件
+        fetcher.connect()
+        days_ago = int(os.getenv("FETCH_DAYS_AGO", 1))
+        mailbox = os.getenv("MAILBOX", "INBOX")
+        mailbox_info = fetcher.select_mailbox(mailbox)
+        if mailbox_info is None:
+            logging.error(f"无法选择邮箱 '{mailbox}'，同步终止。")
+            raise RuntimeError(f"无法选择邮箱 '{mailbox}'")
+
+        uids, new_headers, failed_uids = find_new_emails(fetcher, data_manager, mailbox, mailbox_info, days_ago)
+        in_flight = runner.pending_custom_ids()
+        new_headers_to_submit = []
+        for header in new_headers:
+            if data_manager.message_key(header) in in_flight:
+                # 结果入库前不推进检查点
+                failed_uids.append(header['UID'])
+            else:
+                new_headers_to_submit.append(header)
+        new_uids = [h['UID'] for h in new_headers_to_submit]
+        summary['found'] = len(new_uids)
+        report('found', total=len(new_uids), mailbox=mailbox)
+
+        # 3. 下载并解析新邮件，生成批处理请求和清单
+        requests, manifest, submitted_keys = [], [], {}
+        seen_keys = set()
+        if new_uids:
+            processor = EmailProcessor()
+            compactor = PromptCompactor()
+            sizes = {h['UID']: h['Size'] for h in new_headers_to_submit}
+            parse_workers = int(os.getenv("PARSE_WORKERS", 2))
+            if len(new_uids) < int(os.getenv("PARSE_POOL_MIN_EMAILS", 50)):
+                parse_workers = 0
+            with ParsePool(workers=parse_workers) as parse_pool:
+                for email_data in parse_pool.iter_parsed(fetcher.iter_raw_batches(new_uids, sizes=sizes)):
+                    if cancel_event is not None and cancel_event.is_set():
+                        logging.warning("同步已被取消，停止获取新邮件。")
+                        break
+                    custom_id = data_manager.message_key(email_data)
+                    submitted_keys[email_data['UID']] = custom_id
+                    if custom_id in seen_keys:
+                        # 同一封邮件（相同 Message-ID）只提交一次
+                        continue
+                    seen_keys.add(custom_id)
+                    chatgpt_messages = prepare_chatgpt_messages(processor, email_data, compactor)
+                    requests.append(analyzer.build_batch_request(custom_id, chatgpt_messages, "all_in_one"))
+                    manifest.append({
+                        "custom_id": custom_id,
+                        "uid": email_data['UID'],
+                        "mailbox": mailbox,
+                        "email": {key: email_data.get(key) for key in (
+                            'From', 'Subject', 'Date', 'Body', 'Message-ID', 'original_tokens', 'compacted_tokens'
+                        )},
+                    })
+
+        # 4. 提交批处理并等待结果
+        ingested = set()
+        if requests:
+            state = runner.create(requests, manifest)
+            summary['submitted'] = len(requests)
+            report('batch_submitted', batch_id=state['batch_id'], total=len(requests))
+            if runner.wait(state, timeout=wait_timeout, cancel_event=cancel_event):
+                ingested, _ = ingest_batch_results(runner, state, data_manager, report_and_count)
+            else:
+                summary['pending_batches'] += 1
+                logging.info(f"批处理 {state['batch_id']} 尚未完成，结果将在下次运行时入库。")
+
+        # 5. 保存检查点：未入库的邮件（包括尚未完成的批次）下次重新检查
+        failed_uids += [uid for uid in new_uids if submitted_keys.get(uid) not in ingested]
+        save_checkpoint(data_manager, mailbox, mailbox_info, uids, failed_uids)
+        data_manager.compact_changes()
+        summary['cancelled'] = cancel_event is not None and cancel_event.is_set()
+        return summary
+
+    except Exception as e:
+        logging.error(f"执行批处理邮件更新时发生严重错误: {e}")
+        raise
+    finally:
+        if fetcher:
+            fetcher.logout()
+        if data_manager:
+            data_manager.close()
+        logging.info("批处理邮件更新流程结束。")
+
 if __name__ == "__main__":
-    update_emails_from_server()
+    parser = argparse.ArgumentParser(description="获取、分析并存储新邮件")
+    parser.add_argument('--batch', action='store_true',
+                        help="使用批处理接口分析（也可设置 ANALYSIS_BATCH_MODE=true）")
+    args = parser.parse_args()
+    batch_mode = args.batch or os.getenv("ANALYSIS_BATCH_MODE", "false").lower() == "true"
+    try:
+        if batch_mode:
+            update_emails_in_batch()
+        else:
+            update_emails_from_server()
+    except Exception:
+        sys.exit(1)
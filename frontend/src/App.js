@@ -13,10 +13,16 @@ function App() {
     const [readFilter, setReadFilter] = useState('all');
     const [starredFilter, setStarredFilter] = useState('all');
     const [loading, setLoading] = useState(true);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [listVersion, setListVersion] = useState(null);
+    const [loadingMore, setLoadingMore] = useState(false);
     const [error, setError] = useState(null);
     const [showSettings, setShowSettings] = useState(false);
     const [showSyncLog, setShowSyncLog] = useState(false);
     const [syncLogs, setSyncLogs] = useState([]);
+    const [isSyncing, setIsSyncing] = useState(false);
+    // 正在流式分析的邮件：uid -> { subject, attempt, text }
+    const [analysisPreviews, setAnalysisPreviews] = useState({});
     const [searchQuery, setSearchQuery] = useState('');
     const [debouncedQuery, setDebouncedQuery] = useState('');
     const [searchResults, setSearchResults] = useState([]);
@@ -116,11 +122,23 @@ function App() {
         }
     }, [selectedEmail]);
 
-    const handleSelectEmail = (email) => {
-        if (email && !email.is_read) {
+    const handleSelectEmail = async (email) => {
+        if (!email) {
+            setSelectedEmail(null);
+            return;
+        }
+        if (!email.is_read) {
             handleUpdateEmailStatus(email.id, { is_read: true });
         }
-        setSelectedEmail(email);
+        // 列表只包含轻量字段，正文和分析结果需要单独获取
+        try {
+            const response = await fetch(`http://localhost:5001/api/emails/${email.id}`);
+            if (!response.ok) throw new Error(`HTTP 错误! 状态: ${response.status}`);
+            setSelectedEmail(await response.json());
+        } catch (e) {
+            console.error("获取邮件详情失败:", e);
+            setError(e.message);
+        }
     };
 
     const fetchEmails = useCallback(async () => {
@@ -129,7 +147,9 @@ function App() {
             const response = await fetch('http://localhost:5001/api/emails');
             if (!response.ok) throw new Error(`HTTP 错误! 状态: ${response.status}`);
             const data = await response.json();
-            setEmails(data);
+            setEmails(data.emails);
+            setNextCursor(data.next_cursor);
+            setListVersion(data.version);
         } catch (e) {
             setError(e.message);
             console.error("获取邮件失败:", e);
@@ -138,43 +158,171 @@ function App() {
         }
     }, []);
 
+    const loadMoreEmails = useCallback(async () => {
+        if (!nextCursor) return;
+        try {
+            setLoadingMore(true);
+            const response = await fetch(`http://localhost:5001/api/emails?cursor=${encodeURIComponent(nextCursor)}`);
+            if (!response.ok) throw new Error(`HTTP 错误! 状态: ${response.status}`);
+            const data = await response.json();
+            setEmails(prev => [...prev, ...data.emails]);
+            setNextCursor(data.next_cursor);
+        } catch (e) {
+            console.error("加载更多邮件失败:", e);
+            setError(e.message);
+        } finally {
+            setLoadingMore(false);
+        }
+    }, [nextCursor]);
+
+    // 只拉取上次加载之后变更过的邮件并合并到列表中
+    const applyEmailChanges = useCallback(async () => {
+        if (listVersion === null) {
+            fetchEmails();
+            return;
+        }
+        try {
+            const response = await fetch(`http://localhost:5001/api/emails/changes?since=${listVersion}`);
+            if (!response.ok) throw new Error(`HTTP 错误! 状态: ${response.status}`);
+            const data = await response.json();
+            if (data.reset) {
+                fetchEmails();
+                return;
+            }
+            if (data.changes.length > 0) {
+                setEmails(prev => {
+                    const changed = new Map(data.changes.map(e => [e.id, e]));
+                    const merged = prev.map(e => changed.has(e.id) ? changed.get(e.id) : e);
+                    const existing = new Set(prev.map(e => e.id));
+                    const added = data.changes.filter(e => !existing.has(e.id));
+                    if (added.length === 0) return merged;
+                    return [...added, ...merged].sort((a, b) => (b.received_ts - a.received_ts) || (b.id - a.id));
+                });
+            }
+            setListVersion(data.version);
+        } catch (e) {
+            console.error("获取邮件变更失败:", e);
+            fetchEmails();
+        }
+    }, [listVersion, fetchEmails]);
+
     useEffect(() => {
         if (!showSettings) {
             fetchEmails();
         }
     }, [fetchEmails, showSettings]);
 
+    // 订阅服务端事件流，新邮件入库后直接插入列表，无需重新加载
+    useEffect(() => {
+        const eventSource = new EventSource('http://localhost:5001/api/events');
+        eventSource.onmessage = (event) => {
+            const serverEvent = JSON.parse(event.data);
+            if (serverEvent.type === 'email_stored') {
+                const newEmail = serverEvent.email;
+                setEmails(prev => {
+                    if (prev.some(e => e.id === newEmail.id)) return prev;
+                    return [newEmail, ...prev].sort((a, b) => (b.received_ts - a.received_ts) || (b.id - a.id));
+                });
+            }
+        };
+        eventSource.onerror = (err) => {
+            // EventSource 会自动重连，这里只记录错误
+            console.error("事件流连接错误:", err);
+        };
+        return () => eventSource.close();
+    }, []);
+
+    const formatSyncEvent = (event) => {
+        switch (event.type) {
+            case 'started':
+                return '--- 开始执行: 邮件更新 ---';
+            case 'log':
+                return event.level === 'INFO' ? event.message : `${event.level}: ${event.message}`;
+            case 'found':
+                return `--- 找到 ${event.total} 封新邮件 ---`;
+            case 'email_stored':
+                return `已保存: ${event.subject}`;
+            case 'email_failed':
+                return `处理失败: ${event.subject}`;
+            case 'analysis_section':
+                return `分析中: ${event.subject} — 已生成「${event.section}」`;
+            case 'cancel_requested':
+                return '--- 已请求取消，等待正在处理的邮件完成 ---';
+            default:
+                return null;
+        }
+    };
+
+    const updateAnalysisPreview = (event) => {
+        setAnalysisPreviews(prev => {
+            if (event.type === 'analysis_progress') {
+                const current = prev[event.uid];
+                // 重试时（attempt 变化）丢弃上一次的部分内容
+                const text = current && current.attempt === event.attempt ? current.text + event.text : event.text;
+                return { ...prev, [event.uid]: { subject: event.subject, attempt: event.attempt, text } };
+            }
+            if ((event.type === 'email_stored' || event.type === 'email_failed' || event.type === 'email_skipped') && prev[event.uid]) {
+                const { [event.uid]: _, ...rest } = prev;
+                return rest;
+            }
+            return prev;
+        });
+    };
+
     const handleSync = () => {
         setSyncLogs([]);
+        setAnalysisPreviews({});
         setShowSyncLog(true);
+        setIsSyncing(true);
         const eventSource = new EventSource('http://localhost:5001/api/sync-emails');
         eventSource.onmessage = (event) => {
-            const logLine = event.data;
-            if (logLine.startsWith('ERROR:')) {
-                setSyncLogs(prev => [...prev, logLine]);
-                eventSource.close();
-            } else if (logLine === 'SYNC_COMPLETE') {
-                setSyncLogs(prev => [...prev, '--- 同步成功完成！---']);
+            const syncEvent = JSON.parse(event.data);
+            if (syncEvent.type === 'finished') {
                 eventSource.close();
-                fetchEmails();
+                setIsSyncing(false);
+                setAnalysisPreviews({});
+                if (syncEvent.status === 'failed') {
+                    setSyncLogs(prev => [...prev, `ERROR: 同步失败: ${syncEvent.error}`]);
+                    return;
+                }
+                const result = syncEvent.result || {};
+                const summary = syncEvent.status === 'cancelled' ? '--- 同步已取消 ---' : '--- 同步成功完成！---';
+                const routes = (result.triage && result.triage.routes) || {};
+                const triaged = (routes.cheap_model || 0) + (routes.template || 0);
+                const triageNote = triaged ? `，其中 ${triaged} 封群发邮件经本地预分类简化分析` : '';
+                setSyncLogs(prev => [...prev, `${summary} 新增 ${result.stored || 0} 封，失败 ${result.failed || 0} 封${triageNote}`]);
+                applyEmailChanges();
                 setSelectedEmail(null);
-                setTimeout(() => setShowSyncLog(false), 2000);
-            } else {
+                if (syncEvent.status === 'succeeded') {
+                    setTimeout(() => setShowSyncLog(false), 2000);
+                }
+                return;
+            }
+            updateAnalysisPreview(syncEvent);
+            const logLine = formatSyncEvent(syncEvent);
+            if (logLine) {
                 setSyncLogs(prev => [...prev, logLine]);
             }
         };
         eventSource.onerror = (err) => {
             console.error("EventSource 失败:", err);
             setSyncLogs(prev => [...prev, '--- 连接错误，同步中断 ---']);
+            setIsSyncing(false);
             eventSource.close();
         };
     };
 
+    const handleCancelSync = async () => {
+        try {
+            await fetch('http://localhost:5001/api/sync/cancel', { method: 'POST' });
+        } catch (err) {
+            console.error("取消同步失败:", err);
+        }
+    };
+
     const filteredEmails = useMemo(() => {
         return emails.filter(email => {
-            const urgencyBlock = email.analysis_json?.['邮件紧急程度评估'] || email.analysis_json?.['郵件緊急程度評估'];
-            const urgency = urgencyBlock?.[0]?.['- **紧急程度**'] || urgencyBlock?.[0]?.['- **緊急程度**'];
-            const matchesUrgency = urgencyFilter === 'all' || urgency === urgencyFilter;
+            const matchesUrgency = urgencyFilter === 'all' || email.urgency === urgencyFilter;
             const matchesReadStatus = readFilter === 'all' || (readFilter === 'read' && email.is_read) || (readFilter === 'unread' && !email.is_read);
             const matchesStarredStatus = starredFilter === 'all' || (starredFilter === 'starred' && email.is_starred);
             return matchesUrgency && matchesReadStatus && matchesStarredStatus;
@@ -209,6 +357,9 @@ function App() {
             <SyncLogModal 
                 show={showSyncLog} 
                 logs={syncLogs} 
+                previews={analysisPreviews}
+                isSyncing={isSyncing}
+                onCancel={handleCancelSync}
                 onClose={() => setShowSyncLog(false)} 
             />
             <SearchBar 
@@ -237,6 +388,9 @@ function App() {
                             }}
                             onSync={handleSync}
                             onShowSettings={() => setShowSettings(true)}
+                            hasMore={Boolean(nextCursor)}
+                            loadingMore={loadingMore}
+                            onLoadMore={loadMoreEmails}
                         />
                         <main className="main-content">
                             <EmailDetail 
@@ -1,7 +1,7 @@
 import React, { useState } from 'react';
 import './Sidebar.css';
 
-const Sidebar = ({ groupedEmails, onSelectEmail, onFilterChange, onSync, onShowSettings }) => {
+const Sidebar = ({ groupedEmails, onSelectEmail, onFilterChange, onSync, onShowSettings, hasMore, loadingMore, onLoadMore }) => {
     const [expanded, setExpanded] = useState(() => {
         const initialExpanded = {};
         Object.keys(groupedEmails).forEach(year => {
@@ -25,9 +25,7 @@ const Sidebar = ({ groupedEmails, onSelectEmail, onFilterChange, onSync, onShowS
     };
 
     const getUrgencyClass = (email) => {
-        const urgencyBlock = email.analysis_json?.['邮件紧急程度评估'] || email.analysis_json?.['郵件緊急程度評估'];
-        const urgency = urgencyBlock?.[0]?.['- **紧急程度**'] || urgencyBlock?.[0]?.['- **緊急程度**'];
-        switch (urgency) {
+        switch (email.urgency) {
             case '高': return 'urgency-high';
             case '中': return 'urgency-medium';
             case '低': return 'urgency-low';
@@ -37,9 +35,7 @@ const Sidebar = ({ groupedEmails, onSelectEmail, onFilterChange, onSync, onShowS
 
     const sortEmails = (emails) => {
         const getUrgencyValue = (email) => {
-            const urgencyBlock = email.analysis_json?.['邮件紧急程度评估'] || email.analysis_json?.['郵件緊急程度評估'];
-            const urgency = urgencyBlock?.[0]?.['- **紧急程度**'] || urgencyBlock?.[0]?.['- **緊急程度**'];
-            switch (urgency) {
+            switch (email.urgency) {
                 case '高': return 1;
                 case '中': return 2;
                 case '低': return 3;
@@ -48,9 +44,7 @@ const Sidebar = ({ groupedEmails, onSelectEmail, onFilterChange, onSync, onShowS
         };
 
         const getCategoryValue = (email) => {
-            const categoryBlock = email.analysis_json?.['邮件摘要'] || email.analysis_json?.['郵件摘要'];
-            const category = categoryBlock?.[0]?.['**邮件分类**'] || categoryBlock?.[0]?.['**郵件分類**'];
-            switch (category) {
+            switch (email.category) {
                 case '学术相关': return 1;
                 case '行政事务': return 2;
                 case '社交与个人': return 3;
@@ -79,10 +73,8 @@ const Sidebar = ({ groupedEmails, onSelectEmail, onFilterChange, onSync, onShowS
                 return categoryA - categoryB;
             }
 
-            const summaryBlockA = a.analysis_json?.['邮件摘要'] || a.analysis_json?.['郵件摘要'];
-            const summaryA = summaryBlockA?.[0]?.['**主题**'] || summaryBlockA?.[0]?.['**主題**'] || a.subject;
-            const summaryBlockB = b.analysis_json?.['邮件摘要'] || b.analysis_json?.['郵件摘要'];
-            const summaryB = summaryBlockB?.[0]?.['**主题**'] || summaryBlockB?.[0]?.['**主題**'] || b.subject;
+            const summaryA = a.summary_title || a.subject || '';
+            const summaryB = b.summary_title || b.subject || '';
 
             const titleTypeA = getTitleTypeValue(summaryA);
             const titleTypeB = getTitleTypeValue(summaryB);
@@ -94,11 +86,7 @@ const Sidebar = ({ groupedEmails, onSelectEmail, onFilterChange, onSync, onShowS
         });
     };
 
-    const categoryEmail = (email) => {
-        const categoryBlock = email.analysis_json?.['邮件摘要'] || email.analysis_json?.['郵件摘要'];
-        const category = categoryBlock?.[0]?.['**邮件分类**'] || categoryBlock?.[0]?.['**郵件分類**'];
-        return category;
-    };
+    const categoryEmail = (email) => email.category;
     const {
         onUrgencyCycle,
         onReadCycle,
@@ -124,8 +112,7 @@ const Sidebar = ({ groupedEmails, onSelectEmail, onFilterChange, onSync, onShowS
     };
 
     const renderEmailItem = (email) => {
-        const summaryBlock = email.analysis_json?.['邮件摘要'] || email.analysis_json?.['郵件摘要'];
-        const summary = summaryBlock?.[0]?.['**主题**'] || summaryBlock?.[0]?.['**主題**'] || email.subject;
+        const summary = email.summary_title || email.subject;
         return (
             <div key={email.id} className={`email-item ${email.is_read ? 'email-read' : ''}`} onClick={() => onSelectEmail(email)}>
                 <div className="email-item-header">
@@ -196,6 +183,11 @@ const Sidebar = ({ groupedEmails, onSelectEmail, onFilterChange, onSync, onShowS
                         </div>
                     );
                 })}
+                {hasMore && (
+                    <button onClick={onLoadMore} className="load-more-button" disabled={loadingMore}>
+                        {loadingMore ? '加载中...' : '加载更多'}
+                    </button>
+                )}
             </div>
         </div>
     );
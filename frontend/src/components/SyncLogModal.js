@@ -1,7 +1,10 @@
 import React, { useEffect, useRef } from 'react';
 import './SyncLogModal.css';
 
-const SyncLogModal = ({ logs, show, onClose }) => {
+// 每封邮件的实时预览只显示最后这些字符
+const PREVIEW_TAIL_CHARS = 400;
+
+const SyncLogModal = ({ logs, previews = {}, show, isSyncing, onCancel, onClose }) => {
     const logContentRef = useRef(null);
 
     // Auto-scroll to the bottom of the log
@@ -20,7 +23,24 @@ const SyncLogModal = ({ logs, show, onClose }) => {
                 <pre ref={logContentRef} className="sync-log-output">
                     {logs.join('\n')}
                 </pre>
-                <button onClick={onClose} className="close-log-button">关闭</button>
+                {Object.entries(previews).length > 0 && (
+                    <div className="sync-analysis-previews">
+                        {Object.entries(previews).map(([uid, preview]) => (
+                            <div key={uid} className="sync-analysis-preview">
+                                <div className="sync-analysis-preview-title">正在分析: {preview.subject}</div>
+                                <pre className="sync-analysis-preview-text">
+                                    {preview.text.slice(-PREVIEW_TAIL_CHARS)}
+                                </pre>
+                            </div>
+                        ))}
+                    </div>
+                )}
+                <div className="sync-log-actions">
+                    {isSyncing && (
+                        <button onClick={onCancel} className="cancel-sync-button">取消同步</button>
+                    )}
+                    <button onClick={onClose} className="close-log-button">关闭</button>
+                </div>
             </div>
         </div>
     );
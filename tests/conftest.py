@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+# 将项目根目录添加到Python路径，与 backend 下各脚本的做法一致
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.data_storage.email_data_manager import EmailDataManager
+
+
+@pytest.fixture(autouse=True)
+def image_cache_dir(tmp_path, monkeypatch):
+    """
+    图片缓存写入临时目录，不在仓库中留下 image_cache/。
+    """
+    monkeypatch.setenv("IMAGE_CACHE_DIR", str(tmp_path / "image_cache"))
+
+
+@pytest.fixture
+def data_manager(tmp_path):
+    """
+    使用临时数据库文件的 EmailDataManager。
+    """
+    manager = EmailDataManager(db_path=str(tmp_path / "emails.db"))
+    yield manager
+    manager.close()
+
@@ -0,0 +1,35 @@
+"""
+测试共用的邮件和分析结果构造函数。
+"""
+
+
+def make_email(uid, subject=None, sender="Alice <alice@example.com>", **extra):
+    """
+    构造一封解析后的邮件记录，字段与 ParsePool 产出的一致。
+    """
+    email_data = {
+        "UID": uid,
+        "From": sender,
+        "Subject": subject or f"subject {uid}",
+        "Date": "Fri, 25 Jul 2025 00:11:51 +0800",
+        "Message-ID": f"<m{uid}@example.com>",
+        "Body": f"<p>body {uid}</p>",
+        "text_content": f"body {uid}",
+        "image_urls": [],
+    }
+    email_data.update(extra)
+    return email_data
+
+
+def analysis_markdown(category="学术相关", subject="x", urgency="低"):
+    """
+    与 all_in_one prompt 输出格式一致的最小分析结果。
+    """
+    return (
+        "### 邮件摘要\n"
+        f"- **邮件分类**: {category}\n"
+        f"- **主题**: {subject}\n\n"
+        "### 邮件紧急程度评估\n"
+        f"- **邮件主题**: {subject}\n"
+        f"  - **紧急程度**: {urgency}\n"
+    )
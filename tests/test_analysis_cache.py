@@ -0,0 +1,64 @@
+import pytest
+
+from backend.chatgpt_handlers import analysis_cache
+from backend.chatgpt_handlers.analysis_cache import AnalysisCache
+
+
+def _messages(date="2026年10月17日", body="邮件正文"):
+    return [
+        {"role": "system", "content": "使用中文回复，请注意语言。"},
+        {"role": "system", "content": f"今天是{date}，请在你的回答中考虑这个信息。"},
+        {"role": "system", "content": "prompt"},
+        {"role": "user", "content": [{"type": "text", "text": body}]},
+    ]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = AnalysisCache(cache_path=str(tmp_path / "cache.db"), max_entries=3, max_age_days=30)
+    yield cache
+    cache.close()
+
+
+def test_key_ignores_date_message():
+    today = AnalysisCache.make_key(_messages(), "model", "prompt")
+    assert AnalysisCache.make_key(_messages(date="2026年10月18日"), "model", "prompt") == today
+
+
+def test_key_depends_on_request():
+    key = AnalysisCache.make_key(_messages(), "model", "prompt")
+    assert AnalysisCache.make_key(_messages(body="另一封"), "model", "prompt") != key
+    assert AnalysisCache.make_key(_messages(), "other-model", "prompt") != key
+    assert AnalysisCache.make_key(_messages(), "model", "new prompt") != key
+
+
+def test_get_and_put(cache):
+    assert cache.get("k") is None
+    cache.put("k", "model", "result")
+    assert cache.get("k") == "result"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_expired_entries_miss(cache, monkeypatch):
+    now = 1_000_000.0
+    monkeypatch.setattr(analysis_cache.time, "time", lambda: now)
+    cache.put("k", "model", "result")
+    now += 31 * 86400
+    assert cache.get("k") is None
+    cache.evict()
+    assert cache.conn.execute("SELECT COUNT(*) FROM analysis_cache").fetchone()[0] == 0
+
+
+def test_evicts_least_recently_used(cache, monkeypatch):
+    now = 1_000_000.0
+    monkeypatch.setattr(analysis_cache.time, "time", lambda: now)
+    for index in range(3):
+        now += 1
+        cache.put(f"k{index}", "model", f"r{index}")
+    now += 1
+    cache.get("k0")
+    now += 1
+    cache.put("k3", "model", "r3")
+    cache.evict()
+    keys = {row[0] for row in cache.conn.execute("SELECT cache_key FROM analysis_cache")}
+    assert keys == {"k0", "k2", "k3"}
@@ -0,0 +1,70 @@
+import pytest
+
+from helpers import analysis_markdown, make_email
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setenv("DB_PATH", str(tmp_path / "emails.db"))
+    from backend import api_server
+    return api_server.create_app().test_client()
+
+
+@pytest.fixture
+def stored_ids(client):
+    from backend.data_storage.email_data_manager import EmailDataManager
+    manager = EmailDataManager()
+    try:
+        return [manager.save_email_data(make_email(uid), analysis_markdown(), "INBOX") for uid in (1, 2)]
+    finally:
+        manager.close()
+
+
+@pytest.mark.parametrize("value", ["false", 0, 1, None])
+def test_bulk_status_rejects_non_bool(client, stored_ids, value):
+    body = {"ids": stored_ids, "is_read": value}
+    if value is None:
+        body["is_starred"] = "true"
+    response = client.patch("/api/emails/status", json=body)
+    assert response.status_code == 400
+
+
+def test_bulk_status_updates_only_changed_emails(client, stored_ids):
+    response = client.patch("/api/emails/status", json={"ids": stored_ids[:1], "is_starred": True})
+    assert response.status_code == 200
+    assert response.get_json()["ids"] == stored_ids[:1]
+
+    response = client.patch("/api/emails/status", json={"ids": stored_ids, "is_starred": True})
+    assert response.get_json()["ids"] == stored_ids[1:]
+
+    response = client.patch("/api/emails/status", json={"ids": stored_ids, "is_starred": True})
+    assert response.get_json()["ids"] == []
+
+
+def test_bulk_update_status_compares_normalized_value(data_manager):
+    email_id = data_manager.save_email_data(make_email(1), analysis_markdown(), "INBOX")
+    assert data_manager.bulk_update_status(email_ids=[email_id], is_read=1)["ids"] == [email_id]
+    # 与已写入的值相同，归一化后不再视为变化
+    assert data_manager.bulk_update_status(email_ids=[email_id], is_read=True)["ids"] == []
+    assert data_manager.bulk_update_status(email_ids=[email_id], is_read=2)["ids"] == []
+    assert data_manager.get_email_by_id(email_id)["is_read"] == 1
+
+
+def test_list_pages_with_cursor(client, stored_ids):
+    first = client.get("/api/emails?limit=1").get_json()
+    assert len(first["emails"]) == 1 and first["next_cursor"]
+    second = client.get(f"/api/emails?limit=1&cursor={first['next_cursor']}").get_json()
+    assert second["next_cursor"] is None
+    assert {first["emails"][0]["id"], second["emails"][0]["id"]} == set(stored_ids)
+
+
+def test_list_rejects_malformed_cursor(client):
+    assert client.get("/api/emails?cursor=abc").status_code == 400
+    assert client.get("/api/emails?limit=x").status_code == 400
+
+
+def test_changes_endpoint(client, stored_ids):
+    assert client.get("/api/emails/changes?since=x").status_code == 400
+    result = client.get("/api/emails/changes?since=0").get_json()
+    assert result["version"] == 2 and not result["reset"]
+    assert [row["id"] for row in result["changes"]] == stored_ids
@@ -0,0 +1,194 @@
+import glob
+import json
+import os
+import sqlite3
+
+import pytest
+
+from backend import update_emails as ue
+from backend.chatgpt_handlers.batch_client import LocalBatchBackend
+from backend.data_storage.email_data_manager import EmailDataManager
+
+RETRIEVE = LocalBatchBackend.retrieve
+
+
+def _raw(uid):
+    return (
+        f"From: Alice <alice@example.com>\r\nSubject: subject {uid}\r\nMessage-ID: <m{uid}@example.com>\r\n"
+        f"Date: Fri, 25 Jul 2025 00:11:51 +0800\r\nContent-Type: text/plain; charset=utf-8\r\n\r\nbody {uid}"
+    ).encode()
+
+
+class FakeFetcher:
+    """
+    只包含同步流程用到的方法的 IMAP 替身，邮箱里固定有 UID 1-3 三封邮件。
+    """
+    uids = [1, 2, 3]
+
+    def connect(self):
+        pass
+
+    def logout(self):
+        pass
+
+    def select_mailbox(self, mailbox):
+        return {'uidvalidity': 1, 'uidnext': max(self.uids) + 1}
+
+    def search_uids(self, criteria):
+        return list(self.uids)
+
+    def fetch_headers(self, uids):
+        return [{'UID': uid, 'Message-ID': f'<m{uid}@example.com>', 'Subject': f'subject {uid}',
+                 'From': 'Alice <alice@example.com>', 'Date': 'Fri, 25 Jul 2025 00:11:51 +0800', 'Size': 100}
+                for uid in uids]
+
+    def iter_raw_batches(self, uids, sizes=None):
+        yield [(uid, _raw(uid)) for uid in uids]
+
+
+@pytest.fixture
+def batch_env(tmp_path, monkeypatch):
+    db_path = tmp_path / "emails.db"
+    monkeypatch.setenv("DB_PATH", str(db_path))
+    monkeypatch.setenv("BATCH_BACKEND", "local")
+    monkeypatch.setenv("BATCH_DIR", str(tmp_path / "batches"))
+    monkeypatch.setenv("BATCH_WAIT_TIMEOUT", "5")
+    monkeypatch.setenv("ANALYSIS_CACHE_ENABLED", "false")
+    monkeypatch.setenv("TRIAGE_ENABLED", "false")
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("OPENAI_BASE_URL", "http://127.0.0.1:9/v1")
+    monkeypatch.setenv("OPENAI_MODEL", "test-model")
+    monkeypatch.setattr(ue, "EmailFetcher", FakeFetcher)
+    return db_path
+
+
+def _stored_subjects(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return sorted(row[0] for row in conn.execute("SELECT subject FROM emails"))
+
+
+def _checkpoint(db_path):
+    with sqlite3.connect(db_path) as conn:
+        row = conn.execute("SELECT uidnext FROM mailbox_sync_state WHERE mailbox = 'INBOX'").fetchone()
+    return row[0] if row else None
+
+
+def _hold_batches(monkeypatch):
+    # 模拟批处理接口仍在处理中
+    monkeypatch.setattr(LocalBatchBackend, "retrieve", lambda self, batch_id: {
+        "status": "in_progress", "completed": None, "failed": None, "total": None})
+    monkeypatch.setenv("BATCH_WAIT_TIMEOUT", "0")
+
+
+def _release_batches(monkeypatch):
+    monkeypatch.setattr(LocalBatchBackend, "retrieve", RETRIEVE)
+    monkeypatch.setenv("BATCH_WAIT_TIMEOUT", "5")
+
+
+def _record(events):
+    return lambda event_type, **data: events.append(event_type)
+
+
+def test_submit_and_ingest(batch_env):
+    events = []
+    summary = ue.update_emails_in_batch(report=_record(events))
+    assert summary['submitted'] == 3
+    assert summary['stored'] == 3
+    assert summary['pending_batches'] == 0
+    assert events.count('email_stored') == 3
+    assert _stored_subjects(batch_env) == ['subject 1', 'subject 2', 'subject 3']
+    assert _checkpoint(batch_env) == 4
+
+
+def test_second_ingest_is_noop(batch_env):
+    ue.update_emails_in_batch()
+    runner = ue.create_batch_runner(None)
+    state_path, = glob.glob(os.path.join(runner.batch_dir, '*.state.json'))
+    with open(state_path, encoding='utf-8') as f:
+        state = json.load(f)
+    assert state['status'] == 'ingested'
+
+    events = []
+    data_manager = EmailDataManager()
+    try:
+        ingested, failed = ue.ingest_batch_results(runner, state, data_manager, _record(events))
+    finally:
+        data_manager.close()
+    assert len(ingested) == 3 and not failed
+    assert events == ['email_skipped'] * 3
+    assert _stored_subjects(batch_env) == ['subject 1', 'subject 2', 'subject 3']
+
+    # 再次同步时邮件已在库中，不会重新提交
+    summary = ue.update_emails_in_batch()
+    assert summary['submitted'] == 0 and summary['stored'] == 0
+
+
+def test_in_flight_emails_are_not_resubmitted(batch_env, monkeypatch):
+    _hold_batches(monkeypatch)
+    first = ue.update_emails_in_batch()
+    assert first['submitted'] == 3
+    assert first['pending_batches'] == 1
+    # 结果入库前检查点停在第一封未入库的邮件
+    assert _checkpoint(batch_env) == 1
+
+    second = ue.update_emails_in_batch()
+    assert second['submitted'] == 0
+    assert second['found'] == 0
+    assert second['pending_batches'] == 1
+    assert _checkpoint(batch_env) == 1
+    assert _stored_subjects(batch_env) == []
+
+    _release_batches(monkeypatch)
+    third = ue.update_emails_in_batch()
+    assert third['submitted'] == 0
+    assert third['stored'] == 3
+    assert third['pending_batches'] == 0
+    assert _stored_subjects(batch_env) == ['subject 1', 'subject 2', 'subject 3']
+    assert _checkpoint(batch_env) == 4
+
+
+def test_store_failure_keeps_batch_for_next_run(batch_env, monkeypatch):
+    original_save = EmailDataManager.save_email_data
+
+    def failing_save(self, email_data, *args, **kwargs):
+        if email_data.get('Subject') == 'subject 2':
+            raise sqlite3.OperationalError("database is locked")
+        return original_save(self, email_data, *args, **kwargs)
+
+    monkeypatch.setattr(EmailDataManager, "save_email_data", failing_save)
+    events = []
+    first = ue.update_emails_in_batch(report=_record(events))
+    assert first['stored'] == 2
+    assert first['failed'] == 1
+    assert 'email_failed' in events
+    assert _checkpoint(batch_env) == 2
+
+    # 写入恢复后，下次运行从未标记入库的批处理补入，而不是重新提交
+    monkeypatch.setattr(EmailDataManager, "save_email_data", original_save)
+    second = ue.update_emails_in_batch()
+    assert second['submitted'] == 0
+    assert second['stored'] == 1
+    assert _stored_subjects(batch_env) == ['subject 1', 'subject 2', 'subject 3']
+    assert _checkpoint(batch_env) == 4
+
+
+def test_empty_result_is_failed_and_resubmitted(batch_env, monkeypatch):
+    default_responder = LocalBatchBackend._default_responder
+
+    def responder(body):
+        content = default_responder(body)
+        return "" if "subject 2" in content else content
+
+    monkeypatch.setattr(LocalBatchBackend, "_default_responder", staticmethod(responder))
+    first = ue.update_emails_in_batch()
+    assert first['stored'] == 2
+    assert first['failed'] == 1
+    assert _checkpoint(batch_env) == 2
+
+    # 空结果不是写入失败：批处理已标记入库，邮件重新提交而不是一直等待
+    monkeypatch.setattr(LocalBatchBackend, "_default_responder", staticmethod(default_responder))
+    second = ue.update_emails_in_batch()
+    assert second['submitted'] == 1
+    assert second['stored'] == 1
+    assert _stored_subjects(batch_env) == ['subject 1', 'subject 2', 'subject 3']
+    assert _checkpoint(batch_env) == 4
@@ -0,0 +1,76 @@
+from helpers import analysis_markdown, make_email
+
+
+def _store(data_manager, *uids, mailbox="INBOX"):
+    return [data_manager.save_email_data(make_email(uid), analysis_markdown(), mailbox) for uid in uids]
+
+
+def _changes(data_manager, since, **kwargs):
+    result = data_manager.get_changes(since, **kwargs)
+    return result, [(row['id'], row['change_kind']) for row in result['changes']]
+
+
+def test_insert_and_update_are_logged(data_manager):
+    assert data_manager.get_change_version() == 0
+    first, second = _store(data_manager, 1, 2)
+    assert data_manager.get_change_version() == 2
+
+    result, changes = _changes(data_manager, 0)
+    assert result == {"version": 2, "reset": False, "changes": result['changes']}
+    assert changes == [(first, 'insert'), (second, 'insert')]
+
+    data_manager.update_email_status(first, is_starred=True)
+    result, changes = _changes(data_manager, 2)
+    assert result['version'] == 3
+    assert changes == [(first, 'update')]
+    assert result['changes'][0]['is_starred'] == 1
+
+
+def test_only_latest_change_per_email_is_kept(data_manager):
+    email_id, = _store(data_manager, 1)
+    data_manager.update_email_status(email_id, is_read=True)
+    data_manager.update_email_status(email_id, is_starred=True)
+    _, changes = _changes(data_manager, 0)
+    assert changes == [(email_id, 'update')]
+
+
+def test_no_changes_since_current_version(data_manager):
+    _store(data_manager, 1)
+    version = data_manager.get_change_version()
+    _, changes = _changes(data_manager, version)
+    assert changes == []
+
+
+def test_duplicate_and_noop_writes_do_not_bump(data_manager):
+    email_id, = _store(data_manager, 1)
+    _store(data_manager, 1)
+    data_manager.bulk_update_status(email_ids=[email_id], is_read=False)
+    assert data_manager.get_change_version() == 1
+
+
+def test_bulk_update_is_one_version(data_manager):
+    ids = _store(data_manager, 1, 2, 3)
+    result = data_manager.bulk_update_status(email_ids=ids, is_read=True)
+    assert result['version'] == 4
+    _, changes = _changes(data_manager, 3)
+    assert sorted(changes) == sorted((email_id, 'update') for email_id in ids)
+
+
+def test_mailbox_filter(data_manager):
+    _store(data_manager, 1)
+    archived, = _store(data_manager, 2, mailbox="Archive")
+    _, changes = _changes(data_manager, 0, mailbox_filter="Archive")
+    assert changes == [(archived, 'insert')]
+
+
+def test_compaction_resets_stale_clients(data_manager):
+    ids = _store(data_manager, 1, 2, 3, 4)
+    assert data_manager.compact_changes(keep_versions=2) == 2
+
+    result, _ = _changes(data_manager, 1)
+    assert result['reset'] and result['changes'] == []
+    result, changes = _changes(data_manager, 2)
+    assert not result['reset']
+    assert changes == [(ids[2], 'insert'), (ids[3], 'insert')]
+    # 版本号没有超过保留数量时不压缩
+    assert data_manager.compact_changes(keep_versions=10) == 0
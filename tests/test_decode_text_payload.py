@@ -0,0 +1,57 @@
+import pytest
+
+from backend.email_server.email_fetcher import decode_text_payload
+
+CHINESE = "各位老师、同学：本周五下午三点在学院报告厅举行学术讲座，欢迎大家参加。讲座结束后有茶歇。" * 4
+
+
+def test_empty_payload():
+    assert decode_text_payload(b"") == ""
+    assert decode_text_payload(None, "utf-8") == ""
+
+
+def test_declared_charset():
+    assert decode_text_payload(CHINESE.encode("utf-8"), "UTF-8") == CHINESE
+    traditional = "各位老師、同學：本週五下午三點在學院報告廳舉行學術講座。"
+    assert decode_text_payload(traditional.encode("big5"), '"big5"') == traditional
+
+
+def test_declared_gb2312_uses_superset():
+    # “镕”不在 GB2312 中，但常出现在标注为 gb2312 的邮件里
+    text = "朱镕基" + CHINESE
+    assert decode_text_payload(text.encode("gbk"), "gb2312") == text
+
+
+@pytest.mark.parametrize("declared", ["us-ascii", "iso-8859-1", "windows-1252"])
+def test_weak_declaration_prefers_utf8(declared):
+    assert decode_text_payload("café – 讲座".encode("utf-8"), declared) == "café – 讲座"
+
+
+def test_weak_declaration_falls_back_to_itself():
+    assert decode_text_payload("café".encode("cp1252"), "iso-8859-1") == "café"
+
+
+def test_unknown_charset_uses_utf8():
+    assert decode_text_payload(CHINESE.encode("utf-8"), "x-unknown") == CHINESE
+
+
+@pytest.mark.parametrize("declared", ["base64", "hex", "rot13", "zlib", "uu"])
+def test_non_text_codec_is_ignored(declared):
+    assert decode_text_payload(b"hello", declared) == "hello"
+    assert decode_text_payload(CHINESE.encode("utf-8"), declared) == CHINESE
+
+
+@pytest.mark.parametrize("declared", [None, "utf-8"])
+def test_undeclared_or_wrong_charset_is_detected(declared):
+    assert decode_text_payload(CHINESE.encode("gb18030"), declared) == CHINESE
+
+
+def test_detection_skips_ascii_prefix():
+    html = "<html><head><style>" + "p { margin: 0; }\n" * 20000 + "</style></head><body>"
+    payload = html.encode("ascii") + CHINESE.encode("gb18030")
+    assert decode_text_payload(payload).endswith(CHINESE)
+
+
+@pytest.mark.parametrize("payload", [b"hello \xc3\x28 world", b"abc \x81\x30 def", b"\xff\xfe\xfa"])
+def test_undecodable_bytes_never_raise(payload):
+    assert isinstance(decode_text_payload(payload, "utf-8"), str)
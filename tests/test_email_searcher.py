@@ -0,0 +1,82 @@
+import sqlite3
+
+import pytest
+
+from backend.email_searcher import EmailSearcher
+from helpers import analysis_markdown, make_email
+
+
+@pytest.fixture
+def searcher(data_manager):
+    searcher = EmailSearcher(db_path=data_manager.db_path)
+    yield searcher
+    searcher.close()
+
+
+def _subjects(results):
+    return sorted(row['subject'] for row in results)
+
+
+def _store_html(data_manager, uid, subject, html):
+    email_data = make_email(uid, subject=subject, Body=html)
+    email_data.pop('text_content')
+    data_manager.save_email_data(email_data, analysis_markdown(subject=subject), "INBOX")
+
+
+def test_index_uses_extracted_text_not_html(data_manager, searcher):
+    _store_html(data_manager, 1, "预算", '<div class="banner" style="color:#ff0000">下季度预算审批</div>')
+    assert _subjects(searcher.search("预算审批")) == ["预算"]
+    assert _subjects(searcher.search("/body:季度预算")) == ["预算"]
+    assert searcher.search("banner") == []
+    assert searcher.search("ff0000") == []
+
+
+def test_short_terms_do_not_match_markup(data_manager, searcher):
+    _store_html(data_manager, 1, "通知", '<p class="ab">周五开会</p>')
+    assert searcher.search("ab") == []
+    assert _subjects(searcher.search("开会")) == ["通知"]
+    assert _subjects(searcher.search("/subject:通知")) == ["通知"]
+
+
+def test_prefix_and_starred_filters(data_manager, searcher):
+    data_manager.save_email_data(make_email(1, subject="seminar schedule"), analysis_markdown(), "INBOX")
+    data_manager.save_email_data(make_email(2, subject="lunch", sender="Bob <bob@example.com>"),
+                                 analysis_markdown(), "INBOX")
+    assert _subjects(searcher.search("/from:bob@example")) == ["lunch"]
+    assert _subjects(searcher.search("/subject:seminar")) == ["seminar schedule"]
+    assert searcher.search("/starred") == []
+
+
+def test_legacy_html_index_is_rebuilt(tmp_path):
+    db_path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE emails (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, subject TEXT, from_name TEXT, from_email TEXT,
+            received_date TEXT, raw_email_body TEXT, analysis_markdown TEXT, analysis_json TEXT,
+            mailbox TEXT, is_starred INTEGER DEFAULT 0, is_read INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE VIRTUAL TABLE emails_fts USING fts5(
+            subject, from_name, from_email, raw_email_body, analysis_markdown,
+            content='emails', content_rowid='id', tokenize='trigram'
+        );
+        CREATE TRIGGER emails_fts_ai AFTER INSERT ON emails BEGIN
+            INSERT INTO emails_fts(rowid, subject, from_name, from_email, raw_email_body, analysis_markdown)
+            VALUES (new.id, new.subject, new.from_name, new.from_email, new.raw_email_body, new.analysis_markdown);
+        END;
+        INSERT INTO emails (subject, from_name, from_email, received_date, raw_email_body, analysis_markdown, mailbox)
+        VALUES ('旧邮件', 'Alice', 'alice@example.com', 'Fri, 25 Jul 2025 00:11:51 +0800',
+                '<td bgcolor="#eeeeee">实验室安全培训</td>', '', 'INBOX');
+    """)
+    conn.commit()
+    conn.close()
+
+    searcher = EmailSearcher(db_path=db_path)
+    try:
+        assert _subjects(searcher.search("安全培训")) == ["旧邮件"]
+        assert searcher.search("bgcolor") == []
+        body_text = searcher.conn.execute("SELECT body_text FROM emails").fetchone()[0]
+        assert body_text == "实验室安全培训"
+    finally:
+        searcher.close()
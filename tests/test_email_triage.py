@@ -0,0 +1,108 @@
+from backend.chatgpt_handlers.email_triage import (
+    BULK_CATEGORY, EmailTriage, NaiveBayesClassifier, email_features, normalize_category,
+)
+from helpers import analysis_markdown, make_email
+
+LIST_HEADERS = {"List-Unsubscribe": "<mailto:leave@lists.example.edu>", "Precedence": "list"}
+
+
+def _triage(**kwargs):
+    kwargs.setdefault("enabled", True)
+    kwargs.setdefault("bulk_route", "cheap_model")
+    kwargs.setdefault("min_training", 4)
+    return EmailTriage(**kwargs)
+
+
+def _store(data_manager, uid, sender, subject, category):
+    data_manager.save_email_data(make_email(uid, subject=subject, sender=sender),
+                                 analysis_markdown(category=category, subject=subject), "INBOX")
+
+
+def _train_examples(data_manager):
+    uid = 0
+    for i in range(6):
+        uid += 1
+        _store(data_manager, uid, f"Shop{i} <deals@shop{i}.com>", f"限时优惠 折扣 sale {i}", "推广与订阅")
+        uid += 1
+        _store(data_manager, uid, f"Prof{i} <prof{i}@uni.edu>", f"论文 审稿 meeting {i}", "学术核心")
+
+
+def test_normalize_category():
+    assert normalize_category("**推廣與訂閱** (Promotion)") == BULK_CATEGORY
+    assert normalize_category("学术相关") == "学术相关"
+    assert normalize_category("unknown") is None
+    assert normalize_category(None) is None
+
+
+def test_naive_bayes_prefers_seen_features():
+    samples = [(email_features("Shop", "deals@shop.com", "限时优惠"), BULK_CATEGORY)] * 3 + \
+              [(email_features("Prof", "prof@uni.edu", "论文审稿"), "学术核心")] * 3
+    classifier = NaiveBayesClassifier().fit(samples)
+    assert classifier.trained_samples == 6
+    probabilities = classifier.predict_proba(email_features("Shop", "deals@shop.com", "限时优惠"))
+    assert max(probabilities, key=probabilities.get) == BULK_CATEGORY
+    assert abs(sum(probabilities.values()) - 1.0) < 1e-9
+    assert NaiveBayesClassifier().predict_proba({"x"}) == {}
+
+
+def test_disabled_triage_always_routes_full():
+    decision = _triage(enabled=False).classify(make_email(1, **LIST_HEADERS))
+    assert decision["route"] == "full"
+
+
+def test_cold_start_headers_alone_stay_full(data_manager):
+    triage = _triage()
+    triage.train(data_manager)
+    assert triage.classifier is None
+    decision = triage.classify(make_email(1, sender="Dept <news@lists.example.edu>", **LIST_HEADERS))
+    assert decision["route"] == "full"
+    assert decision["category"] is None
+    assert triage.stats()["routes"] == {"full": 1}
+
+
+def test_headers_with_bulk_sender_history_are_routed(data_manager):
+    _store(data_manager, 1, "Shop <deals@shop.com>", "sale", "推广与订阅")
+    triage = _triage()
+    triage.train(data_manager)
+    decision = triage.classify(make_email(2, sender="Shop <deals@shop.com>", **LIST_HEADERS))
+    assert decision["route"] == "cheap_model"
+    assert decision["category"] == BULK_CATEGORY
+
+
+def test_sender_history_alone_routes_bulk(data_manager):
+    for uid in range(3):
+        _store(data_manager, uid + 1, "Shop <deals@shop.com>", f"sale {uid}", "推广与订阅")
+    triage = _triage(bulk_route="template")
+    triage.train(data_manager)
+    decision = triage.classify(make_email(9, sender="Shop <deals@shop.com>"))
+    assert decision["route"] == "template"
+
+
+def test_trained_classifier_gates_header_routing(data_manager):
+    _train_examples(data_manager)
+    triage = _triage(threshold=0.999)
+    triage.train(data_manager)
+    assert triage.classifier is not None
+
+    promo = triage.classify(make_email(100, sender="Shop9 <deals@shop9.com>", subject="限时优惠 sale", **LIST_HEADERS))
+    assert promo["route"] == "cheap_model"
+
+    # 带 List-Unsubscribe 的学院邮件列表，分类器判为其他类别时仍完整分析
+    department = triage.classify(make_email(101, sender="Prof9 <prof9@uni.edu>", subject="论文 审稿 meeting",
+                                            **LIST_HEADERS))
+    assert department["route"] == "full"
+    assert department["category"] == "学术核心"
+
+
+def test_template_routed_emails_are_not_training_data(data_manager):
+    email_data = make_email(1, sender="Shop <deals@shop.com>", subject="sale", triage_route="template")
+    data_manager.save_email_data(email_data, analysis_markdown(category="推广与订阅"), "INBOX")
+    triage = _triage()
+    triage.train(data_manager)
+    assert "deals@shop.com" not in triage.sender_history
+
+
+def test_template_analysis_matches_prompt_format():
+    markdown = EmailTriage.template_analysis(make_email(1, subject="Weekly deals"), "正文" * 100)
+    assert normalize_category(markdown) == BULK_CATEGORY
+    assert "Weekly deals" in markdown
@@ -0,0 +1,65 @@
+import pytest
+
+from backend.email_server.html_text_extractor import HTMLTextExtractor, lxml_etree
+
+pytest.importorskip("bs4")
+from backend.benchmarks.bench_html_extraction import build_fixtures, legacy_extract, normalize  # noqa: E402
+
+BACKENDS = ['stdlib'] + (['lxml'] if lxml_etree is not None else [])
+FIXTURES = build_fixtures()
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("name, html, noise", FIXTURES, ids=[fixture[0] for fixture in FIXTURES])
+def test_matches_legacy_extraction(backend, name, html, noise):
+    legacy_text, legacy_images = legacy_extract(html)
+    text, images = HTMLTextExtractor(max_chars=0, backend=backend).extract(html)
+    assert normalize(text) == normalize(legacy_text, noise)
+    assert [image['src'] for image in images] == legacy_images
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_skips_hidden_and_non_content(backend):
+    html = (
+        "<html><head><title>t</title><style>p{}</style></head><body>"
+        "<div style='mso-hide: all'>mso</div><div style='max-height:0'>preview</div>"
+        "<table width='0px'><tr><td>pixel</td></tr></table>"
+        "<div style='max-height:0.5em'>visible</div><script>x()</script><div>正文</div></body></html>"
+    )
+    text, _ = HTMLTextExtractor(max_chars=0, backend=backend).extract(html)
+    assert text.split('\n') == ['visible', '正文']
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_image_attributes(backend):
+    html = ("<p>x</p><img src='https://example.com/a.png' width='600' alt='banner' style='border:0'>"
+            "<div hidden><img src='https://example.com/hidden.png'></div>"
+            "<img src='https://example.com/b.jpg?format=.gif'>")
+    _, images = HTMLTextExtractor(backend=backend).extract(html)
+    assert images == [
+        {'src': 'https://example.com/a.png', 'width': '600', 'alt': 'banner', 'style': 'border:0'},
+        {'src': 'https://example.com/b.jpg?format=.gif'},
+    ]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_truncates_at_max_chars(backend):
+    html = "".join(f"<p>{'段落' * 20}{i}</p>" for i in range(100))
+    text, _ = HTMLTextExtractor(max_chars=100, backend=backend).extract(html)
+    assert len(text) == 100
+    assert text.startswith('段落' * 20 + '0\n')
+
+
+def test_empty_document():
+    assert HTMLTextExtractor().extract("") == ("", [])
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        HTMLTextExtractor(backend='html5lib')
+
+
+@pytest.mark.skipif(lxml_etree is not None, reason="lxml 已安装")
+def test_lxml_backend_requires_lxml():
+    with pytest.raises(ValueError):
+        HTMLTextExtractor(backend='lxml')
@@ -0,0 +1,55 @@
+import base64
+
+import pytest
+
+from backend.email_server.image_selector import ImageSelector
+
+
+@pytest.fixture
+def selector(tmp_path):
+    return ImageSelector(max_images=4, min_dimension=48, cache_dir=str(tmp_path / "image_cache"))
+
+
+@pytest.mark.parametrize("image", [
+    {'src': 'https://cdn.example.com/images/open-day.jpg'},
+    {'src': 'https://cdn.example.com/a.jpg', 'alt': 'Open Day 2025'},
+    {'src': 'https://cdn.example.com/b.jpg', 'alt': 'Social event poster'},
+    {'src': 'https://cdn.example.com/c.jpg', 'alt': 'Track and field results'},
+    {'src': 'https://cdn.example.com/track/results.png', 'width': '600'},
+    {'src': 'https://cdn.example.com/badge-ceremony.jpg', 'width': '800', 'height': '450'},
+])
+def test_content_images_with_common_words_are_kept(selector, image):
+    assert selector.select([image]) == [image['src']]
+
+
+@pytest.mark.parametrize("image", [
+    {'src': 'https://t.example.com/tracking/open?u=1'},
+    {'src': 'https://t.example.com/pixel.png'},
+    {'src': 'https://cdn.example.com/icons/facebook.png'},
+    {'src': 'https://cdn.example.com/social/share.png', 'width': '32', 'height': '32'},
+    {'src': 'https://cdn.example.com/img/bullet-1.png', 'width': '64'},
+    {'src': 'https://cdn.example.com/a.png', 'alt': 'Twitter icon'},
+    {'src': 'https://cdn.example.com/photo.jpg', 'width': '1', 'height': '1'},
+    {'src': 'cid:image001.png@01D9'},
+])
+def test_non_content_images_are_filtered(selector, image):
+    assert selector.select([image]) == []
+
+
+def test_dedup_and_limit(selector):
+    images = [{'src': f'https://cdn.example.com/{i % 6}.jpg'} for i in range(10)]
+    assert selector.select(images) == [f'https://cdn.example.com/{i}.jpg' for i in range(4)]
+
+
+
+def test_inline_image_is_cached(selector, tmp_path):
+    data = base64.b64encode(b'not really a png').decode('ascii')
+    selector.select([{'src': f'data:image/png;base64,{data}'}])
+    assert (tmp_path / "image_cache").is_dir()
+
+
+def test_cache_directory_is_created_lazily(tmp_path):
+    cache_dir = tmp_path / "image_cache"
+    selector = ImageSelector(cache_dir=str(cache_dir))
+    selector.select([{'src': 'https://cdn.example.com/a.jpg'}])
+    assert not cache_dir.exists()
@@ -0,0 +1,51 @@
+import imaplib
+
+import pytest
+
+from backend.email_server import imap_pool
+from backend.email_server.email_fetcher import EmailFetcher
+
+
+class FakeMail:
+    def __init__(self, error=None):
+        self.error = error
+        self.logged_out = False
+
+    def list(self):
+        if self.error:
+            raise self.error
+        return 'OK', [b'(\\HasNoChildren) "/" "INBOX"']
+
+    def logout(self):
+        self.logged_out = True
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setenv("IMAP_PORT", "993")
+    mails = []
+
+    class FakeFetcher(EmailFetcher):
+        def connect(self):
+            self.mail = mails.pop(0)
+
+    monkeypatch.setattr(imap_pool, "EmailFetcher", FakeFetcher)
+    pool = imap_pool.IMAPConnectionPool(max_size=1)
+    pool.mails = mails
+    return pool
+
+
+@pytest.mark.parametrize("error", [imaplib.IMAP4.abort("连接已断开"), OSError("连接被重置")])
+def test_list_mailboxes_error_discards_connection(pool, error):
+    broken = FakeMail(error=error)
+    pool.mails.extend([broken, FakeMail()])
+
+    with pytest.raises(type(error)):
+        with pool.connection() as fetcher:
+            fetcher.list_mailboxes()
+    assert broken.logged_out
+
+    # 出错的连接不再复用，下次借用时重新建立连接
+    with pool.connection() as fetcher:
+        assert fetcher.list_mailboxes() == {"INBOX": "INBOX"}
+    assert not pool.mails
@@ -0,0 +1,47 @@
+import json
+
+from backend.data_storage.json_splice import dumps_row, dumps_rows
+from helpers import analysis_markdown, make_email
+
+
+def test_plain_row_matches_json_dumps():
+    row = {"id": 1, "subject": "会议 \"通知\"", "is_read": 0, "received_ts": None}
+    assert json.loads(dumps_row(row)) == row
+
+
+def test_raw_field_is_spliced_unchanged():
+    raw = '{"邮件摘要":[{"**主题**":"x"}],"n":1.50}'
+    text = dumps_row({"id": 1, "analysis_json": raw})
+    assert text.endswith('"analysis_json":' + raw + '}')
+    assert json.loads(text) == {"id": 1, "analysis_json": json.loads(raw)}
+
+
+def test_missing_raw_value_becomes_empty_object():
+    assert json.loads(dumps_row({"id": 1, "analysis_json": None})) == {"id": 1, "analysis_json": {}}
+
+
+def test_row_with_only_raw_fields():
+    assert json.loads(dumps_row({"analysis_json": '{"a":1}'})) == {"analysis_json": {"a": 1}}
+
+
+def test_custom_raw_fields():
+    text = dumps_row({"id": 1, "payload": '[1,2]', "analysis_json": '{"a":1}'}, raw_fields=("payload",))
+    assert json.loads(text) == {"id": 1, "payload": [1, 2], "analysis_json": '{"a":1}'}
+
+
+def test_dumps_rows():
+    assert dumps_rows([]) == '[]'
+    rows = [{"id": 1, "analysis_json": '{"a":1}'}, {"id": 2, "analysis_json": None}]
+    assert json.loads(dumps_rows(rows)) == [{"id": 1, "analysis_json": {"a": 1}}, {"id": 2, "analysis_json": {}}]
+
+
+def test_stored_analysis_round_trips(data_manager):
+    email_id = data_manager.save_email_data(make_email(1), analysis_markdown(subject="周会"), "INBOX")
+    rows, _ = data_manager.list_emails(limit=1, include_analysis=True)
+    parsed = json.loads(dumps_rows(rows))
+    assert parsed[0]["id"] == email_id
+    assert parsed[0]["analysis_json"] == json.loads(data_manager.parse_markdown_to_json(analysis_markdown(subject="周会")))
+    # 非法的历史内容在查询时被替换为空对象，拼接结果仍是合法JSON
+    data_manager.conn.execute("UPDATE emails SET analysis_json = 'not json' WHERE id = ?", (email_id,))
+    rows, _ = data_manager.list_emails(limit=1, include_analysis=True)
+    assert json.loads(dumps_rows(rows))[0]["analysis_json"] == {}
@@ -0,0 +1,88 @@
+import pytest
+
+from backend.data_storage.email_data_manager import EmailDataManager
+from helpers import analysis_markdown, make_email
+
+DATES = [
+    "Fri, 25 Jul 2025 00:11:51 +0800",
+    "Fri, 25 Jul 2025 00:11:51 +0800",
+    "Thu, 24 Jul 2025 09:00:00 +0000",
+    "Sat, 26 Jul 2025 12:30:00 +0200",
+    "not a date",
+]
+
+
+@pytest.fixture
+def stored(data_manager):
+    for uid, date in enumerate(DATES, start=1):
+        mailbox = "Archive" if uid == 3 else "INBOX"
+        data_manager.save_email_data(make_email(uid, Date=date), analysis_markdown(subject=f"s{uid}"), mailbox)
+    return data_manager
+
+
+def _all_pages(data_manager, limit, **kwargs):
+    pages, cursor = [], None
+    while True:
+        rows, cursor = data_manager.list_emails(limit=limit, cursor=cursor, **kwargs)
+        pages.append([row['id'] for row in rows])
+        if cursor is None:
+            return pages
+
+
+def _all_pages_from(data_manager, cursor):
+    pages = []
+    while cursor is not None:
+        rows, cursor = data_manager.list_emails(limit=2, cursor=cursor)
+        pages.append([row['id'] for row in rows])
+    return pages
+
+
+def test_pages_follow_received_order(stored):
+    rows, _ = stored.list_emails(limit=10)
+    expected = [row['id'] for row in rows]
+    keys = [(row['received_ts'], row['id']) for row in rows]
+    assert keys == sorted(keys, reverse=True)
+    # 无法解析的日期排在最后
+    assert rows[-1]['received_ts'] == 0
+
+    for limit in (1, 2, 3):
+        pages = _all_pages(stored, limit)
+        assert [email_id for page in pages for email_id in page] == expected
+        assert all(len(page) <= limit for page in pages)
+
+
+def test_last_page_has_no_cursor(stored):
+    rows, cursor = stored.list_emails(limit=5)
+    assert len(rows) == 5 and cursor is None
+
+
+def test_new_email_does_not_shift_later_pages(stored):
+    first, cursor = stored.list_emails(limit=2)
+    stored.save_email_data(make_email(99, Date="Sun, 27 Jul 2025 08:00:00 +0000"), analysis_markdown(), "INBOX")
+    rest = [email_id for page in _all_pages_from(stored, cursor) for email_id in page]
+    assert set(rest).isdisjoint(row['id'] for row in first)
+    assert len(rest) == 3
+
+
+def test_mailbox_filter(stored):
+    ids = [email_id for page in _all_pages(stored, 1, mailbox_filter="Archive") for email_id in page]
+    assert len(ids) == 1
+
+
+def test_list_projection_has_analysis_fields(stored):
+    rows, _ = stored.list_emails(limit=1, include_analysis=True)
+    row = rows[0]
+    assert row['category'] == "学术相关"
+    assert row['urgency'] == "低"
+    assert 'raw_email_body' not in row
+    assert row['analysis_json'].startswith('{')
+
+
+@pytest.mark.parametrize("cursor", ["abc", "12", "1:x", ""])
+def test_parse_cursor_rejects_malformed(cursor):
+    with pytest.raises(ValueError):
+        EmailDataManager.parse_cursor(cursor)
+
+
+def test_parse_cursor():
+    assert EmailDataManager.parse_cursor("1753373511:42") == (1753373511, 42)
@@ -0,0 +1,46 @@
+from backend.chatgpt_handlers.prompt_compactor import PromptCompactor
+
+
+def _compact(text):
+    return PromptCompactor(token_budget=0).compact(text)['text'].split('\n')
+
+
+def test_marker_inside_content_is_kept():
+    assert _compact('本合同涉及版权所有权转让，请确认。\n谢谢') == ['本合同涉及版权所有权转让，请确认。', '谢谢']
+
+
+def test_do_not_reply_sentence_is_kept():
+    lines = _compact('Please do not reply to the client before Friday.\nThe draft is attached.')
+    assert lines == ['Please do not reply to the client before Friday.', 'The draft is attached.']
+
+
+def test_short_boilerplate_line_is_removed_anywhere():
+    lines = _compact('View this email in your browser\n会议改到周五下午三点。\n地点不变。')
+    assert lines == ['会议改到周五下午三点。', '地点不变。']
+
+
+def test_footer_tail_is_removed():
+    text = '\n'.join([
+        '各位同学好：',
+        '下周一的讲座改到 B201。',
+        '请准时参加。',
+        '教务处',
+        '此邮件由系统自动发送，请勿回复。如需帮助请联系 help@example.com',
+        'You are receiving this because you subscribed to the department list.',
+        'Unsubscribe: https://example.com/u?id=1',
+    ])
+    assert _compact(text) == ['各位同学好：', '下周一的讲座改到 B201。', '请准时参加。', '教务处']
+
+
+def test_repeated_urls_and_lines_are_removed():
+    text = 'See https://example.com/a\n报名表 https://example.com/a\n报名表 https://example.com/a'
+    assert _compact(text) == ['See https://example.com/a', '报名表']
+
+
+def test_budget_keeps_start_of_every_section():
+    text = '\n'.join(f'通知{i}：' + '内容' * 200 for i in range(5))
+    result = PromptCompactor(token_budget=200).compact(text)
+    assert result['truncated']
+    assert result['compacted_tokens'] <= 220
+    lines = result['text'].split('\n')
+    assert [line[:4] for line in lines] == [f'通知{i}：' for i in range(5)]
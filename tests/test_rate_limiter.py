@@ -0,0 +1,91 @@
+import pytest
+
+from backend.chatgpt_handlers import rate_limiter
+from backend.chatgpt_handlers.rate_limiter import TokenBucketRateLimiter
+from backend.chatgpt_handlers.token_estimator import IMAGE_TOKENS, estimate_message_tokens, estimate_text_tokens
+
+
+class FakeClock:
+    """
+    可控的单调时钟；wait 直接推进时间而不真正睡眠。
+    """
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def wait(self, timeout):
+        self.now += timeout
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", clock)
+    return clock
+
+
+def _limiter(clock, **kwargs):
+    limiter = TokenBucketRateLimiter(**kwargs)
+    limiter._condition = clock
+    return limiter
+
+
+def test_unlimited_never_waits(clock):
+    limiter = _limiter(clock)
+    assert all(limiter.acquire(tokens=10_000) == 0 for _ in range(100))
+
+
+def test_requests_per_minute(clock):
+    limiter = _limiter(clock, requests_per_minute=2)
+    assert limiter.acquire() == 0
+    assert limiter.acquire() == 0
+    assert limiter.acquire() == pytest.approx(30)
+
+
+def test_tokens_per_minute(clock):
+    limiter = _limiter(clock, tokens_per_minute=600)
+    assert limiter.acquire(tokens=500) == 0
+    # 还差 100 个 token，按每秒 10 个补充
+    assert limiter.acquire(tokens=200) == pytest.approx(10)
+
+
+def test_oversized_request_is_capped(clock):
+    limiter = _limiter(clock, tokens_per_minute=100)
+    assert limiter.acquire(tokens=1000) == 0
+    assert limiter.acquire(tokens=1000) == pytest.approx(60)
+
+
+def test_refill_is_capped_at_one_minute(clock):
+    limiter = _limiter(clock, requests_per_minute=2)
+    limiter.acquire()
+    limiter.acquire()
+    clock.now += 600
+    assert limiter.acquire() == 0
+    assert limiter.acquire() == 0
+    assert limiter.acquire() > 0
+
+
+def test_estimate_text_tokens():
+    assert estimate_text_tokens("") == 0
+    assert estimate_text_tokens("你好世界") == 4
+    assert estimate_text_tokens("abcdefgh") == 2
+    assert estimate_text_tokens("你好 abc") == 3
+
+
+def test_estimate_message_tokens():
+    messages = [
+        {"role": "system", "content": "你好"},
+        {"role": "user", "content": [
+            {"type": "text", "text": "abcd"},
+            {"type": "image_url", "image_url": {"url": "http://example.com/a.png"}},
+        ]},
+    ]
+    assert estimate_message_tokens(messages) == 4 + 2 + 4 + 1 + IMAGE_TOKENS
@@ -0,0 +1,196 @@
+import threading
+
+import httpx2 as httpx
+import openai
+import pytest
+
+from backend.chatgpt_handlers import retry_policy
+from backend.chatgpt_handlers.retry_policy import CircuitBreaker, CircuitOpenError, RetryPolicy
+
+REQUEST = httpx.Request("POST", "http://127.0.0.1:9/v1/chat/completions")
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(retry_policy.time, "monotonic", clock)
+    return clock
+
+
+def _status_error(status_code, headers=None):
+    response = httpx.Response(status_code, request=REQUEST, headers=headers or {})
+    return openai.APIStatusError("error", response=response, body=None)
+
+
+def _half_open(breaker, clock):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    clock.now += breaker.cooldown
+
+
+def test_retryable_errors():
+    assert RetryPolicy.is_retryable(openai.APITimeoutError(request=REQUEST))
+    assert RetryPolicy.is_retryable(openai.APIConnectionError(request=REQUEST))
+    assert RetryPolicy.is_retryable(_status_error(429))
+    assert RetryPolicy.is_retryable(_status_error(503))
+    assert not RetryPolicy.is_retryable(_status_error(400))
+    assert not RetryPolicy.is_retryable(ValueError("bad"))
+
+
+def test_retry_after_headers():
+    assert RetryPolicy.retry_after(_status_error(429, {"retry-after-ms": "1500"})) == 1.5
+    assert RetryPolicy.retry_after(_status_error(429, {"Retry-After": "7"})) == 7.0
+    assert RetryPolicy.retry_after(_status_error(429, {"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})) == 0.0
+    assert RetryPolicy.retry_after(_status_error(429)) is None
+    assert RetryPolicy.retry_after(ValueError("no response")) is None
+
+
+def test_backoff_is_bounded():
+    policy = RetryPolicy(max_attempts=3, base_delay=2, max_delay=5)
+    for attempt in range(6):
+        assert 0 <= policy.backoff(attempt) <= min(5, 2 * 2 ** attempt)
+
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker(failure_threshold=3, cooldown=60, give_up_after=600)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.before_call()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_success_resets_failure_count(clock):
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=60, give_up_after=600)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+
+
+def test_half_open_probe_success_closes(clock):
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=60, give_up_after=600)
+    _half_open(breaker, clock)
+    breaker.before_call()
+    assert breaker.state == 'half_open'
+
+    # 试探请求返回之前，其他调用等待其结果
+    waiter_done = threading.Event()
+    waiter = threading.Thread(target=lambda: (breaker.before_call(), waiter_done.set()))
+    waiter.start()
+    assert not waiter_done.wait(0.1)
+    breaker.record_success()
+    waiter.join(timeout=2)
+    assert waiter_done.is_set()
+    assert breaker.state == 'closed'
+
+
+def test_half_open_probe_failure_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=5, cooldown=60, give_up_after=600)
+    _half_open(breaker, clock)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_requested_cooldown_opens_immediately(clock):
+    breaker = CircuitBreaker(failure_threshold=5, cooldown=60, give_up_after=600)
+    breaker.record_failure(cooldown=300)
+    clock.now += 100
+    with pytest.raises(CircuitOpenError) as excinfo:
+        breaker.before_call()
+    assert excinfo.value.remaining == pytest.approx(200)
+
+
+def test_lost_probe_is_released_after_timeout(clock):
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=60, give_up_after=600, probe_timeout=30)
+    _half_open(breaker, clock)
+    breaker.before_call()
+    clock.now += 30
+    # 持有试探名额的线程没有报告结果，超时后名额交给下一个调用，而不是无限等待
+    breaker.before_call()
+    assert breaker.state == 'half_open'
+
+
+def test_wait_until_ready(clock):
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=60, give_up_after=600)
+    assert breaker.wait_until_ready()
+    breaker.record_failure(cooldown=1000)
+    cancel = threading.Event()
+    cancel.set()
+    assert not breaker.wait_until_ready(cancel)
+    # 持续熔断超过 give_up_after 后不再等待
+    clock.now += 600
+    assert not breaker.wait_until_ready()
+    # 冷却结束后可以分发（由试探请求验证服务是否恢复）
+    clock.now += 400
+    assert breaker.wait_until_ready()
+
+
+def test_on_retry_error_does_not_leak_probe(clock, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("OPENAI_BASE_URL", "http://127.0.0.1:9/v1")
+    monkeypatch.setenv("OPENAI_MODEL", "test-model")
+    monkeypatch.setenv("ANALYSIS_CACHE_ENABLED", "false")
+    from backend.chatgpt_handlers.email_analyzer import EmailAnalyzer
+
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=60, give_up_after=600)
+    analyzer = EmailAnalyzer(retry_policy=RetryPolicy(max_attempts=1), circuit_breaker=breaker)
+
+    def failing_analyze(*args, **kwargs):
+        raise ValueError("local processing error")
+
+    def failing_on_retry():
+        raise RuntimeError("client went away")
+
+    monkeypatch.setattr(analyzer, "analyze_email", failing_analyze)
+    _half_open(breaker, clock)
+    with pytest.raises(RuntimeError):
+        analyzer.analyze_with_fallback([], "all_in_one", on_retry=failing_on_retry,
+                                       degrade_chain=[("full", True, None), ("text_only", False, None)])
+    # 试探名额已释放，下一个调用无需等待即可发送试探请求
+    breaker.before_call()
+    assert breaker.state == 'half_open'
+
+
+def test_cache_hit_bypasses_open_breaker(clock, monkeypatch, tmp_path):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("OPENAI_BASE_URL", "http://127.0.0.1:9/v1")
+    monkeypatch.setenv("OPENAI_MODEL", "test-model")
+    from backend.chatgpt_handlers.analysis_cache import AnalysisCache
+    from backend.chatgpt_handlers.email_analyzer import EmailAnalyzer
+
+    cache = AnalysisCache(cache_path=str(tmp_path / "cache.db"))
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=60, give_up_after=600)
+    analyzer = EmailAnalyzer(retry_policy=RetryPolicy(max_attempts=1), circuit_breaker=breaker, cache=cache)
+    chatgpt_messages = [{"role": "user", "content": [{"type": "text", "text": "邮件正文"}]}]
+    messages, system_prompt = analyzer.build_request_messages(chatgpt_messages, "all_in_one", True)
+    cache.put(AnalysisCache.make_key(messages, "test-model", system_prompt), "test-model", "缓存的结果")
+
+    def unexpected_call(*args, **kwargs):
+        raise AssertionError("缓存命中时不应调用API")
+
+    monkeypatch.setattr(analyzer, "analyze_email", unexpected_call)
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    deltas = []
+    assert analyzer.analyze_with_fallback(chatgpt_messages, "all_in_one", on_delta=deltas.append,
+                                          degrade_chain=[("full", True, None)]) == "缓存的结果"
+    assert deltas == ["缓存的结果"]
+    assert breaker.state == 'open'
+    cache.close()
@@ -0,0 +1,49 @@
+from concurrent.futures import Future
+
+import pytest
+
+from backend.update_emails import store_analysis_result
+from helpers import analysis_markdown, make_email
+
+
+def _done(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def _fail_inserts(data_manager):
+    # 模拟磁盘已满、数据库被锁等写入失败
+    data_manager.conn.execute(
+        "CREATE TRIGGER fail_insert BEFORE INSERT ON emails BEGIN SELECT RAISE(ABORT, 'disk full'); END"
+    )
+
+
+def test_save_email_data_returns_none_only_for_duplicates(data_manager):
+    email_data = make_email(1)
+    assert data_manager.save_email_data(email_data, analysis_markdown(), "INBOX") is not None
+    assert data_manager.save_email_data(email_data, analysis_markdown(), "INBOX") is None
+
+
+def test_save_email_data_raises_on_write_failure(data_manager):
+    _fail_inserts(data_manager)
+    with pytest.raises(Exception):
+        data_manager.save_email_data(make_email(1), analysis_markdown(), "INBOX")
+
+
+def test_store_failure_is_counted_as_failed(data_manager):
+    _fail_inserts(data_manager)
+    failed_uids, events = [], []
+    store_analysis_result(_done(analysis_markdown()), make_email(7), data_manager, "INBOX", failed_uids,
+                          lambda event_type, **data: events.append(event_type))
+    assert failed_uids == [7]
+    assert events == ['email_failed']
+
+
+def test_duplicate_is_skipped_not_failed(data_manager):
+    data_manager.save_email_data(make_email(7), analysis_markdown(), "INBOX")
+    failed_uids, events = [], []
+    store_analysis_result(_done(analysis_markdown()), make_email(7), data_manager, "INBOX", failed_uids,
+                          lambda event_type, **data: events.append(event_type))
+    assert failed_uids == []
+    assert events == ['email_skipped']